@@ -40,9 +40,11 @@ class CryptocurrencyAdmin(admin.ModelAdmin):
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    # Exibimos a chave mascarada e se o segredo está definido
-    list_display = ('user', 'preferred_fiat_currency', 'binance_api_key_masked', 'binance_api_secret_is_set')
-    search_fields = ('user__username', 'user__email')
+    # Exibimos a prévia mascarada e se o segredo está definido a partir das colunas não secretas
+    # preenchidas na gravação: a listagem não decifra nenhuma credencial.
+    list_display = ('user', 'preferred_fiat_currency', 'binance_api_key_masked', 'binance_api_key_fingerprint',
+                    'binance_api_secret_is_set', 'gemini_api_key_preview')
+    search_fields = ('user__username', 'user__email', 'binance_api_key_fingerprint')
     list_select_related = ('user',)
     # Importante: Excluir os campos brutos do formulário do admin
     exclude = ('_binance_api_key', '_binance_api_secret')
@@ -51,21 +53,12 @@ class UserProfileAdmin(admin.ModelAdmin):
     readonly_fields = ('user',) # O usuário não deve ser alterado aqui
 
     def binance_api_key_masked(self, obj):
-        # Acessa a propriedade que já descriptografa a chave
-        key = obj.binance_api_key
-        if key and key != "DECRYPTION_FAILED":
-            return f"{key[:4]}...{key[-4:]}"
-        elif key == "DECRYPTION_FAILED":
-            return "Erro ao ler a chave"
-        return "Não definida"
+        return obj.binance_api_key_preview or "Não definida"
     binance_api_key_masked.short_description = 'Chave API Binance (Mascarada)'
+    binance_api_key_masked.admin_order_field = 'binance_api_key_preview'
 
     def binance_api_secret_is_set(self, obj):
-        # Acessa a propriedade que descriptografa o segredo
-        secret = obj.binance_api_secret
-        if secret and secret != "DECRYPTION_FAILED":
-            return True
-        return False
+        return bool(obj.binance_api_secret_fingerprint)
     binance_api_secret_is_set.boolean = True # Exibe como um ícone de 'sim/não'
     binance_api_secret_is_set.short_description = 'Segredo API Definido?'
 
@@ -0,0 +1,94 @@
+# core/binance_clients.py
+"""
+Registro de clientes Binance por processo.
+
+Criar um `binance.client.Client` custa um ping e, em get_binance_client(), um get_server_time():
+duas idas à Binance e um handshake TLS a cada view ou execução de sinal. Aqui cada par
+(impressão digital da credencial, testnet) tem um cliente reutilizado, com a sessão HTTP em
+keep-alive; o desvio de relógio em relação ao servidor é compartilhado entre os clientes do mesmo
+ambiente e medido de novo só a cada BINANCE_TIME_OFFSET_REFRESH_SECONDS. Clientes ociosos saem.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+import requests
+from binance.exceptions import BinanceAPIException
+from django.conf import settings
+
+from .binance_governor import GovernedClient
+from .encryption import fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    client: GovernedClient
+    last_used: float
+
+
+class BinanceClientRegistry:
+    def __init__(self, idle_seconds=None, offset_refresh_seconds=None, max_clients=None):
+        # idle_seconds: tempo sem uso até o cliente (e sua sessão HTTP) ser descartado.
+        # offset_refresh_seconds: validade do desvio de relógio medido com get_server_time().
+        self.idle_seconds = idle_seconds if idle_seconds is not None else getattr(settings, 'BINANCE_CLIENT_IDLE_SECONDS', 600)
+        self.offset_refresh_seconds = offset_refresh_seconds if offset_refresh_seconds is not None else getattr(settings, 'BINANCE_TIME_OFFSET_REFRESH_SECONDS', 300)
+        self.max_clients = max_clients if max_clients is not None else getattr(settings, 'BINANCE_CLIENT_POOL_SIZE', 256)
+        self._clients, self._offsets = {}, {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(api_key, api_secret, testnet):
+        return fingerprint(f"{api_key or ''}:{api_secret or ''}"), bool(testnet)
+
+    def get(self, api_key, api_secret, testnet):
+        key, now = self.key(api_key, api_secret, testnet), time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._clients.get(key)
+            if entry is None:
+                # Sem ping no construtor: a primeira chamada real abre a conexão, que depois fica viva.
+                entry = self._clients[key] = _Entry(GovernedClient(api_key, api_secret, tld='com', testnet=testnet, ping=False), now)
+            entry.last_used = now
+        entry.client.timestamp_offset = self.time_offset(entry.client, testnet)
+        return entry.client
+
+    def time_offset(self, client, testnet):
+        """Desvio (ms) entre o relógio da Binance e o local, medido no máximo uma vez por período e por ambiente."""
+        cached = self._offsets.get(bool(testnet))
+        if cached is not None and time.monotonic() - cached[1] < self.offset_refresh_seconds:
+            return cached[0]
+        try:
+            server_time = client.get_server_time()
+        except (requests.exceptions.RequestException, BinanceAPIException) as e:
+            print(f"Aviso: Não foi possível sincronizar o tempo com a Binance. Erro: {e}")
+            return cached[0] if cached is not None else 0
+        offset = server_time['serverTime'] - int(time.time() * 1000)
+        self._offsets[bool(testnet)] = (offset, time.monotonic())
+        return offset
+
+    def _evict(self, now):
+        idle = [k for k, e in self._clients.items() if now - e.last_used > self.idle_seconds]
+        for k in idle:
+            entry = self._clients.pop(k)
+            try:
+                entry.client.close_connection()
+            except Exception as e:
+                logger.debug("Erro ao fechar a sessão de um cliente Binance ocioso: %s", e)
+        if len(self._clients) >= self.max_clients:
+            # Com o registro cheio, os menos usados saem sem close_connection(): outra thread (gunicorn --threads)
+            # pode tê-los recebido de get() há pouco e estar no meio de uma requisição. A sessão é fechada
+            # quando o último uso terminar e o cliente for coletado.
+            by_use = sorted(self._clients, key=lambda k: self._clients[k].last_used)
+            for k in by_use[:len(self._clients) - self.max_clients + 1]:
+                del self._clients[k]
+
+    def clear(self):
+        with self._lock:
+            self._evict(float('inf'))
+            self._offsets.clear()
+
+
+binance_clients = BinanceClientRegistry()
@@ -0,0 +1,160 @@
+# core/binance_governor.py
+"""
+Controle do peso de requisições e da taxa de ordens da Binance, compartilhado (via cache/Redis)
+entre o web e os workers do Celery.
+
+Toda requisição de um GovernedClient reserva antes o seu peso estimado na janela do minuto atual;
+depois, a contagem é corrigida pelos cabeçalhos X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-10S da
+resposta. Cada prioridade só pode usar uma fração do limite (BINANCE_WEIGHT_SHARE): sincronizações e
+listagens (LOW) esperam a próxima janela bem antes das ordens (HIGH) serem afetadas. Um 429/418
+suspende todas as chamadas até o Retry-After informado pela Binance.
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from binance.client import Client
+from binance.exceptions import BinanceRequestException
+from django.conf import settings
+from django.core.cache import cache
+
+from .encryption import fingerprint
+
+logger = logging.getLogger(__name__)
+
+LOW, NORMAL, HIGH = 'LOW', 'NORMAL', 'HIGH'
+
+WEIGHT_KEY = "binance-weight:{window}"
+ORDERS_KEY = "binance-orders:{account}:{window}"
+RETRY_AFTER_KEY = "binance-weight:retry-after"
+
+# Peso dos endpoints usados pelo projeto (/api/v3/...). (peso com symbol, peso sem symbol)
+ENDPOINT_WEIGHTS = {
+    'ping': (1, 1), 'time': (1, 1), 'exchangeInfo': (20, 20), 'klines': (2, 2),
+    'ticker/24hr': (2, 80), 'ticker/price': (2, 4), 'account': (20, 20), 'myTrades': (20, 20),
+    'openOrders': (6, 80), 'allOrders': (20, 20), 'order': (4, 4),
+}
+ORDER_ENDPOINTS = ('order', 'order/oco', 'orderList/oco')
+
+_priority = contextvars.ContextVar('binance_priority', default=NORMAL)
+
+
+@contextmanager
+def binance_priority(priority):
+    """Define a prioridade das chamadas à Binance feitas dentro do bloco (LOW, NORMAL ou HIGH)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class BinanceRateLimited(BinanceRequestException):
+    """O orçamento de peso/ordens da Binance não liberou a requisição dentro da espera máxima."""
+
+
+def estimate_weight(method, url, params=None):
+    endpoint = urlparse(url).path.split('/api/v3/', 1)[-1]
+    if method.upper() in ('POST', 'DELETE') and endpoint in ORDER_ENDPOINTS:
+        return 1, True
+    with_symbol, without_symbol = ENDPOINT_WEIGHTS.get(endpoint, (2, 2))
+    # O python-binance passa os parâmetros de GET já como query string.
+    keys = parse_qs(params, keep_blank_values=True) if isinstance(params, str) else dict(params or {})
+    has_symbol = 'symbol' in keys
+    return (with_symbol if has_symbol else without_symbol), False
+
+
+class BinanceWeightGovernor:
+    def __init__(self, weight_limit=None, order_limit=None, shares=None, max_wait=None):
+        # weight_limit: peso por minuto (por IP) da Binance; order_limit: ordens por 10s (por conta).
+        # shares: fração do limite que cada prioridade pode usar; max_wait: espera máxima (s) antes de desistir.
+        self.weight_limit = weight_limit if weight_limit is not None else getattr(settings, 'BINANCE_WEIGHT_LIMIT_PER_MINUTE', 6000)
+        self.order_limit = order_limit if order_limit is not None else getattr(settings, 'BINANCE_ORDER_LIMIT_PER_10S', 100)
+        self.shares = shares if shares is not None else getattr(settings, 'BINANCE_WEIGHT_SHARE', {LOW: 0.5, NORMAL: 0.8, HIGH: 0.95})
+        self.max_wait = max_wait if max_wait is not None else getattr(settings, 'BINANCE_GOVERNOR_MAX_WAIT', {LOW: 60, NORMAL: 15, HIGH: 5})
+
+    @staticmethod
+    def _reserve(key, amount, cap, timeout):
+        """Soma `amount` ao contador `key` se couber em `cap`; senão desfaz e devolve False."""
+        cache.add(key, 0, timeout=timeout)
+        try:
+            total = cache.incr(key, amount)
+        except ValueError:  # a chave expirou entre o add e o incr
+            cache.add(key, amount, timeout=timeout)
+            total = amount
+        if total > cap and total > amount:
+            cache.decr(key, amount)
+            return False
+        return True
+
+    def acquire(self, weight, priority=NORMAL, account=None, is_order=False):
+        """Bloqueia até haver orçamento para a requisição; levanta BinanceRateLimited se a espera passar do máximo."""
+        deadline = time.monotonic() + self.max_wait.get(priority, 15)
+        while True:
+            now = time.time()
+            wait = (cache.get(RETRY_AFTER_KEY) or 0) - now
+            if wait <= 0:
+                minute = int(now // 60)
+                if self._reserve(WEIGHT_KEY.format(window=minute), weight, int(self.weight_limit * self.shares.get(priority, 0.8)), 90):
+                    if not is_order:
+                        return
+                    window = int(now // 10)
+                    if self._reserve(ORDERS_KEY.format(account=account, window=window), 1, int(self.order_limit * 0.9), 20):
+                        return
+                    cache.decr(WEIGHT_KEY.format(window=minute), weight)
+                    wait = (window + 1) * 10 - now
+                else:
+                    wait = (minute + 1) * 60 - now
+            wait += random.uniform(0, 0.25)  # espalha os processos que acordam na virada da janela
+            if time.monotonic() + wait > deadline:
+                raise BinanceRateLimited(f"Limite de requisições da Binance atingido; tente novamente em {int(wait) + 1}s.")
+            logger.info("Orçamento da Binance esgotado para prioridade %s; aguardando %.1fs.", priority, wait)
+            time.sleep(wait)
+
+    def observe(self, response, account=None):
+        """Alinha os contadores com o uso informado pela Binance e respeita o Retry-After de um 429/418."""
+        headers, now = response.headers, time.time()
+        used = headers.get('X-MBX-USED-WEIGHT-1M')
+        if used is not None:
+            self._raise_to(WEIGHT_KEY.format(window=int(now // 60)), int(used), 90)
+        orders = headers.get('X-MBX-ORDER-COUNT-10S')
+        if orders is not None and account:
+            self._raise_to(ORDERS_KEY.format(account=account, window=int(now // 10)), int(orders), 20)
+        if response.status_code in (418, 429):
+            retry_after = int(headers.get('Retry-After') or 60)
+            cache.set(RETRY_AFTER_KEY, now + retry_after, timeout=retry_after + 1)
+            logger.warning("Binance respondeu %s; chamadas suspensas por %ss.", response.status_code, retry_after)
+
+    @staticmethod
+    def _raise_to(key, value, timeout):
+        # O contador local só sobe: a Binance pode ter visto chamadas de outros processos/IPs.
+        cache.add(key, 0, timeout=timeout)
+        current = cache.get(key) or 0
+        if value > current:
+            cache.incr(key, value - current)
+
+
+binance_governor = BinanceWeightGovernor()
+
+
+class GovernedSession(requests.Session):
+    def request(self, method, url, *args, **kwargs):
+        weight, is_order = estimate_weight(method, url, kwargs.get('params'))
+        priority = HIGH if is_order else _priority.get()
+        account = fingerprint(self.headers.get('X-MBX-APIKEY') or '')
+        binance_governor.acquire(weight, priority, account=account, is_order=is_order)
+        response = super().request(method, url, *args, **kwargs)
+        binance_governor.observe(response, account=account)
+        return response
+
+
+class GovernedClient(Client):
+    """binance.client.Client cujas requisições passam pelo binance_governor."""
+    def _init_session(self):
+        session = GovernedSession()
+        session.headers.update(self._get_headers())
+        return session
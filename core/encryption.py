@@ -1,20 +1,20 @@
 # core/encryption.py
 import base64
+import hashlib
+import threading
+import time
+from functools import lru_cache
+
 from django.conf import settings
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
-# Helper para garantir que a chave tenha o tamanho certo para Fernet
-def _get_key_from_settings():
-    """
-    Derives a valid Fernet key from the DJANGO_FIELD_ENCRYPTION_KEY in settings.
-    This ensures the key is 32 bytes long and URL-safe base64 encoded.
-    """
-    config_key = settings.FIELD_ENCRYPTION_KEY
-    if not config_key:
-        raise ValueError("DJANGO_FIELD_ENCRYPTION_KEY is not set in your environment variables.")
-        
+DECRYPTION_FAILED = "DECRYPTION_FAILED"
+
+# O PBKDF2 (480.000 iterações) custa centenas de ms: cada senha é derivada uma única vez por processo.
+@lru_cache(maxsize=None)
+def _derive_fernet_key(config_key: str) -> bytes:
     # Usar um KDF (Key Derivation Function) é uma boa prática para gerar a chave.
     # Usamos a própria chave como "senha" e um "salt" fixo (poderia vir do settings também).
     salt = b'some-fixed-salt-for-crypto' # Isso deve ser consistente
@@ -24,8 +24,74 @@ def _get_key_from_settings():
         salt=salt,
         iterations=480000, # Número de iterações recomendado
     )
-    key = base64.urlsafe_b64encode(kdf.derive(config_key.encode()))
-    return key
+    return base64.urlsafe_b64encode(kdf.derive(config_key.encode()))
+
+# Helper para garantir que a chave tenha o tamanho certo para Fernet
+def _get_key_from_settings():
+    """
+    Derives a valid Fernet key from the DJANGO_FIELD_ENCRYPTION_KEY in settings.
+    This ensures the key is 32 bytes long and URL-safe base64 encoded.
+    """
+    config_key = settings.FIELD_ENCRYPTION_KEY
+    if not config_key:
+        raise ValueError("DJANGO_FIELD_ENCRYPTION_KEY is not set in your environment variables.")
+    return _derive_fernet_key(config_key)
+
+@lru_cache(maxsize=8)
+def _multi_fernet(config_keys: tuple) -> MultiFernet:
+    return MultiFernet([Fernet(_derive_fernet_key(k)) for k in config_keys])
+
+def get_fernet() -> MultiFernet:
+    """
+    MultiFernet com a chave atual primeiro (usada para cifrar) e as antigas de
+    FIELD_ENCRYPTION_OLD_KEYS depois (aceitas só para decifrar, durante uma rotação).
+    """
+    _get_key_from_settings()
+    old_keys = tuple(k for k in getattr(settings, 'FIELD_ENCRYPTION_OLD_KEYS', ()) if k)
+    return _multi_fernet((settings.FIELD_ENCRYPTION_KEY,) + old_keys)
+
+
+def fingerprint(value: str) -> str:
+    """Identificador não secreto de uma credencial (prefixo do SHA-256), para comparar sem decifrar."""
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:16] if value else ""
+
+def mask(value: str) -> str:
+    """Prévia mascarada de uma credencial, como 'abcd...wxyz'."""
+    if not value:
+        return ""
+    return f"{value[:4]}...{value[-4:]}" if len(value) > 12 else "****"
+
+
+class SecretCache:
+    """Cache em memória, com TTL curto, de segredos já decifrados, separado por perfil (escopo)."""
+    MAX_ENTRIES = 1000
+
+    def __init__(self):
+        self._entries, self._lock = {}, threading.Lock()
+
+    @staticmethod
+    def ttl():
+        return getattr(settings, 'FIELD_ENCRYPTION_SECRET_CACHE_SECONDS', 60)
+
+    def get(self, scope, token):
+        entry = self._entries.get((scope, token))
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def set(self, scope, token, value):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.MAX_ENTRIES:
+                self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+            self._entries[(scope, token)] = (value, now + self.ttl())
+
+    def clear(self, scope=None):
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if scope is not None and k[0] != scope}
+
+secret_cache = SecretCache()
+
 
 def encrypt(data_str: str) -> str:
     """
@@ -34,9 +100,7 @@ def encrypt(data_str: str) -> str:
     if not data_str:
         return ""
     try:
-        key = _get_key_from_settings()
-        f = Fernet(key)
-        encrypted_data = f.encrypt(data_str.encode('utf-8'))
+        encrypted_data = get_fernet().encrypt(data_str.encode('utf-8'))
         return encrypted_data.decode('utf-8')
     except Exception as e:
         # Log the error in a real application
@@ -44,19 +108,34 @@ def encrypt(data_str: str) -> str:
         # Retornar uma string que indica falha ou levantar uma exceção
         raise ValueError("Failed to encrypt data.") from e
 
-def decrypt(encrypted_token_str: str) -> str:
+def decrypt(encrypted_token_str: str, scope=None) -> str:
     """
     Decrypts a token string and returns the original string.
+    Com `scope` (ex: o id do perfil), o resultado fica no SecretCache por alguns segundos.
     """
     if not encrypted_token_str:
         return ""
+    use_cache = scope is not None and SecretCache.ttl() > 0
+    if use_cache:
+        cached = secret_cache.get(scope, encrypted_token_str)
+        if cached is not None:
+            return cached
     try:
-        key = _get_key_from_settings()
-        f = Fernet(key)
-        decrypted_data = f.decrypt(encrypted_token_str.encode('utf-8'))
-        return decrypted_data.decode('utf-8')
+        decrypted_data = get_fernet().decrypt(encrypted_token_str.encode('utf-8')).decode('utf-8')
     except Exception as e:
         # Log the error in a real application
         print(f"Decryption failed. This can happen if the key changed or the data is corrupt. Error: {e}")
         # Pode ser útil retornar um valor específico para indicar falha na descriptografia
-        return "DECRYPTION_FAILED"
+        return DECRYPTION_FAILED
+    if use_cache:
+        secret_cache.set(scope, encrypted_token_str, decrypted_data)
+    return decrypted_data
+
+def rotate(encrypted_token_str: str) -> str:
+    """
+    Recifra um token com a chave atual (aceitando qualquer uma das chaves configuradas).
+    Levanta InvalidToken se nenhuma chave decifrar o valor.
+    """
+    if not encrypted_token_str:
+        return ""
+    return get_fernet().rotate(encrypted_token_str.encode('utf-8')).decode('utf-8')
@@ -0,0 +1,73 @@
+# core/gemini.py
+"""
+Cliente HTTP compartilhado da API Gemini.
+
+Uma única requests.Session por processo, com pool de conexões do tamanho da concorrência dos
+workers (GEMINI_HTTP_POOL_SIZE): as chamadas reaproveitam a conexão TLS com
+generativelanguage.googleapis.com em vez de refazer DNS/TCP/TLS a cada requests.post. Respostas
+429/5xx são repetidas com backoff exponencial e jitter (respeitando o Retry-After), e os timeouts de
+conexão e de leitura são separados. A chave vai no cabeçalho x-goog-api-key, fora da URL (e,
+portanto, fora das mensagens de erro e dos logs).
+"""
+import json
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def get_gemini_api_url(model_name: str):
+    """Constrói a URL da API para o modelo Gemini especificado."""
+    return GEMINI_API_URL.format(model_name=model_name)
+
+
+class GeminiClient:
+    def __init__(self, pool_size=None, retries=None, backoff=None, connect_timeout=None):
+        # pool_size: conexões mantidas vivas (uma por thread/worker simultâneo).
+        # retries/backoff: tentativas extras em 429/5xx e fator do backoff exponencial (s).
+        self.pool_size = pool_size if pool_size is not None else getattr(settings, 'GEMINI_HTTP_POOL_SIZE', 16)
+        self.retries = retries if retries is not None else getattr(settings, 'GEMINI_HTTP_RETRIES', 3)
+        self.backoff = backoff if backoff is not None else getattr(settings, 'GEMINI_HTTP_BACKOFF', 1.0)
+        self.connect_timeout = connect_timeout if connect_timeout is not None else getattr(settings, 'GEMINI_CONNECT_TIMEOUT', 5)
+        self._session, self._lock = None, threading.Lock()
+
+    @property
+    def session(self):
+        # Criada no primeiro uso: depois do fork dos workers, nunca compartilhada entre processos.
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    # read=0: um POST que estourou o timeout de leitura pode já ter sido processado, e repeti-lo
+                    # seguraria a thread por (tentativas + 1) x timeout, além do prazo do ciclo de decisão.
+                    retry = Retry(
+                        total=self.retries, read=0, backoff_factor=self.backoff, backoff_jitter=self.backoff,
+                        status_forcelist=RETRY_STATUSES, allowed_methods=frozenset({'POST'}),
+                        respect_retry_after_header=True, raise_on_status=False,
+                    )
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+                    session = requests.Session()
+                    session.mount('https://', adapter)
+                    session.headers.update({'Content-Type': 'application/json'})
+                    self._session = session
+        return self._session
+
+    def generate(self, model_name, api_key, payload, read_timeout=45):
+        """POST generateContent e devolve o texto do primeiro candidato. Levanta requests.HTTPError em respostas de erro."""
+        response = self.session.post(
+            get_gemini_api_url(model_name), headers={'x-goog-api-key': api_key}, json=payload,
+            timeout=(self.connect_timeout, read_timeout),
+        )
+        response.raise_for_status()
+        return response.json()['candidates'][0]['content']['parts'][0]['text']
+
+    def generate_json(self, model_name, api_key, payload, read_timeout=45):
+        """Como generate(), para payloads com responseMimeType application/json: devolve o objeto decodificado."""
+        return json.loads(self.generate(model_name, api_key, payload, read_timeout))
+
+
+gemini_client = GeminiClient()
@@ -0,0 +1,128 @@
+# core/klines.py
+"""
+Armazenamento local de candles (OHLCV) com busca incremental na Binance.
+
+`KlineStore.fetch()` só baixa o que falta (barras mais novas que a última armazenada, o
+período anterior à primeira e eventuais buracos) e devolve o histórico a partir do banco.
+Intervalos já pedidos que a Binance não tem (antes da listagem do par, buracos reais da corretora)
+ficam marcados no cache e não são pedidos de novo.
+"""
+import logging
+from decimal import Decimal
+
+from binance.helpers import date_to_milliseconds, interval_to_milliseconds
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Min
+
+from .binance_governor import GovernedClient, LOW, binance_priority
+from .models import Kline
+
+logger = logging.getLogger(__name__)
+
+# Colunas das linhas devolvidas por KlineStore.fetch() (mesma ordem das 7 primeiras da API da Binance).
+KLINE_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume', 'close_time']
+
+# Por (par, intervalo): 'head_from' = início mais antigo já pedido antes do primeiro candle; 'gaps' = buracos
+# já pedidos; 'missing' = candles que continuam faltando dentro deles (não adianta procurar de novo).
+CHECKED_RANGES_KEY = "klines:checked:{symbol}:{interval}"
+
+
+class KlineStore:
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        # Candles são dados públicos: um cliente sem chaves basta.
+        if self._client is None:
+            self._client = GovernedClient(ping=False)
+        return self._client
+
+    def fetch(self, api_symbol, interval, start):
+        """
+        Sincroniza e devolve os candles de `api_symbol` desde `start` (ms ou texto como "1 year ago UTC"),
+        no formato [open_time, open, high, low, close, volume, close_time], com os preços em texto.
+        """
+        start_ms = start if isinstance(start, int) else date_to_milliseconds(start)
+        self.sync(api_symbol, interval, start_ms)
+        return self.stored(api_symbol, interval, start_ms)
+
+    @staticmethod
+    def stored(api_symbol, interval, start, end_ms=None):
+        """Como fetch(), mas só lê o banco (sem chamar a Binance). `end_ms` limita o open_time do último candle."""
+        start_ms = start if isinstance(start, int) else date_to_milliseconds(start)
+        rows = Kline.objects.filter(symbol=api_symbol, interval=interval, open_time__gte=start_ms)
+        if end_ms is not None:
+            rows = rows.filter(open_time__lte=end_ms)
+        rows = rows.order_by('open_time')
+        return [
+            [open_time, str(o), str(h), str(l), str(c), str(v), close_time]
+            for open_time, o, h, l, c, v, close_time in rows.values_list('open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time')
+        ]
+
+    def sync(self, api_symbol, interval, start_ms):
+        """Baixa apenas os intervalos que ainda não estão no banco. Retorna o número de candles gravados."""
+        step = interval_to_milliseconds(interval)
+        stored = Kline.objects.filter(symbol=api_symbol, interval=interval)
+        bounds = stored.aggregate(first=Min('open_time'), last=Max('open_time'), count=Count('id'))
+        checked_key = CHECKED_RANGES_KEY.format(symbol=api_symbol, interval=interval)
+        checked = cache.get(checked_key) or {'head_from': None, 'gaps': [], 'missing': 0}
+
+        ranges, checked_changed = [], False
+        if bounds['first'] is None:
+            ranges.append((start_ms, None))
+        else:
+            if step and start_ms <= bounds['first'] - step and (checked['head_from'] is None or start_ms < checked['head_from']):
+                ranges.append((start_ms, bounds['first'] - 1))
+                checked['head_from'], checked_changed = start_ms, True
+            # O último candle pode ter sido gravado ainda aberto: busca-se de novo a partir dele.
+            ranges.append((bounds['last'], None))
+            if step and bounds['count'] + checked['missing'] < (bounds['last'] - bounds['first']) // step + 1:
+                gaps = [gap for gap in self._find_gaps(stored, step)
+                        if not any(a <= gap[0] and gap[1] <= b for a, b in checked['gaps'])]
+                ranges.extend(gaps)
+                checked['gaps'].extend(gaps)
+                checked_changed = True
+
+        saved = 0
+        for range_start, range_end in ranges:
+            # Histórico para backtests: cede o orçamento de peso da Binance às ordens e às telas.
+            with binance_priority(LOW):
+                klines = self.client.get_historical_klines(api_symbol, interval, range_start, range_end)
+            saved += self._save(api_symbol, interval, klines)
+
+        if checked_changed:
+            # O que ainda falta depois de pedir todos os buracos não existe na Binance.
+            bounds = stored.aggregate(first=Min('open_time'), last=Max('open_time'), count=Count('id'))
+            if step and bounds['first'] is not None:
+                checked['missing'] = (bounds['last'] - bounds['first']) // step + 1 - bounds['count']
+            cache.set(checked_key, checked, timeout=getattr(settings, 'KLINE_CHECKED_RANGES_TTL', 30 * 24 * 3600))
+        return saved
+
+    @staticmethod
+    def _find_gaps(stored, step):
+        gaps, previous = [], None
+        for open_time in stored.order_by('open_time').values_list('open_time', flat=True).iterator():
+            if previous is not None and open_time - previous > step:
+                gaps.append((previous + step, open_time - 1))
+            previous = open_time
+        if gaps:
+            logger.info("%d buraco(s) no histórico local serão preenchidos.", len(gaps))
+        return gaps
+
+    @staticmethod
+    def _save(api_symbol, interval, klines):
+        if not klines:
+            return 0
+        objs = [
+            Kline(symbol=api_symbol, interval=interval, open_time=k[0], open=Decimal(k[1]), high=Decimal(k[2]),
+                  low=Decimal(k[3]), close=Decimal(k[4]), volume=Decimal(k[5]), close_time=k[6])
+            for k in klines
+        ]
+        Kline.objects.bulk_create(
+            objs, update_conflicts=True, unique_fields=['symbol', 'interval', 'open_time'],
+            update_fields=['open', 'high', 'low', 'close', 'volume', 'close_time'],
+        )
+        logger.debug("%s %s: %d candles gravados.", api_symbol, interval, len(objs))
+        return len(objs)
@@ -0,0 +1,43 @@
+# core/management/commands/reencrypt_secrets.py
+from cryptography.fernet import InvalidToken
+from django.core.management.base import BaseCommand
+
+from core.encryption import get_fernet, secret_cache
+from core.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = ('Recifra as credenciais de todos os perfis com a chave atual (DJANGO_FIELD_ENCRYPTION_KEY) e atualiza '
+            'as prévias/impressões digitais usadas pelo admin. As chaves antigas devem estar em '
+            'DJANGO_FIELD_ENCRYPTION_OLD_KEYS durante a execução.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Só verifica se todas as credenciais podem ser decifradas, sem gravar')
+
+    def handle(self, *args, **options):
+        fernet, updated, failed = get_fernet(), [], []
+        for profile in UserProfile.objects.only('id', *UserProfile.ENCRYPTED_FIELDS).iterator():
+            try:
+                plaintexts = {
+                    name: fernet.decrypt(token.encode('utf-8')).decode('utf-8') if (token := getattr(profile, f'_{name}')) else ""
+                    for name in UserProfile.SECRET_PROPERTIES
+                }
+            except InvalidToken:
+                failed.append(profile.id)
+                continue
+            # Os setters cifram com a chave atual e preenchem as prévias.
+            for name, value in plaintexts.items():
+                setattr(profile, name, value)
+            updated.append(profile)
+
+        if not options['dry_run'] and updated:
+            # bulk_update não chama save(): o cache de segredos é limpo de uma vez no final.
+            UserProfile.objects.bulk_update(updated, UserProfile.ENCRYPTED_FIELDS + UserProfile.SECRET_METADATA_FIELDS, batch_size=500)
+            secret_cache.clear()
+
+        action = "verificados" if options['dry_run'] else "recifrados"
+        self.stdout.write(self.style.SUCCESS(f"{len(updated)} perfis {action} com a chave atual."))
+        if failed:
+            self.stdout.write(self.style.ERROR(
+                f"{len(failed)} perfis não puderam ser decifrados com nenhuma chave configurada (ids: {', '.join(map(str, failed))})."
+            ))
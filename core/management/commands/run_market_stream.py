@@ -0,0 +1,28 @@
+# core/management/commands/run_market_stream.py
+from django.core.management.base import BaseCommand
+
+from core.market_stream import BINANCE_MINI_TICKER_URL, MarketDataIngestor, ReplayTransport, WebSocketTransport
+
+
+class Command(BaseCommand):
+    help = 'Processo contínuo que consome o stream de mini-tickers da Binance e mantém os preços no cache (Redis).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', type=str, default=BINANCE_MINI_TICKER_URL, help='Endpoint WebSocket (ex: um servidor de replay local)')
+        parser.add_argument('--replay', type=str, help='Arquivo com mensagens gravadas (uma por linha) em vez de uma conexão WebSocket')
+        parser.add_argument('--flush-interval', type=float, default=5.0, help='Segundos entre as gravações em lote de current_price no banco')
+
+    def handle(self, *args, **options):
+        if options['replay']:
+            with open(options['replay'], encoding='utf-8') as f:
+                transport = ReplayTransport([line for line in f.read().splitlines() if line.strip()])
+        else:
+            transport = WebSocketTransport(options['url'])
+
+        ingestor = MarketDataIngestor(transport, flush_interval=options['flush_interval'])
+        self.stdout.write(f"Monitorando {len(ingestor.tracked_pairs)} pares ({options['replay'] or options['url']}).")
+        try:
+            processed = ingestor.run()
+        except KeyboardInterrupt:
+            processed = None
+        self.stdout.write(self.style.SUCCESS(f"Stream encerrado. Mensagens processadas: {processed if processed is not None else '-'}"))
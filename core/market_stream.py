@@ -0,0 +1,135 @@
+# core/market_stream.py
+"""
+Ingestão contínua de preços via WebSocket (stream de mini-tickers de todo o mercado da Binance).
+
+O último preço e a variação de 24h de cada criptomoeda monitorada ficam no cache (Redis),
+e o `current_price` do banco é atualizado em lotes periódicos, coalescendo as mensagens.
+"""
+import json
+import logging
+import random
+import time
+from decimal import Decimal, InvalidOperation
+
+from .models import Cryptocurrency
+from .price_cache import PriceCache, bulk_update_prices
+
+logger = logging.getLogger(__name__)
+
+BINANCE_MINI_TICKER_URL = "wss://stream.binance.com:9443/ws/!miniTicker@arr"
+
+
+class WebSocketTransport:
+    """
+    Transporte padrão: conecta a um endpoint WebSocket (Binance ou um servidor de replay local).
+    `messages()` devolve None quando não chega nada dentro de `timeout`, para o ingestor poder descarregar.
+    Falhas de conexão ou de handshake (429/451/5xx) reconectam com backoff exponencial até `max_reconnect_delay`.
+    """
+    def __init__(self, url=BINANCE_MINI_TICKER_URL, reconnect_delay=1, max_reconnect_delay=60):
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+    def _connect(self):
+        from websockets.sync.client import connect
+        return connect(self.url, open_timeout=10)
+
+    def messages(self, timeout):
+        from websockets.exceptions import WebSocketException
+
+        failures = 0
+        while True:
+            try:
+                with self._connect() as ws:
+                    logger.info("Conectado ao stream %s", self.url)
+                    failures = 0
+                    while True:
+                        try:
+                            yield ws.recv(timeout=timeout)
+                        except TimeoutError:
+                            yield None
+            except (WebSocketException, OSError) as e:
+                delay = min(self.max_reconnect_delay, self.reconnect_delay * 2 ** failures)
+                delay += random.uniform(0, delay / 2)  # evita reconexões sincronizadas após uma queda geral
+                failures += 1
+                logger.warning("Conexão com %s perdida (%s). Reconectando em %.1fs.", self.url, e, delay)
+                time.sleep(delay)
+
+
+class ReplayTransport:
+    """Reproduz mensagens já gravadas (ex: um arquivo com uma mensagem JSON por linha). Usado em testes."""
+    def __init__(self, raw_messages):
+        self.raw_messages = raw_messages
+
+    def messages(self, timeout):
+        for raw in self.raw_messages:
+            yield raw
+
+
+class MarketDataIngestor:
+    def __init__(self, transport, flush_interval=5.0):
+        self.transport = transport
+        self.flush_interval = flush_interval
+        self.tracked_pairs = {}
+        self.pending_prices = {}
+        self.price_cache = PriceCache()
+        self._last_flush = time.monotonic()
+        self.refresh_tracked_pairs()
+
+    def refresh_tracked_pairs(self):
+        self.tracked_pairs = {
+            f"{symbol.upper()}{currency.upper()}": symbol
+            for symbol, currency in Cryptocurrency.objects.values_list('symbol', 'price_currency')
+        }
+
+    def handle_message(self, raw):
+        """Processa uma mensagem do stream (lista de mini-tickers) e grava os pares monitorados no cache."""
+        try:
+            tickers = json.loads(raw)
+        except (TypeError, ValueError):
+            logger.warning("Mensagem inválida ignorada: %r", raw)
+            return 0
+        if isinstance(tickers, dict):
+            tickers = [tickers]
+
+        quotes = {}
+        for ticker in tickers:
+            pair = ticker.get('s')
+            symbol = self.tracked_pairs.get(pair)
+            if not symbol:
+                continue
+            try:
+                close_price, open_price = Decimal(ticker['c']), Decimal(ticker['o'])
+            except (KeyError, InvalidOperation):
+                continue
+            change_percent = ((close_price - open_price) / open_price) * 100 if open_price > 0 else None
+            quotes[symbol] = (close_price, change_percent)
+            self.pending_prices[pair] = close_price
+        return self.price_cache.set_many(quotes)
+
+    def flush(self):
+        """Grava no banco, num único bulk_update, o último preço recebido de cada par desde o último flush."""
+        self._last_flush = time.monotonic()
+        if not self.pending_prices:
+            return 0
+        pending, self.pending_prices = self.pending_prices, {}
+        symbols = [self.tracked_pairs[pair] for pair in pending if pair in self.tracked_pairs]
+        updated_count, _ = bulk_update_prices(Cryptocurrency.objects.filter(symbol__in=symbols), pending)
+        self.refresh_tracked_pairs()
+        return updated_count
+
+    def run(self, max_messages=None):
+        processed = 0
+        try:
+            for raw in self.transport.messages(timeout=self.flush_interval):
+                if raw is not None:
+                    self.handle_message(raw)
+                    processed += 1
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    updated_count = self.flush()
+                    logger.debug("Flush do stream: %d preços gravados.", updated_count)
+                if max_messages is not None and processed >= max_messages:
+                    break
+        finally:
+            self.flush()
+        return processed
@@ -4,7 +4,7 @@ from django.contrib.auth.models import User
 from django.conf import settings
 from decimal import Decimal, ROUND_DOWN
 from django.utils import timezone
-from .encryption import encrypt, decrypt
+from .encryption import encrypt, decrypt, fingerprint, mask, secret_cache
 
 FIAT_CURRENCY_CHOICES = [
     ('USD', 'Dólar Americano'), ('BRL', 'Real Brasileiro'),
@@ -44,6 +44,13 @@ class UserProfile(models.Model):
     # (NOVO) Campo para a chave da API Gemini
     _gemini_api_key = models.TextField(blank=True, verbose_name="Chave API Gemini Criptografada")
 
+    # Prévias e impressões digitais não secretas, preenchidas pelos setters: listagens não precisam decifrar nada.
+    binance_api_key_preview = models.CharField(max_length=20, blank=True, editable=False, verbose_name="Chave API Binance (Mascarada)")
+    binance_api_key_fingerprint = models.CharField(max_length=16, blank=True, editable=False)
+    binance_api_secret_fingerprint = models.CharField(max_length=16, blank=True, editable=False)
+    gemini_api_key_preview = models.CharField(max_length=20, blank=True, editable=False, verbose_name="Chave API Gemini (Mascarada)")
+    gemini_api_key_fingerprint = models.CharField(max_length=16, blank=True, editable=False)
+
     preferred_fiat_currency = models.CharField(max_length=5, choices=FIAT_CURRENCY_CHOICES, default='BRL')
     use_testnet = models.BooleanField(default=True)
     
@@ -65,25 +72,40 @@ class UserProfile(models.Model):
         help_text="Instruções personalizadas para o prompt do agente de IA, aplicadas a partir do Gestor de Estratégia."
     )
 
+    # Os segredos decifrados ficam alguns segundos no SecretCache do processo, por perfil (ver core.encryption).
     @property
-    def binance_api_key(self): return decrypt(self._binance_api_key)
+    def binance_api_key(self): return decrypt(self._binance_api_key, scope=self.pk)
     @binance_api_key.setter
-    def binance_api_key(self, value: str): self._binance_api_key = encrypt(value)
+    def binance_api_key(self, value: str):
+        self._binance_api_key = encrypt(value)
+        self.binance_api_key_preview, self.binance_api_key_fingerprint = mask(value), fingerprint(value)
 
     @property
-    def binance_api_secret(self): return decrypt(self._binance_api_secret)
+    def binance_api_secret(self): return decrypt(self._binance_api_secret, scope=self.pk)
     @binance_api_secret.setter
-    def binance_api_secret(self, value: str): self._binance_api_secret = encrypt(value)
+    def binance_api_secret(self, value: str):
+        self._binance_api_secret = encrypt(value)
+        self.binance_api_secret_fingerprint = fingerprint(value)
 
     # (NOVO) Property para a chave da API Gemini
     @property
-    def gemini_api_key(self): return decrypt(self._gemini_api_key)
+    def gemini_api_key(self): return decrypt(self._gemini_api_key, scope=self.pk)
     @gemini_api_key.setter
-    def gemini_api_key(self, value: str): self._gemini_api_key = encrypt(value)
+    def gemini_api_key(self, value: str):
+        self._gemini_api_key = encrypt(value)
+        self.gemini_api_key_preview, self.gemini_api_key_fingerprint = mask(value), fingerprint(value)
+
+    SECRET_PROPERTIES = ('binance_api_key', 'binance_api_secret', 'gemini_api_key')
+    ENCRYPTED_FIELDS = ('_binance_api_key', '_binance_api_secret', '_gemini_api_key')
+    SECRET_METADATA_FIELDS = ('binance_api_key_preview', 'binance_api_key_fingerprint', 'binance_api_secret_fingerprint',
+                              'gemini_api_key_preview', 'gemini_api_key_fingerprint')
 
     class Meta:
         verbose_name, verbose_name_plural = "Perfil de Usuário", "Perfis de Usuários"
     def __str__(self): return f"Perfil de {self.user.username}"
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        secret_cache.clear(self.pk)
 
 class Holding(models.Model):
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='holdings')
@@ -139,3 +161,21 @@ class PortfolioSnapshot(models.Model):
     class Meta:
         unique_together = ('user_profile', 'date')
         ordering = ['-date']
+
+class Kline(models.Model):
+    """Candle OHLCV da Binance armazenado localmente, para não baixar o mesmo histórico a cada uso."""
+    symbol = models.CharField(max_length=20, help_text="Par da API (ex: BTCUSDT)")
+    interval = models.CharField(max_length=5, help_text="Intervalo do candle (ex: 1h, 1d)")
+    open_time = models.BigIntegerField(help_text="Abertura do candle em ms (epoch UTC)")
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    volume = models.DecimalField(max_digits=28, decimal_places=8)
+    close_time = models.BigIntegerField()
+
+    class Meta:
+        verbose_name, verbose_name_plural = "Candle", "Candles"
+        unique_together = ('symbol', 'interval', 'open_time')
+        ordering = ['symbol', 'interval', 'open_time']
+    def __str__(self): return f"{self.symbol} {self.interval} @ {self.open_time}"
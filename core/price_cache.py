@@ -0,0 +1,133 @@
+# core/price_cache.py
+"""
+Camada única de leitura de preços usada pelas views e tarefas.
+
+Os preços vêm do cache (Redis), alimentado pelo ingestor WebSocket (`run_market_stream`) e pela
+tarefa de atualização em lote. Se a entrada estiver velha ou ausente, o valor disponível é servido
+na hora (a entrada velha ou o `current_price` do banco) e uma atualização é agendada em segundo
+plano (stale-while-revalidate). Nenhuma renderização de página espera pela Binance.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .models import Cryptocurrency
+
+logger = logging.getLogger(__name__)
+
+PRICE_CACHE_KEY = "price:{symbol}"
+REVALIDATE_LOCK_KEY = "price:revalidate-lock"
+
+
+@dataclass(frozen=True)
+class PriceQuote:
+    price: Optional[Decimal]
+    change_percent_24h: Optional[Decimal]
+    is_stale: bool
+
+
+def _to_decimal(value):
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return None
+
+
+class PriceCache:
+    def __init__(self, fresh_ttl=None, entry_ttl=None):
+        # fresh_ttl: idade máxima (s) para uma cotação ser considerada atual.
+        # entry_ttl: tempo (s) que a entrada fica no Redis e pode ser servida como "velha".
+        self.fresh_ttl = fresh_ttl if fresh_ttl is not None else getattr(settings, 'PRICE_CACHE_FRESH_SECONDS', 30)
+        self.entry_ttl = entry_ttl if entry_ttl is not None else getattr(settings, 'PRICE_CACHE_ENTRY_TTL', 600)
+
+    @staticmethod
+    def key(symbol):
+        return PRICE_CACHE_KEY.format(symbol=symbol.upper())
+
+    def set_many(self, quotes, ts=None):
+        """Grava cotações no cache. `quotes` = {símbolo: (preço, variação_24h_%)}."""
+        ts = ts or time.time()
+        entries = {
+            self.key(symbol): {
+                'price': str(price),
+                'change_percent_24h': str(change) if change is not None else None,
+                'ts': ts,
+            }
+            for symbol, (price, change) in quotes.items() if price is not None
+        }
+        if entries:
+            cache.set_many(entries, timeout=self.entry_ttl)
+        return len(entries)
+
+    def get_many(self, cryptocurrencies):
+        """
+        Devolve {símbolo: PriceQuote} para as criptomoedas pedidas com uma única leitura ao cache.
+        Símbolos sem cotação atual recebem o melhor valor disponível e disparam a revalidação.
+        """
+        cryptocurrencies = list(cryptocurrencies)
+        entries = cache.get_many([self.key(c.symbol) for c in cryptocurrencies])
+        now, quotes, needs_refresh = time.time(), {}, False
+
+        for crypto in cryptocurrencies:
+            entry = entries.get(self.key(crypto.symbol))
+            if entry and _to_decimal(entry.get('price')) is not None:
+                is_stale = (now - entry.get('ts', 0)) > self.fresh_ttl
+                quotes[crypto.symbol] = PriceQuote(_to_decimal(entry['price']), _to_decimal(entry.get('change_percent_24h')), is_stale)
+            else:
+                is_stale = True
+                quotes[crypto.symbol] = PriceQuote(crypto.current_price, None, True)
+            needs_refresh = needs_refresh or is_stale
+
+        if needs_refresh:
+            self.revalidate()
+        return quotes
+
+    def get(self, crypto):
+        return self.get_many([crypto])[crypto.symbol]
+
+    def revalidate(self):
+        """Agenda (no máximo uma vez por janela de `fresh_ttl`) a atualização em lote dos preços."""
+        if not cache.add(REVALIDATE_LOCK_KEY, 1, timeout=self.fresh_ttl):
+            return False
+        try:
+            from .tasks import update_all_cryptocurrency_prices
+            update_all_cryptocurrency_prices.delay()
+            return True
+        except Exception as e:
+            logger.warning("Não foi possível agendar a revalidação dos preços: %s", e)
+            return False
+
+
+def bulk_update_prices(cryptocurrencies, prices_by_pair):
+    """
+    Aplica os preços de `prices_by_pair` (ex: {'BTCUSDT': '65000.10'}) às criptomoedas
+    e grava apenas as que mudaram, com um único bulk_update dentro de uma transação.
+    Retorna (linhas_gravadas, pares_sem_preço).
+    """
+    now = timezone.now()
+    changed, failed_symbols = [], []
+    for crypto in cryptocurrencies:
+        api_symbol_pair = f"{crypto.symbol.upper()}{crypto.price_currency.upper()}"
+        raw_price = prices_by_pair.get(api_symbol_pair)
+        if raw_price is None:
+            failed_symbols.append(api_symbol_pair); continue
+        try:
+            new_price = Decimal(str(raw_price))
+        except InvalidOperation:
+            failed_symbols.append(api_symbol_pair); continue
+        if crypto.current_price is None or new_price != crypto.current_price:
+            crypto.current_price = new_price; crypto.last_updated = now
+            changed.append(crypto)
+    if changed:
+        with db_transaction.atomic():
+            Cryptocurrency.objects.bulk_update(changed, ['current_price', 'last_updated'])
+    return len(changed), failed_symbols
@@ -0,0 +1,117 @@
+# core/symbol_rules.py
+"""
+Índice local das regras de negociação dos pares (LOT_SIZE, PRICE_FILTER, NOTIONAL) da Binance.
+
+Um único download do exchangeInfo (tarefa agendada `refresh_symbol_rules`) vira um dicionário
+{par: SymbolRules} guardado no cache (Redis) e na memória do processo: preparar uma ordem não
+precisa mais de um get_symbol_info() nem de percorrer a lista de filtros. Um par que ainda não
+está no índice é consultado individualmente, como antes.
+"""
+import logging
+import time
+from dataclasses import asdict, dataclass
+from decimal import Decimal, ROUND_DOWN
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .binance_governor import GovernedClient
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_RULES_CACHE_KEY = "exchange-info:symbol-rules:{environment}"
+
+
+def adjust_quantity_to_lot_size(quantity_str, step_size_str):
+    quantity, step_size = Decimal(quantity_str), Decimal(step_size_str)
+    if step_size <= 0: return quantity.quantize(Decimal('1e-8'), rounding=ROUND_DOWN)
+    precision = len(step_size_str.rstrip('0').split('.')[1]) if '.' in step_size_str else 0
+    adjusted = (quantity / step_size).to_integral_value(rounding=ROUND_DOWN) * step_size
+    return adjusted.quantize(Decimal('1e-' + str(precision)), rounding=ROUND_DOWN)
+
+def adjust_price_to_tick_size(price_str, tick_size_str):
+    price, tick_size = Decimal(price_str), Decimal(tick_size_str)
+    if tick_size <= 0: return price
+    precision = len(tick_size_str.rstrip('0').split('.')[1]) if '.' in tick_size_str else 0
+    quotient = (price / tick_size).to_integral_value(rounding=ROUND_DOWN)
+    return (quotient * tick_size).quantize(Decimal('1e-' + str(precision)))
+
+
+@dataclass(frozen=True)
+class SymbolRules:
+    symbol: str
+    step_size: str = '0'
+    min_qty: str = '0'
+    tick_size: str = '0'
+    min_notional: str = '0'
+
+    @classmethod
+    def from_symbol_info(cls, info):
+        filters = {f['filterType']: f for f in info.get('filters', [])}
+        lot_size, price_filter = filters.get('LOT_SIZE', {}), filters.get('PRICE_FILTER', {})
+        # Pares novos usam NOTIONAL; os antigos, MIN_NOTIONAL.
+        notional = filters.get('NOTIONAL') or filters.get('MIN_NOTIONAL') or {}
+        return cls(
+            symbol=info['symbol'], step_size=lot_size.get('stepSize', '0'), min_qty=lot_size.get('minQty', '0'),
+            tick_size=price_filter.get('tickSize', '0'), min_notional=notional.get('minNotional', '0'),
+        )
+
+    def adjust_quantity(self, quantity):
+        return adjust_quantity_to_lot_size(str(quantity), self.step_size)
+
+    def adjust_price(self, price):
+        return adjust_price_to_tick_size(str(price), self.tick_size)
+
+    def check_notional(self, quantity, price):
+        """Levanta ValueError se a ordem ficar abaixo do valor mínimo do par (a Binance a rejeitaria)."""
+        min_notional = Decimal(self.min_notional)
+        if min_notional > 0 and Decimal(quantity) * Decimal(price) < min_notional:
+            raise ValueError(f"Valor da ordem abaixo do mínimo de {min_notional.normalize()} exigido para {self.symbol}.")
+
+
+class SymbolRulesIndex:
+    def __init__(self, local_ttl=None, entry_ttl=None):
+        # local_ttl: segundos até o processo reler o índice do cache (pega as atualizações agendadas).
+        # entry_ttl: tempo que o índice fica no cache; vencido, os pares voltam a ser consultados um a um.
+        self.local_ttl = local_ttl if local_ttl is not None else getattr(settings, 'SYMBOL_RULES_LOCAL_SECONDS', 300)
+        self.entry_ttl = entry_ttl if entry_ttl is not None else getattr(settings, 'SYMBOL_RULES_ENTRY_TTL', 6 * 3600)
+        self._local = {}
+
+    @staticmethod
+    def _environment(testnet):
+        return 'testnet' if testnet else 'live'
+
+    def refresh(self, testnet=False, client=None):
+        """Baixa o exchangeInfo completo uma vez e reconstrói o índice. Retorna o número de pares."""
+        client = client or GovernedClient(testnet=testnet, ping=False)
+        rules = {s['symbol']: SymbolRules.from_symbol_info(s) for s in client.get_exchange_info().get('symbols', [])}
+        cache.set(SYMBOL_RULES_CACHE_KEY.format(environment=self._environment(testnet)),
+                  {symbol: asdict(r) for symbol, r in rules.items()}, timeout=self.entry_ttl)
+        self._local[self._environment(testnet)] = (rules, time.monotonic())
+        return len(rules)
+
+    def _rules(self, testnet):
+        environment = self._environment(testnet)
+        local = self._local.get(environment)
+        if local is not None and time.monotonic() - local[1] < self.local_ttl:
+            return local[0]
+        stored = cache.get(SYMBOL_RULES_CACHE_KEY.format(environment=environment)) or {}
+        rules = {symbol: SymbolRules(**r) for symbol, r in stored.items()}
+        self._local[environment] = (rules, time.monotonic())
+        return rules
+
+    def get(self, api_symbol, client, testnet=False):
+        """Regras de `api_symbol`; se o par não estiver no índice, consulta-o com `client`."""
+        rules = self._rules(testnet).get(api_symbol)
+        if rules is not None:
+            return rules
+        logger.info("%s fora do índice de regras; consultando get_symbol_info.", api_symbol)
+        info = client.get_symbol_info(api_symbol)
+        if not info:
+            raise ValueError(f"Par {api_symbol} não encontrado na Binance.")
+        rules = SymbolRules.from_symbol_info(info)
+        self._rules(testnet)[api_symbol] = rules
+        return rules
+
+
+symbol_rules = SymbolRulesIndex()
@@ -3,15 +3,18 @@ from celery import shared_task
 from celery.schedules import crontab
 from django.conf import settings
 from django.utils import timezone
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal
 
-from binance.client import Client
 from binance.exceptions import BinanceAPIException, BinanceRequestException
 import requests.exceptions 
 import requests
 import logging
+import time
 
 from .models import Cryptocurrency, ExchangeRate, FIAT_CURRENCY_CHOICES, BASE_RATE_CURRENCY, UserProfile, Holding, PortfolioSnapshot
+from .binance_governor import GovernedClient
+from .price_cache import PriceCache, bulk_update_prices
+from .symbol_rules import symbol_rules
 
 logger = logging.getLogger(__name__)
 
@@ -21,25 +24,32 @@ logger = logging.getLogger(__name__)
     retry_backoff=True, retry_kwargs={'max_retries': 3}
 )
 def update_all_cryptocurrency_prices(self):
+    """
+    Atualiza o preço de todas as criptomoedas com UMA chamada à Binance (ticker 24h de todos
+    os pares) em vez de uma chamada por símbolo, gravando só os preços alterados.
+    As cotações também alimentam o PriceCache, junto com a variação de 24h.
+    """
     print(f"[{timezone.now()}] Iniciando tarefa: update_all_cryptocurrency_prices (Tentativa: {self.request.retries + 1})")
-    client = Client(settings.BINANCE_API_KEY, settings.BINANCE_API_SECRET, tld='com', testnet=settings.BINANCE_TESTNET)
-    cryptocurrencies = Cryptocurrency.objects.all()
-    if not cryptocurrencies.exists(): return "Nenhuma criptomoeda para atualizar."
-    updated_count = 0; failed_symbols = []
+    started_at = time.monotonic()
+    cryptocurrencies = list(Cryptocurrency.objects.all())
+    if not cryptocurrencies: return "Nenhuma criptomoeda para atualizar."
+    client = GovernedClient(settings.BINANCE_API_KEY, settings.BINANCE_API_SECRET, tld='com', testnet=settings.BINANCE_TESTNET)
+    try:
+        tickers_by_pair = {ticker['symbol']: ticker for ticker in client.get_ticker()}
+    except BinanceAPIException as e:
+        print(f"Erro ao obter os tickers da Binance: {e} - Não será tentado novamente.")
+        return f"Preços não atualizados: {e}"
+
+    prices_by_pair = {pair: ticker.get('lastPrice') for pair, ticker in tickers_by_pair.items()}
+    updated_count, failed_symbols = bulk_update_prices(cryptocurrencies, prices_by_pair)
+    quotes = {}
     for crypto in cryptocurrencies:
-        api_symbol_pair = f"{crypto.symbol.upper()}{crypto.price_currency.upper()}"
-        try:
-            ticker_data = client.get_ticker(symbol=api_symbol_pair) 
-            if ticker_data and 'lastPrice' in ticker_data:
-                new_price = Decimal(ticker_data['lastPrice'])
-                if new_price != crypto.current_price or crypto.current_price is None:
-                    crypto.current_price = new_price; crypto.last_updated = timezone.now(); crypto.save()
-                    updated_count += 1
-            else: failed_symbols.append(api_symbol_pair)
-        except (BinanceAPIException, InvalidOperation) as e:
-            print(f"Erro para {api_symbol_pair}: {e} - Não será tentado novamente.")
-            failed_symbols.append(api_symbol_pair)
-    result_message = f"Preços finalizados. {updated_count} atualizados. Falhas: {len(failed_symbols)}."
+        ticker = tickers_by_pair.get(f"{crypto.symbol.upper()}{crypto.price_currency.upper()}")
+        if ticker: quotes[crypto.symbol] = (ticker.get('lastPrice'), ticker.get('priceChangePercent'))
+    PriceCache().set_many(quotes)
+    elapsed_ms = (time.monotonic() - started_at) * 1000
+    logger.info("update_all_cryptocurrency_prices: %d linhas gravadas em %.0f ms (%d pares, %d falhas)", updated_count, elapsed_ms, len(cryptocurrencies), len(failed_symbols))
+    result_message = f"Preços finalizados em {elapsed_ms:.0f} ms. {updated_count} atualizados. Falhas: {len(failed_symbols)}."
     if failed_symbols: print(f"Símbolos com falha: {', '.join(failed_symbols)}")
     return result_message
 
@@ -53,7 +63,7 @@ def update_exchange_rates(self):
     Busca e salva as taxas de câmbio, tentando pares diretos e inversos.
     """
     print(f"[{timezone.now()}] Iniciando tarefa: update_exchange_rates (Tentativa: {self.request.retries + 1})")
-    client = Client(settings.BINANCE_API_KEY, settings.BINANCE_API_SECRET, tld='com', testnet=settings.BINANCE_TESTNET)
+    client = GovernedClient(settings.BINANCE_API_KEY, settings.BINANCE_API_SECRET, tld='com', testnet=settings.BINANCE_TESTNET)
     
     target_fiat_currencies = [c[0] for c in FIAT_CURRENCY_CHOICES if c[0] != BASE_RATE_CURRENCY]
     if not target_fiat_currencies:
@@ -110,6 +120,21 @@ def update_exchange_rates(self):
         print(f"Pares com falha: {', '.join(failed_symbols)}")
     return result_message
 
+@shared_task(
+    name="core.tasks.refresh_symbol_rules",
+    autoretry_for=(BinanceRequestException, requests.exceptions.RequestException),
+    retry_backoff=True, retry_kwargs={'max_retries': 3}
+)
+def refresh_symbol_rules():
+    """
+    Baixa o exchangeInfo completo (uma chamada por ambiente) e reconstrói o índice de regras dos
+    pares usado ao preparar ordens. A testnet só é baixada se algum perfil a usa.
+    """
+    counts = {'live': symbol_rules.refresh(testnet=False)}
+    if UserProfile.objects.filter(use_testnet=True).exists():
+        counts['testnet'] = symbol_rules.refresh(testnet=True)
+    return "Regras dos pares atualizadas: " + ", ".join(f"{env}={n}" for env, n in counts.items())
+
 # NOVA TAREFA
 @shared_task(name="core.tasks.create_daily_portfolio_snapshots")
 def create_daily_portfolio_snapshots():
@@ -123,6 +148,7 @@ def create_daily_portfolio_snapshots():
     users_with_holdings = UserProfile.objects.filter(holdings__isnull=False).distinct()
     exchange_rates = {rate.to_currency: rate.rate for rate in ExchangeRate.objects.filter(from_currency=BASE_RATE_CURRENCY)}
     exchange_rates[BASE_RATE_CURRENCY] = Decimal('1.0')
+    price_cache = PriceCache()
     
     created_count = 0
     for profile in users_with_holdings:
@@ -139,9 +165,11 @@ def create_daily_portfolio_snapshots():
             continue
 
         holdings = Holding.objects.filter(user_profile=profile, quantity__gt=0).select_related('cryptocurrency')
+        quotes = price_cache.get_many(h.cryptocurrency for h in holdings)
         for holding in holdings:
-            if holding.current_market_value is not None:
-                total_portfolio_value_pref_currency += holding.current_market_value * rate_to_pref_currency
+            price = quotes[holding.cryptocurrency.symbol].price
+            if price is not None:
+                total_portfolio_value_pref_currency += holding.quantity * price * rate_to_pref_currency
         
         PortfolioSnapshot.objects.create(
             user_profile=profile,
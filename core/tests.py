@@ -5,6 +5,7 @@ from django.contrib.messages import get_messages
 from django.conf import settings 
 from unittest.mock import patch, MagicMock 
 from decimal import Decimal
+import time
 from django.utils import timezone
 
 from .models import UserProfile, Cryptocurrency, Holding, Transaction 
@@ -224,3 +225,430 @@ class TransactionHistoryViewTests(TestCase):
         self.assertContains(response, 'Nenhuma Transação Registrada')
         self.assertEqual(len(response.context['transactions']), 0)
 
+
+class UpdatePricesTaskTests(TestCase):
+    def setUp(self):
+        self.btc = Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', current_price=Decimal('50000.00'), price_currency='USDT')
+        self.eth = Cryptocurrency.objects.create(symbol='ETH', name='Ethereum', current_price=Decimal('4000.00'), price_currency='USDT')
+        self.sol = Cryptocurrency.objects.create(symbol='SOL', name='Solana', current_price=None, price_currency='USDT')
+
+    @patch('core.tasks.GovernedClient')
+    def test_single_request_and_only_changed_rows_written(self, MockBinanceApiClient):
+        from .tasks import update_all_cryptocurrency_prices
+        mock_instance = MockBinanceApiClient.return_value
+        mock_instance.get_ticker.return_value = [
+            {'symbol': 'BTCUSDT', 'lastPrice': '51000.00', 'priceChangePercent': '2.00'},
+            {'symbol': 'ETHUSDT', 'lastPrice': '4000.00', 'priceChangePercent': '0.00'},
+            {'symbol': 'XRPUSDT', 'lastPrice': '0.5', 'priceChangePercent': '1.00'},
+        ]
+        result = update_all_cryptocurrency_prices.apply().get()
+
+        mock_instance.get_ticker.assert_called_once_with()
+        self.assertIn('1 atualizados', result)
+        self.assertIn('Falhas: 1', result)
+        self.btc.refresh_from_db(); self.eth.refresh_from_db()
+        self.assertEqual(self.btc.current_price, Decimal('51000.00'))
+        self.assertEqual(self.eth.current_price, Decimal('4000.00'))
+
+class MarketStreamIngestorTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.btc = Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', current_price=Decimal('50000.00'), price_currency='USDT')
+
+    def test_replay_updates_cache_and_coalesces_db_writes(self):
+        import json
+        from django.core.cache import cache
+        from .market_stream import MarketDataIngestor, ReplayTransport
+        messages = [
+            json.dumps([{'e': '24hrMiniTicker', 'E': 1700000000000, 's': 'BTCUSDT', 'c': '51000.00', 'o': '50000.00'},
+                        {'e': '24hrMiniTicker', 'E': 1700000000000, 's': 'DOGEUSDT', 'c': '0.1', 'o': '0.1'}]),
+            json.dumps([{'e': '24hrMiniTicker', 'E': 1700000001000, 's': 'BTCUSDT', 'c': '52000.00', 'o': '50000.00'}]),
+        ]
+        ingestor = MarketDataIngestor(ReplayTransport(messages), flush_interval=3600)
+        self.assertEqual(ingestor.run(), 2)
+
+        entry = cache.get('price:BTC')
+        self.assertEqual(entry['price'], '52000.00')
+        self.assertEqual(Decimal(entry['change_percent_24h']), Decimal('4'))
+        self.assertIsNone(cache.get('price:DOGE'))
+        self.btc.refresh_from_db()
+        self.assertEqual(self.btc.current_price, Decimal('52000.00'))
+
+    @patch('core.market_stream.random.uniform', return_value=0)
+    @patch('core.market_stream.time.sleep')
+    def test_rejected_handshake_reconnects_with_backoff(self, mock_sleep, _):
+        from websockets.exceptions import InvalidStatus
+        from .market_stream import WebSocketTransport
+        rejected = InvalidStatus(MagicMock(status_code=429))
+        ws = MagicMock(**{'recv.return_value': '[]'})
+        ws.__enter__.return_value = ws
+        transport = WebSocketTransport('wss://example.invalid/ws', reconnect_delay=1, max_reconnect_delay=3)
+        with patch.object(transport, '_connect', side_effect=[rejected, rejected, rejected, ws]):
+            self.assertEqual(next(transport.messages(timeout=1)), '[]')
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [1, 2, 3])
+
+class PriceCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.btc = Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', current_price=Decimal('50000.00'), price_currency='USDT')
+        self.eth = Cryptocurrency.objects.create(symbol='ETH', name='Ethereum', current_price=Decimal('4000.00'), price_currency='USDT')
+
+    @patch('core.tasks.update_all_cryptocurrency_prices.delay')
+    def test_fresh_entry_is_served_without_revalidation(self, mock_delay):
+        from .price_cache import PriceCache
+        price_cache = PriceCache(fresh_ttl=30)
+        price_cache.set_many({'BTC': (Decimal('51000.00'), Decimal('2.5')), 'ETH': (Decimal('4100.00'), None)})
+        quotes = price_cache.get_many([self.btc, self.eth])
+        self.assertEqual(quotes['BTC'].price, Decimal('51000.00'))
+        self.assertEqual(quotes['BTC'].change_percent_24h, Decimal('2.5'))
+        self.assertFalse(quotes['ETH'].is_stale)
+        mock_delay.assert_not_called()
+
+    @patch('core.tasks.update_all_cryptocurrency_prices.delay')
+    def test_missing_or_old_entries_fall_back_and_revalidate_once(self, mock_delay):
+        import time
+        from .price_cache import PriceCache
+        price_cache = PriceCache(fresh_ttl=30)
+        price_cache.set_many({'BTC': (Decimal('49000.00'), None)}, ts=time.time() - 120)
+        quotes = price_cache.get_many([self.btc, self.eth])
+        self.assertEqual(quotes['BTC'].price, Decimal('49000.00'))
+        self.assertTrue(quotes['BTC'].is_stale)
+        self.assertEqual(quotes['ETH'].price, Decimal('4000.00'))
+        self.assertTrue(quotes['ETH'].is_stale)
+        price_cache.get_many([self.btc, self.eth])
+        mock_delay.assert_called_once()
+
+    def test_explicit_zero_ttl_is_kept(self):
+        from .price_cache import PriceCache
+        self.assertEqual(PriceCache(fresh_ttl=0).fresh_ttl, 0)
+        with override_settings(PRICE_CACHE_FRESH_SECONDS=30):
+            self.assertEqual(PriceCache().fresh_ttl, 30)
+
+    @patch('core.views._process_successful_order')
+    @patch('core.views.get_binance_client')
+    def test_market_sell_by_quote_is_sized_with_live_ticker(self, mock_get_client, mock_process):
+        from .price_cache import PriceCache
+        user = User.objects.create_user(username='seller', password='x')
+        Holding.objects.create(user_profile=user.profile, cryptocurrency=self.btc, quantity=Decimal('1'), average_buy_price=Decimal('1'))
+        # Cotação velha no cache: a ordem não pode ser dimensionada por ela.
+        PriceCache().set_many({'BTC': (Decimal('10000.00'), None)}, ts=time.time() - 3600)
+        client = mock_get_client.return_value
+        client.get_symbol_ticker.return_value = {'price': '50000.00'}
+        client.get_symbol_info.return_value = {'symbol': 'BTCUSDT', 'filters': [{'filterType': 'LOT_SIZE', 'stepSize': '0.00001000', 'minQty': '0.00001000'}]}
+        self.client.force_login(user)
+        with patch('core.tasks.update_all_cryptocurrency_prices.delay'):
+            self.client.post(reverse('core:trade_market_sell'), {'sell_type': 'QUOTE_RECEIVE', 'cryptocurrency': 'BTC', 'quote_quantity_to_receive': '100'})
+        client.get_symbol_ticker.assert_called_once_with(symbol='BTCUSDT')
+        client.order_market_sell.assert_called_once_with(symbol='BTCUSDT', quantity='0.002')
+
+class KlineStoreTests(TestCase):
+    DAY_MS = 86_400_000
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _klines(self, first_open, count):
+        return [[first_open + i * self.DAY_MS, '1.0', '2.0', '0.5', str(100 + i), '10.0', first_open + (i + 1) * self.DAY_MS - 1] for i in range(count)]
+
+    def test_only_missing_bars_are_fetched(self):
+        from .klines import KlineStore
+        start = 1_700_000_000_000 - (1_700_000_000_000 % self.DAY_MS)
+        client = MagicMock()
+        client.get_historical_klines.return_value = self._klines(start, 5)
+        store = KlineStore(client=client)
+
+        rows = store.fetch('BTCUSDT', '1d', start)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[-1][4], '104.00000000')
+        client.get_historical_klines.assert_called_once_with('BTCUSDT', '1d', start, None)
+
+        # Nova chamada: busca só a partir do último candle armazenado (que pode estar aberto).
+        client.get_historical_klines.reset_mock()
+        client.get_historical_klines.return_value = self._klines(start + 4 * self.DAY_MS, 2)
+        rows = store.fetch('BTCUSDT', '1d', start)
+        self.assertEqual(len(rows), 6)
+        client.get_historical_klines.assert_called_once_with('BTCUSDT', '1d', start + 4 * self.DAY_MS, None)
+        self.assertEqual([r[0] for r in store.stored('BTCUSDT', '1d', start, end_ms=start + 2 * self.DAY_MS)],
+                         [start, start + self.DAY_MS, start + 2 * self.DAY_MS])
+
+    def test_gaps_and_older_history_are_backfilled(self):
+        from .klines import KlineStore
+        from .models import Kline
+        start = 1_700_000_000_000 - (1_700_000_000_000 % self.DAY_MS)
+        client = MagicMock()
+        store = KlineStore(client=client)
+        store._save('BTCUSDT', '1d', self._klines(start + 2 * self.DAY_MS, 2) + self._klines(start + 6 * self.DAY_MS, 1))
+        client.get_historical_klines.return_value = []
+
+        store.sync('BTCUSDT', '1d', start)
+        requested = [c.args[2:] for c in client.get_historical_klines.call_args_list]
+        self.assertIn((start, start + 2 * self.DAY_MS - 1), requested)
+        self.assertIn((start + 6 * self.DAY_MS, None), requested)
+        self.assertIn((start + 4 * self.DAY_MS, start + 6 * self.DAY_MS - 1), requested)
+        self.assertEqual(Kline.objects.count(), 3)
+
+        # A Binance não tinha nada ali: a próxima sincronização só pede os candles novos.
+        client.get_historical_klines.reset_mock()
+        store.sync('BTCUSDT', '1d', start)
+        client.get_historical_klines.assert_called_once_with('BTCUSDT', '1d', start + 6 * self.DAY_MS, None)
+
+        # Um buraco novo (depois de um candle novo) ainda é procurado.
+        store._save('BTCUSDT', '1d', self._klines(start + 9 * self.DAY_MS, 1))
+        client.get_historical_klines.reset_mock()
+        store.sync('BTCUSDT', '1d', start)
+        self.assertEqual([c.args[2:] for c in client.get_historical_klines.call_args_list],
+                         [(start + 9 * self.DAY_MS, None), (start + 7 * self.DAY_MS, start + 9 * self.DAY_MS - 1)])
+
+
+class EncryptionTests(TestCase):
+    def setUp(self):
+        from .encryption import secret_cache
+        secret_cache.clear()
+        self.profile = User.objects.create_user(username='crypto', password='x').profile
+
+    def test_key_is_derived_once_per_process(self):
+        from .encryption import _derive_fernet_key, decrypt, encrypt
+        token = encrypt('segredo')
+        with patch('core.encryption.PBKDF2HMAC') as kdf:
+            for _ in range(50):
+                self.assertEqual(decrypt(encrypt('segredo')), 'segredo')
+            self.assertEqual(decrypt(token), 'segredo')
+        kdf.assert_not_called()
+        self.assertGreaterEqual(_derive_fernet_key.cache_info().hits, 100)
+
+    def test_decrypted_secret_is_cached_per_profile_and_cleared_on_save(self):
+        self.profile.gemini_api_key = 'chave-1'
+        self.profile.save()
+        from .encryption import get_fernet
+        with patch('core.encryption.get_fernet', wraps=get_fernet) as fernet:
+            for _ in range(10):
+                self.assertEqual(self.profile.gemini_api_key, 'chave-1')
+            self.assertEqual(fernet.call_count, 1)
+
+            self.profile.gemini_api_key = 'chave-2'
+            self.profile.save()
+            self.assertEqual(UserProfile.objects.get(pk=self.profile.pk).gemini_api_key, 'chave-2')
+
+    def test_rotation_with_multifernet_and_reencrypt_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .encryption import decrypt
+        with override_settings(FIELD_ENCRYPTION_KEY='chave-antiga'):
+            self.profile.binance_api_key, self.profile.binance_api_secret = 'api-key', 'api-secret'
+            self.profile.save()
+        old_token = UserProfile.objects.get(pk=self.profile.pk)._binance_api_key
+
+        with override_settings(FIELD_ENCRYPTION_KEY='chave-nova', FIELD_ENCRYPTION_OLD_KEYS=['chave-antiga'], FIELD_ENCRYPTION_SECRET_CACHE_SECONDS=0):
+            self.assertEqual(UserProfile.objects.get(pk=self.profile.pk).binance_api_key, 'api-key')
+            # Perfis gravados antes das colunas de prévia também são preenchidos pelo comando.
+            UserProfile.objects.filter(pk=self.profile.pk).update(binance_api_key_preview='', binance_api_secret_fingerprint='')
+            call_command('reencrypt_secrets', stdout=StringIO())
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        self.assertNotEqual(profile._binance_api_key, old_token)
+        self.assertEqual(profile.binance_api_key_preview, '****')
+        self.assertNotEqual(profile.binance_api_secret_fingerprint, '')
+
+        # Depois da rotação a chave antiga pode ser removida.
+        with override_settings(FIELD_ENCRYPTION_KEY='chave-nova', FIELD_ENCRYPTION_OLD_KEYS=[], FIELD_ENCRYPTION_SECRET_CACHE_SECONDS=0):
+            self.assertEqual((profile.binance_api_key, profile.binance_api_secret), ('api-key', 'api-secret'))
+            self.assertEqual(decrypt(old_token), 'DECRYPTION_FAILED')
+
+    def test_setters_fill_previews_and_admin_list_needs_no_decryption(self):
+        self.profile.binance_api_key, self.profile.binance_api_secret = 'ABCD1234567890WXYZ', 'segredo-binance'
+        self.profile.save()
+        self.assertEqual(self.profile.binance_api_key_preview, 'ABCD...WXYZ')
+        self.assertEqual(len(self.profile.binance_api_secret_fingerprint), 16)
+        self.assertEqual(self.profile.gemini_api_key_fingerprint, '')
+
+        admin_user = User.objects.create_superuser(username='admin', password='x', email='a@example.com')
+        self.client.force_login(admin_user)
+        with patch('core.encryption.get_fernet') as fernet:
+            response = self.client.get(reverse('admin:core_userprofile_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'ABCD...WXYZ')
+        fernet.assert_not_called()
+
+
+class BinanceClientRegistryTests(TestCase):
+    @patch('core.binance_clients.GovernedClient')
+    def test_clients_are_reused_and_share_time_offset(self, mock_client_class):
+        from .binance_clients import BinanceClientRegistry
+        mock_client_class.side_effect = lambda *args, **kwargs: MagicMock(**{'get_server_time.return_value': {'serverTime': int(time.time() * 1000) + 5000}})
+        registry = BinanceClientRegistry(idle_seconds=60, offset_refresh_seconds=300)
+
+        first = registry.get('key-a', 'secret-a', True)
+        self.assertIs(registry.get('key-a', 'secret-a', True), first)
+        other = registry.get('key-b', 'secret-b', True)
+        self.assertIsNot(other, first)
+        self.assertEqual(mock_client_class.call_count, 2)
+        self.assertFalse(mock_client_class.call_args.kwargs['ping'])
+        # Um único get_server_time para o ambiente, compartilhado por todos os clientes.
+        self.assertEqual(first.get_server_time.call_count + other.get_server_time.call_count, 1)
+        self.assertAlmostEqual(other.timestamp_offset, 5000, delta=1000)
+
+        registry.get('key-a', 'secret-a', False)
+        self.assertEqual(mock_client_class.call_count, 3)
+
+    @patch('core.binance_clients.time.monotonic')
+    @patch('core.binance_clients.GovernedClient')
+    def test_idle_clients_are_evicted(self, mock_client_class, mock_monotonic):
+        from .binance_clients import BinanceClientRegistry
+        mock_client_class.side_effect = lambda *args, **kwargs: MagicMock(**{'get_server_time.return_value': {'serverTime': 0}})
+        registry = BinanceClientRegistry(idle_seconds=60, offset_refresh_seconds=300)
+        mock_monotonic.return_value = 1000.0
+        first = registry.get('key-a', 'secret-a', True)
+        mock_monotonic.return_value = 1100.0
+        self.assertIsNot(registry.get('key-a', 'secret-a', True), first)
+        first.close_connection.assert_called_once()
+
+    @patch('core.binance_clients.time.monotonic', return_value=1000.0)
+    @patch('core.binance_clients.GovernedClient')
+    def test_full_registry_drops_clients_without_closing_them(self, mock_client_class, _):
+        from .binance_clients import BinanceClientRegistry
+        mock_client_class.side_effect = lambda *args, **kwargs: MagicMock(**{'get_server_time.return_value': {'serverTime': 0}})
+        registry = BinanceClientRegistry(idle_seconds=60, offset_refresh_seconds=300, max_clients=1)
+        in_use = registry.get('key-a', 'secret-a', True)
+        registry.get('key-b', 'secret-b', True)
+        # Outra thread ainda pode estar usando o cliente de key-a: ele sai do registro, mas a sessão não é fechada.
+        self.assertIsNot(registry.get('key-a', 'secret-a', True), in_use)
+        in_use.close_connection.assert_not_called()
+
+    @patch('core.views.binance_clients')
+    def test_get_binance_client_uses_registry(self, mock_registry):
+        from .views import get_binance_client
+        profile = User.objects.create_user(username='pooled', password='x').profile
+        self.assertIsNone(get_binance_client(profile))
+        profile.binance_api_key, profile.binance_api_secret = 'key', 'secret'
+        profile.save()
+        self.assertIs(get_binance_client(profile), mock_registry.get.return_value)
+        mock_registry.get.assert_called_once_with('key', 'secret', True)
+
+class SymbolRulesTests(TestCase):
+    EXCHANGE_INFO = {'symbols': [
+        {'symbol': 'BTCUSDT', 'filters': [
+            {'filterType': 'PRICE_FILTER', 'tickSize': '0.01000000'},
+            {'filterType': 'LOT_SIZE', 'stepSize': '0.00001000', 'minQty': '0.00001000'},
+            {'filterType': 'NOTIONAL', 'minNotional': '5.00000000'},
+        ]},
+        {'symbol': 'ETHUSDT', 'filters': [{'filterType': 'LOT_SIZE', 'stepSize': '0.00010000', 'minQty': '0.00010000'}]},
+    ]}
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_refresh_builds_index_and_lookup_skips_client(self):
+        from .symbol_rules import SymbolRulesIndex
+        exchange_client = MagicMock(**{'get_exchange_info.return_value': self.EXCHANGE_INFO})
+        self.assertEqual(SymbolRulesIndex().refresh(client=exchange_client), 2)
+
+        # Outro processo lê o índice do cache, sem nenhuma chamada à Binance.
+        index, user_client = SymbolRulesIndex(), MagicMock()
+        rules = index.get('BTCUSDT', user_client)
+        self.assertEqual(rules.adjust_quantity(Decimal('0.123456789')), Decimal('0.12345'))
+        self.assertEqual(rules.adjust_price(Decimal('50000.129')), Decimal('50000.12'))
+        self.assertEqual(index.get('ETHUSDT', user_client).min_notional, '0')
+        user_client.get_symbol_info.assert_not_called()
+        with self.assertRaisesMessage(ValueError, 'mínimo de 5'):
+            rules.check_notional(Decimal('0.0001'), Decimal('40000'))
+        rules.check_notional(Decimal('0.001'), Decimal('40000'))
+
+    def test_unknown_symbol_falls_back_to_symbol_info(self):
+        from .symbol_rules import SymbolRulesIndex
+        index, client = SymbolRulesIndex(), MagicMock()
+        client.get_symbol_info.return_value = self.EXCHANGE_INFO['symbols'][1]
+        self.assertEqual(index.get('ETHUSDT', client).step_size, '0.00010000')
+        index.get('ETHUSDT', client)
+        client.get_symbol_info.assert_called_once_with('ETHUSDT')
+        client.get_symbol_info.return_value = None
+        with self.assertRaises(ValueError):
+            index.get('XYZUSDT', client)
+
+    @patch('core.symbol_rules.GovernedClient')
+    def test_refresh_task_downloads_testnet_only_when_used(self, mock_client_class):
+        from .tasks import refresh_symbol_rules
+        mock_client_class.return_value.get_exchange_info.return_value = self.EXCHANGE_INFO
+        User.objects.create_user(username='live', password='x')
+        UserProfile.objects.update(use_testnet=False)
+        self.assertEqual(refresh_symbol_rules.apply().get(), "Regras dos pares atualizadas: live=2")
+        mock_client_class.assert_called_once_with(testnet=False, ping=False)
+
+@patch('core.binance_governor.time.time', return_value=6_000_030.0)
+class BinanceGovernorTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_estimate_weight(self, _):
+        from .binance_governor import estimate_weight
+        base = 'https://api.binance.com/api/v3/'
+        self.assertEqual(estimate_weight('get', base + 'openOrders', 'timestamp=1&signature=x'), (80, False))
+        self.assertEqual(estimate_weight('get', base + 'openOrders', 'symbol=BTCUSDT&timestamp=1'), (6, False))
+        self.assertEqual(estimate_weight('post', base + 'order', 'symbol=BTCUSDT'), (1, True))
+
+    @patch('core.binance_governor.time.sleep')
+    def test_low_priority_yields_before_orders(self, mock_sleep, _):
+        from .binance_governor import BinanceWeightGovernor, BinanceRateLimited, LOW, HIGH
+        governor = BinanceWeightGovernor(weight_limit=100, max_wait={LOW: 1, HIGH: 1})
+        governor.acquire(50, LOW)
+        with self.assertRaises(BinanceRateLimited):
+            governor.acquire(10, LOW)
+        governor.acquire(40, HIGH, account='conta', is_order=True)
+        mock_sleep.assert_not_called()
+
+    def test_response_headers_and_retry_after_are_shared(self, _):
+        from binance.exceptions import BinanceAPIException
+        from .binance_governor import GovernedClient, BinanceRateLimited, binance_governor, WEIGHT_KEY
+        from django.core.cache import cache
+        response = MagicMock(status_code=200, text='{"serverTime": 1}', headers={'X-MBX-USED-WEIGHT-1M': '4000'})
+        response.json.return_value = {'serverTime': 1}
+        with patch('requests.Session.request', return_value=response) as mock_request:
+            GovernedClient(ping=False).get_server_time()
+            self.assertEqual(cache.get(WEIGHT_KEY.format(window=100_000)), 4000)
+
+            response.status_code, response.headers = 429, {'Retry-After': '120'}
+            with self.assertRaises(BinanceAPIException):
+                GovernedClient(ping=False).get_server_time()
+            with self.assertRaises(BinanceRateLimited):
+                binance_governor.acquire(1)
+            self.assertEqual(mock_request.call_count, 2)
+
+class GeminiClientTests(TestCase):
+    def test_session_is_pooled_with_retries(self):
+        from .gemini import GeminiClient
+        client = GeminiClient(pool_size=8, retries=2, backoff=0.5)
+        self.assertIs(client.session, client.session)
+        adapter = client.session.get_adapter('https://generativelanguage.googleapis.com/')
+        self.assertEqual(adapter._pool_maxsize, 8)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertIn('POST', adapter.max_retries.allowed_methods)
+        self.assertEqual(adapter.max_retries.read, 0)
+
+    def test_read_timeout_is_not_retried(self):
+        import requests
+        from urllib3.exceptions import ReadTimeoutError
+        from .gemini import GeminiClient
+        client = GeminiClient(retries=3, backoff=0)
+        with patch('urllib3.connectionpool.HTTPConnectionPool._make_request',
+                   side_effect=ReadTimeoutError(None, '/', 'read timed out')) as mock_request:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                client.generate('gemini-2.0-flash', 'secret-key', {'contents': []}, read_timeout=1)
+        self.assertEqual(mock_request.call_count, 1)
+
+    def test_generate_sends_key_in_header_with_split_timeouts(self):
+        import json
+        from .gemini import GeminiClient
+        client = GeminiClient(connect_timeout=3)
+        response = MagicMock()
+        response.json.return_value = {'candidates': [{'content': {'parts': [{'text': json.dumps({'ok': True})}]}}]}
+        with patch.object(client.session, 'post', return_value=response) as mock_post:
+            self.assertEqual(client.generate_json('gemini-2.0-flash', 'secret-key', {'contents': []}, read_timeout=20), {'ok': True})
+        url = mock_post.call_args.args[0]
+        self.assertNotIn('secret-key', url)
+        self.assertTrue(url.endswith('/models/gemini-2.0-flash:generateContent'))
+        self.assertEqual(mock_post.call_args.kwargs['headers'], {'x-goog-api-key': 'secret-key'})
+        self.assertEqual(mock_post.call_args.kwargs['timeout'], (3, 20))
@@ -9,12 +9,11 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 import csv
 from django.http import HttpResponse, JsonResponse
 import requests
-import time
 import json
 import datetime
 from django.db import transaction as db_transaction
 from django.db.models import Sum, Q
-from decimal import Decimal, ROUND_DOWN, InvalidOperation
+from decimal import Decimal, InvalidOperation
 
 from .forms import (
     CustomUserCreationForm, CustomAuthenticationForm, UserProfileAPIForm,
@@ -24,8 +23,14 @@ from .models import (
     Cryptocurrency, UserProfile, Holding, Transaction, 
     ExchangeRate, PortfolioSnapshot, BASE_RATE_CURRENCY
 )
+from .price_cache import PriceCache, bulk_update_prices
+from .klines import KlineStore
+from .binance_clients import binance_clients
+from .binance_governor import LOW, binance_priority
+from .gemini import gemini_client
+from .symbol_rules import symbol_rules, adjust_quantity_to_lot_size, adjust_price_to_tick_size
 from binance.client import Client 
-from binance.exceptions import BinanceAPIException
+from binance.exceptions import BinanceAPIException, BinanceRequestException
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.throttling import UserRateThrottle
@@ -40,7 +45,9 @@ logger = logging.getLogger(__name__)
 
 def get_binance_client(user_profile=None):
     """
-    Função centralizada para criar um cliente Binance com o tempo sincronizado.
+    Função centralizada para obter um cliente Binance com o tempo sincronizado.
+    Os clientes vêm do registro do processo (core.binance_clients): a sessão HTTP e o desvio de
+    relógio são reaproveitados entre chamadas com a mesma credencial.
     """
     api_key, api_secret, testnet = None, None, True 
 
@@ -54,30 +61,7 @@ def get_binance_client(user_profile=None):
     if not api_key: api_key = settings.BINANCE_API_KEY
     if not api_secret: api_secret = settings.BINANCE_API_SECRET
 
-    client = Client(api_key, api_secret, tld='com', testnet=testnet)
-    
-    try:
-        server_time = client.get_server_time()
-        time_offset = server_time['serverTime'] - int(time.time() * 1000)
-        client.timestamp_offset = time_offset
-    except requests.exceptions.RequestException as e:
-        print(f"Aviso: Não foi possível sincronizar o tempo com a Binance. Erro: {e}")
-
-    return client
-
-def adjust_quantity_to_lot_size(quantity_str, step_size_str):
-    quantity, step_size = Decimal(quantity_str), Decimal(step_size_str)
-    if step_size <= 0: return quantity.quantize(Decimal('1e-8'), rounding=ROUND_DOWN)
-    precision = len(step_size_str.rstrip('0').split('.')[1]) if '.' in step_size_str else 0
-    adjusted = (quantity / step_size).to_integral_value(rounding=ROUND_DOWN) * step_size
-    return adjusted.quantize(Decimal('1e-' + str(precision)), rounding=ROUND_DOWN)
-
-def adjust_price_to_tick_size(price_str, tick_size_str):
-    price, tick_size = Decimal(price_str), Decimal(tick_size_str)
-    if tick_size <= 0: return price
-    precision = len(tick_size_str.rstrip('0').split('.')[1]) if '.' in tick_size_str else 0
-    quotient = (price / tick_size).to_integral_value(rounding=ROUND_DOWN)
-    return (quotient * tick_size).quantize(Decimal('1e-' + str(precision)))
+    return binance_clients.get(api_key, api_secret, testnet)
 
 def _create_todays_snapshot(user_profile):
     """
@@ -97,10 +81,12 @@ def _create_todays_snapshot(user_profile):
         return
 
     total_portfolio_value = Decimal('0.0')
-    holdings = Holding.objects.filter(user_profile=user_profile, quantity__gt=0)
+    holdings = Holding.objects.filter(user_profile=user_profile, quantity__gt=0).select_related('cryptocurrency')
+    quotes = PriceCache().get_many(h.cryptocurrency for h in holdings)
     for holding in holdings:
-        if holding.current_market_value is not None:
-            total_portfolio_value += holding.current_market_value * rate_to_pref_currency
+        price = quotes[holding.cryptocurrency.symbol].price
+        if price is not None:
+            total_portfolio_value += holding.quantity * price * rate_to_pref_currency
     
     PortfolioSnapshot.objects.update_or_create(
         user_profile=user_profile,
@@ -216,28 +202,23 @@ def _process_successful_order(user_profile, order_response, crypto, signal=None)
 
 
 def _update_crypto_prices_for_profile(user_profile):
-    client = get_binance_client()
-    if not client:
-        print("Não foi possível criar um cliente Binance genérico para atualizar os preços.")
-        return
-
-    held_cryptos = Cryptocurrency.objects.filter(held_by_users__user_profile=user_profile).distinct()
+    """
+    Sincroniza o current_price das criptos do usuário com as cotações do PriceCache
+    (sem chamadas à Binance; cotações velhas disparam a revalidação em segundo plano).
+    """
+    held_cryptos = list(Cryptocurrency.objects.filter(held_by_users__user_profile=user_profile).distinct())
     
-    if not held_cryptos.exists():
+    if not held_cryptos:
         print("Nenhuma posse encontrada para atualizar preços.")
         return
 
-    print(f"Atualizando preços para {held_cryptos.count()} criptos de {user_profile.user.username}...")
-    for crypto in held_cryptos:
-        api_symbol_pair = f"{crypto.symbol.upper()}{crypto.price_currency.upper()}"
-        try:
-            ticker_data = client.get_ticker(symbol=api_symbol_pair)
-            if ticker_data and 'lastPrice' in ticker_data:
-                crypto.current_price = Decimal(ticker_data['lastPrice'])
-                crypto.last_updated = timezone.now()
-                crypto.save(update_fields=['current_price', 'last_updated'])
-        except (BinanceAPIException, InvalidOperation) as e:
-            print(f"Erro ao atualizar o preço para {api_symbol_pair}: {e}")
+    quotes = PriceCache().get_many(held_cryptos)
+    fresh_prices = {
+        f"{crypto.symbol.upper()}{crypto.price_currency.upper()}": quotes[crypto.symbol].price
+        for crypto in held_cryptos if not quotes[crypto.symbol].is_stale
+    }
+    updated_count, _ = bulk_update_prices(held_cryptos, fresh_prices)
+    print(f"Preços atualizados para {updated_count} de {len(held_cryptos)} criptos de {user_profile.user.username}.")
 
 
 # --- Views ---
@@ -275,14 +256,16 @@ def dashboard_view(request):
     exchange_rates = {rate.to_currency: rate.rate for rate in ExchangeRate.objects.filter(from_currency=BASE_RATE_CURRENCY)}
     exchange_rates[BASE_RATE_CURRENCY] = Decimal('1.0')
     rate_to_pref_currency = exchange_rates.get(pref_currency)
+    quotes = PriceCache().get_many(h.cryptocurrency for h in holdings_list)
     enriched_holdings, pie_chart_data, total_portfolio_value = [], {'labels': [], 'data': []}, Decimal('0.0')
     if rate_to_pref_currency:
         for holding in holdings_list:
-            current_value_pref = (holding.current_market_value or 0) * rate_to_pref_currency
+            current_price = quotes[holding.cryptocurrency.symbol].price or 0
+            current_value_pref = holding.quantity * current_price * rate_to_pref_currency
             total_portfolio_value += current_value_pref
             cost_basis_pref = (holding.cost_basis or 0) * rate_to_pref_currency
             avg_buy_price_pref = (holding.average_buy_price or 0) * rate_to_pref_currency
-            current_price_pref = (holding.cryptocurrency.current_price or 0) * rate_to_pref_currency
+            current_price_pref = current_price * rate_to_pref_currency
             profit_loss_pref, profit_loss_percent = None, None
             if current_value_pref > 0 and cost_basis_pref > 0:
                 profit_loss_pref = current_value_pref - cost_basis_pref
@@ -305,10 +288,12 @@ def reports_view(request):
     exchange_rates = {rate.to_currency: rate.rate for rate in ExchangeRate.objects.filter(from_currency=BASE_RATE_CURRENCY)}
     exchange_rates[BASE_RATE_CURRENCY] = Decimal('1.0')
     rate_to_pref_currency = exchange_rates.get(pref_currency)
+    quotes = PriceCache().get_many(h.cryptocurrency for h in holdings)
     total_current_value, total_cost_basis = Decimal('0.0'), Decimal('0.0')
     if rate_to_pref_currency:
         for holding in holdings:
-            if holding.current_market_value is not None: total_current_value += holding.current_market_value * rate_to_pref_currency
+            current_price = quotes[holding.cryptocurrency.symbol].price
+            if current_price is not None: total_current_value += holding.quantity * current_price * rate_to_pref_currency
             if holding.cost_basis is not None: total_cost_basis += holding.cost_basis * rate_to_pref_currency
     else:
         messages.warning(request, f"Taxa de câmbio para {pref_currency} não encontrada. Os valores podem estar incorretos.")
@@ -350,42 +335,31 @@ def recalculate_holdings_view(request):
 
 @login_required
 def cryptocurrency_list_view(request):
-    client = get_binance_client()
     cryptos_from_db = Cryptocurrency.objects.all().order_by('name')
-    enriched_cryptos_data = []
-    if client:
-        for crypto in cryptos_from_db:
-            data = {'db_instance': crypto}
-            try:
-                ticker_24h = client.get_ticker(symbol=f"{crypto.symbol.upper()}{crypto.price_currency.upper()}")
-                data.update({'price_change_percent_24h': Decimal(ticker_24h.get('priceChangePercent', '0'))})
-            except BinanceAPIException:
-                data.update({'price_change_percent_24h': None})
-            enriched_cryptos_data.append(data)
-    else:
-         messages.error(request, "Não foi possível conectar à Binance para obter dados de mercado.")
-
-    paginator = Paginator(enriched_cryptos_data, 20)
+    paginator = Paginator(cryptos_from_db, 20)
     page_number = request.GET.get('page')
     cryptocurrencies_page = paginator.get_page(page_number)
+
+    quotes = PriceCache().get_many(cryptocurrencies_page.object_list)
+    cryptocurrencies_page.object_list = [
+        {'db_instance': crypto, 'current_price': quotes[crypto.symbol].price, 'price_change_percent_24h': quotes[crypto.symbol].change_percent_24h}
+        for crypto in cryptocurrencies_page.object_list
+    ]
     return render(request, 'core/cryptocurrency_list.html', {'page_title': 'Lista de Criptomoedas', 'cryptocurrencies_page': cryptocurrencies_page})
 
 @login_required
 def cryptocurrency_detail_view(request, symbol):
     crypto = get_object_or_404(Cryptocurrency, symbol__iexact=symbol)
     klines_data_json, chart_error_message = "[]", None
-    client = get_binance_client(user_profile=request.user.profile)
-    if client:
-        try:
-            api_symbol_pair = f"{crypto.symbol.upper()}{crypto.price_currency.upper()}"
-            klines = client.get_historical_klines(api_symbol_pair, Client.KLINE_INTERVAL_1DAY, "90 days ago UTC")
-            if klines:
-                klines_data = {'labels': [datetime.datetime.fromtimestamp(k[0]/1000, tz=datetime.timezone.utc).strftime('%Y-%m-%d') for k in klines], 'data': [str(Decimal(k[4])) for k in klines], 'currency': crypto.price_currency}
-                klines_data_json = json.dumps(klines_data)
-        except BinanceAPIException as e:
-            chart_error_message = f"Erro ao buscar dados do gráfico: {e.message}"
-    else:
-        chart_error_message = "Chaves API não configuradas ou inválidas."
+    try:
+        api_symbol_pair = f"{crypto.symbol.upper()}{crypto.price_currency.upper()}"
+        start_ms = int((timezone.now() - datetime.timedelta(days=90)).timestamp() * 1000)
+        klines = KlineStore().fetch(api_symbol_pair, Client.KLINE_INTERVAL_1DAY, start_ms)
+        if klines:
+            klines_data = {'labels': [datetime.datetime.fromtimestamp(k[0]/1000, tz=datetime.timezone.utc).strftime('%Y-%m-%d') for k in klines], 'data': [str(Decimal(k[4])) for k in klines], 'currency': crypto.price_currency}
+            klines_data_json = json.dumps(klines_data)
+    except (BinanceAPIException, requests.exceptions.RequestException) as e:
+        chart_error_message = f"Erro ao buscar dados do gráfico: {getattr(e, 'message', str(e))}"
     if chart_error_message: messages.error(request, chart_error_message)
     context = {'page_title': f"Detalhes de {crypto.name}", 'crypto': crypto, 'klines_data_json': klines_data_json, 'chart_error_message': chart_error_message}
     return render(request, 'core/cryptocurrency_detail.html', context)
@@ -409,15 +383,8 @@ def explain_crypto_with_ai_view(request):
 
             prompt = f"Aja como um especialista em criptomoedas. Explique o que é {crypto_name}, qual o seu propósito principal, e um ponto positivo e um negativo sobre o projeto. Seja claro e direto, em um parágrafo."
             
-            api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={gemini_api_key}"
-            headers = {'Content-Type': 'application/json'}
             payload = {'contents': [{'parts': [{'text': prompt}]}]}
-
-            response = requests.post(api_url, headers=headers, json=payload, timeout=20)
-            response.raise_for_status()
-            
-            result = response.json()
-            explanation = result['candidates'][0]['content']['parts'][0]['text']
+            explanation = gemini_client.generate(model_name, gemini_api_key, payload, read_timeout=20)
             
             return JsonResponse({'explanation': explanation})
 
@@ -449,12 +416,13 @@ def open_orders_view(request):
         return redirect('core:open_orders')
     processed_orders = []
     try:
-        open_orders = client.get_open_orders()
+        with binance_priority(LOW):
+            open_orders = client.get_open_orders()
         for order in open_orders:
             order['time_dt'] = datetime.datetime.fromtimestamp(order['time'] / 1000, tz=datetime.timezone.utc)
             order['total_value'] = Decimal(order['price']) * Decimal(order['origQty'])
             processed_orders.append(order)
-    except BinanceAPIException as e:
+    except (BinanceAPIException, BinanceRequestException) as e:
         messages.error(request, f"Erro ao buscar ordens: {e.message}")
     return render(request, 'core/open_orders.html', {'page_title': 'Minhas Ordens Abertas', 'open_orders': processed_orders})
 
@@ -494,6 +462,7 @@ def add_transaction_view(request):
 
 @login_required
 @db_transaction.atomic
+@binance_priority(LOW)
 def sync_binance_trades_view(request):
     user_profile = get_object_or_404(UserProfile, user=request.user)
     client = get_binance_client(user_profile=user_profile)
@@ -556,8 +525,6 @@ def sync_binance_trades_view(request):
                 if len(trades) < 1000:
                     print(f"Fim do histórico para {api_symbol} alcançado.")
                     break
-                
-                time.sleep(0.5)
 
             except BinanceAPIException as e:
                 if e.code != -1121:
@@ -593,9 +560,7 @@ def trade_market_buy_view(request):
         try:
             params = {'symbol': api_symbol}
             if form.cleaned_data['buy_type'] == 'QUANTITY':
-                quantity, symbol_info = form.cleaned_data['quantity'], client.get_symbol_info(api_symbol)
-                lot_size_filter = next((f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'), None)
-                if lot_size_filter: quantity = adjust_quantity_to_lot_size(str(quantity), lot_size_filter['stepSize'])
+                quantity = symbol_rules.get(api_symbol, client, user_profile.use_testnet).adjust_quantity(form.cleaned_data['quantity'])
                 params['quantity'] = f'{quantity:.8f}'.rstrip('0').rstrip('.')
             else: params['quoteOrderQty'] = form.cleaned_data['quote_quantity']
             order = client.order_market_buy(**params)
@@ -616,13 +581,13 @@ def trade_market_sell_view(request):
             quantity_to_sell = Decimal('0')
             if form.cleaned_data['sell_type'] == 'QUANTITY': quantity_to_sell = form.cleaned_data['quantity']
             else:
-                ticker, price = client.get_symbol_ticker(symbol=api_symbol), Decimal(client.get_symbol_ticker(symbol=api_symbol)['price'])
+                # Dimensiona a ordem com a cotação atual da Binance, não com o PriceCache (que pode estar velho).
+                price = Decimal(client.get_symbol_ticker(symbol=api_symbol)['price'])
                 if price > 0: quantity_to_sell = form.cleaned_data['quote_quantity_to_receive'] / price
                 else: raise ValueError("Preço de mercado inválido.")
             holding = Holding.objects.get(user_profile=user_profile, cryptocurrency=crypto)
             if holding.quantity < quantity_to_sell: raise ValueError("Saldo insuficiente.")
-            symbol_info, lot_size_filter = client.get_symbol_info(api_symbol), next((f for f in client.get_symbol_info(api_symbol)['filters'] if f['filterType'] == 'LOT_SIZE'), None)
-            if lot_size_filter: quantity_to_sell = adjust_quantity_to_lot_size(str(quantity_to_sell), lot_size_filter['stepSize'])
+            quantity_to_sell = symbol_rules.get(api_symbol, client, user_profile.use_testnet).adjust_quantity(quantity_to_sell)
             if quantity_to_sell <= 0: raise ValueError("Quantidade a vender deve ser maior que zero.")
             order = client.order_market_sell(symbol=api_symbol, quantity=f'{quantity_to_sell:.8f}'.rstrip('0').rstrip('.'))
             _process_successful_order(user_profile, order, crypto)
@@ -644,10 +609,10 @@ def trade_limit_buy_view(request):
                 rate_obj = ExchangeRate.objects.get(from_currency=crypto.price_currency, to_currency=user_profile.preferred_fiat_currency)
                 price_in_base_currency = price_in_user_currency / rate_obj.rate
             quantity = form.cleaned_data['quantity'] if form.cleaned_data['order_type'] == 'QUANTITY' else form.cleaned_data['total_value'] / price_in_user_currency
-            symbol_info = client.get_symbol_info(api_symbol)
-            price_in_base_currency = adjust_price_to_tick_size(str(price_in_base_currency), next(f['tickSize'] for f in symbol_info['filters'] if f['filterType'] == 'PRICE_FILTER'))
-            quantity = adjust_quantity_to_lot_size(str(quantity), next(f['stepSize'] for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'))
+            rules = symbol_rules.get(api_symbol, client, user_profile.use_testnet)
+            price_in_base_currency, quantity = rules.adjust_price(price_in_base_currency), rules.adjust_quantity(quantity)
             if quantity <= 0: raise ValueError("A quantidade final deve ser maior que zero.")
+            rules.check_notional(quantity, price_in_base_currency)
             order = client.order_limit_buy(symbol=api_symbol, quantity=f'{quantity:.8f}'.rstrip('0').rstrip('.'), price=f'{price_in_base_currency:.8f}'.rstrip('0').rstrip('.'))
             messages.success(request, f"Ordem limite de COMPRA enviada! ID: {order['orderId']}")
             return redirect('core:open_orders')
@@ -667,10 +632,10 @@ def trade_limit_sell_view(request):
                 rate_obj = ExchangeRate.objects.get(from_currency=crypto.price_currency, to_currency=user_profile.preferred_fiat_currency)
                 price_in_base_currency = price_in_user_currency / rate_obj.rate
             quantity = form.cleaned_data['quantity'] if form.cleaned_data['order_type'] == 'QUANTITY' else form.cleaned_data['total_value'] / price_in_user_currency
-            symbol_info = client.get_symbol_info(api_symbol)
-            price_in_base_currency = adjust_price_to_tick_size(str(price_in_base_currency), next(f['tickSize'] for f in symbol_info['filters'] if f['filterType'] == 'PRICE_FILTER'))
-            quantity = adjust_quantity_to_lot_size(str(quantity), next(f['stepSize'] for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'))
+            rules = symbol_rules.get(api_symbol, client, user_profile.use_testnet)
+            price_in_base_currency, quantity = rules.adjust_price(price_in_base_currency), rules.adjust_quantity(quantity)
             if quantity <= 0: raise ValueError("A quantidade final deve ser maior que zero.")
+            rules.check_notional(quantity, price_in_base_currency)
             order = client.order_limit_sell(symbol=api_symbol, quantity=f'{quantity:.8f}'.rstrip('0').rstrip('.'), price=f'{price_in_base_currency:.8f}'.rstrip('0').rstrip('.'))
             messages.success(request, f"Ordem limite de VENDA enviada! ID: {order['orderId']}")
             return redirect('core:open_orders')
@@ -712,12 +677,13 @@ def open_orders_view(request):
         return redirect('core:open_orders')
     processed_orders = []
     try:
-        open_orders = client.get_open_orders()
+        with binance_priority(LOW):
+            open_orders = client.get_open_orders()
         for order in open_orders:
             order['time_dt'] = datetime.datetime.fromtimestamp(order['time'] / 1000, tz=datetime.timezone.utc)
             order['total_value'] = Decimal(order['price']) * Decimal(order['origQty'])
             processed_orders.append(order)
-    except BinanceAPIException as e:
+    except (BinanceAPIException, BinanceRequestException) as e:
         messages.error(request, f"Erro ao buscar ordens: {e.message}")
     return render(request, 'core/open_orders.html', {'page_title': 'Minhas Ordens Abertas', 'open_orders': processed_orders})
 
@@ -757,6 +723,7 @@ def add_transaction_view(request):
 
 @login_required
 @db_transaction.atomic
+@binance_priority(LOW)
 def sync_binance_trades_view(request):
     user_profile = get_object_or_404(UserProfile, user=request.user)
     client = get_binance_client(user_profile=user_profile)
@@ -819,8 +786,6 @@ def sync_binance_trades_view(request):
                 if len(trades) < 1000:
                     print(f"Fim do histórico para {api_symbol} alcançado.")
                     break
-                
-                time.sleep(0.5)
 
             except BinanceAPIException as e:
                 if e.code != -1121:
@@ -856,9 +821,7 @@ def trade_market_buy_view(request):
         try:
             params = {'symbol': api_symbol}
             if form.cleaned_data['buy_type'] == 'QUANTITY':
-                quantity, symbol_info = form.cleaned_data['quantity'], client.get_symbol_info(api_symbol)
-                lot_size_filter = next((f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'), None)
-                if lot_size_filter: quantity = adjust_quantity_to_lot_size(str(quantity), lot_size_filter['stepSize'])
+                quantity = symbol_rules.get(api_symbol, client, user_profile.use_testnet).adjust_quantity(form.cleaned_data['quantity'])
                 params['quantity'] = f'{quantity:.8f}'.rstrip('0').rstrip('.')
             else: params['quoteOrderQty'] = form.cleaned_data['quote_quantity']
             order = client.order_market_buy(**params)
@@ -879,13 +842,13 @@ def trade_market_sell_view(request):
             quantity_to_sell = Decimal('0')
             if form.cleaned_data['sell_type'] == 'QUANTITY': quantity_to_sell = form.cleaned_data['quantity']
             else:
-                ticker, price = client.get_symbol_ticker(symbol=api_symbol), Decimal(client.get_symbol_ticker(symbol=api_symbol)['price'])
+                # Dimensiona a ordem com a cotação atual da Binance, não com o PriceCache (que pode estar velho).
+                price = Decimal(client.get_symbol_ticker(symbol=api_symbol)['price'])
                 if price > 0: quantity_to_sell = form.cleaned_data['quote_quantity_to_receive'] / price
                 else: raise ValueError("Preço de mercado inválido.")
             holding = Holding.objects.get(user_profile=user_profile, cryptocurrency=crypto)
             if holding.quantity < quantity_to_sell: raise ValueError("Saldo insuficiente.")
-            symbol_info, lot_size_filter = client.get_symbol_info(api_symbol), next((f for f in client.get_symbol_info(api_symbol)['filters'] if f['filterType'] == 'LOT_SIZE'), None)
-            if lot_size_filter: quantity_to_sell = adjust_quantity_to_lot_size(str(quantity_to_sell), lot_size_filter['stepSize'])
+            quantity_to_sell = symbol_rules.get(api_symbol, client, user_profile.use_testnet).adjust_quantity(quantity_to_sell)
             if quantity_to_sell <= 0: raise ValueError("Quantidade a vender deve ser maior que zero.")
             order = client.order_market_sell(symbol=api_symbol, quantity=f'{quantity_to_sell:.8f}'.rstrip('0').rstrip('.'))
             _process_successful_order(user_profile, order, crypto)
@@ -907,10 +870,10 @@ def trade_limit_buy_view(request):
                 rate_obj = ExchangeRate.objects.get(from_currency=crypto.price_currency, to_currency=user_profile.preferred_fiat_currency)
                 price_in_base_currency = price_in_user_currency / rate_obj.rate
             quantity = form.cleaned_data['quantity'] if form.cleaned_data['order_type'] == 'QUANTITY' else form.cleaned_data['total_value'] / price_in_user_currency
-            symbol_info = client.get_symbol_info(api_symbol)
-            price_in_base_currency = adjust_price_to_tick_size(str(price_in_base_currency), next(f['tickSize'] for f in symbol_info['filters'] if f['filterType'] == 'PRICE_FILTER'))
-            quantity = adjust_quantity_to_lot_size(str(quantity), next(f['stepSize'] for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'))
+            rules = symbol_rules.get(api_symbol, client, user_profile.use_testnet)
+            price_in_base_currency, quantity = rules.adjust_price(price_in_base_currency), rules.adjust_quantity(quantity)
             if quantity <= 0: raise ValueError("A quantidade final deve ser maior que zero.")
+            rules.check_notional(quantity, price_in_base_currency)
             order = client.order_limit_buy(symbol=api_symbol, quantity=f'{quantity:.8f}'.rstrip('0').rstrip('.'), price=f'{price_in_base_currency:.8f}'.rstrip('0').rstrip('.'))
             messages.success(request, f"Ordem limite de COMPRA enviada! ID: {order['orderId']}")
             return redirect('core:open_orders')
@@ -930,10 +893,10 @@ def trade_limit_sell_view(request):
                 rate_obj = ExchangeRate.objects.get(from_currency=crypto.price_currency, to_currency=user_profile.preferred_fiat_currency)
                 price_in_base_currency = price_in_user_currency / rate_obj.rate
             quantity = form.cleaned_data['quantity'] if form.cleaned_data['order_type'] == 'QUANTITY' else form.cleaned_data['total_value'] / price_in_user_currency
-            symbol_info = client.get_symbol_info(api_symbol)
-            price_in_base_currency = adjust_price_to_tick_size(str(price_in_base_currency), next(f['tickSize'] for f in symbol_info['filters'] if f['filterType'] == 'PRICE_FILTER'))
-            quantity = adjust_quantity_to_lot_size(str(quantity), next(f['stepSize'] for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'))
+            rules = symbol_rules.get(api_symbol, client, user_profile.use_testnet)
+            price_in_base_currency, quantity = rules.adjust_price(price_in_base_currency), rules.adjust_quantity(quantity)
             if quantity <= 0: raise ValueError("A quantidade final deve ser maior que zero.")
+            rules.check_notional(quantity, price_in_base_currency)
             order = client.order_limit_sell(symbol=api_symbol, quantity=f'{quantity:.8f}'.rstrip('0').rstrip('.'), price=f'{price_in_base_currency:.8f}'.rstrip('0').rstrip('.'))
             messages.success(request, f"Ordem limite de VENDA enviada! ID: {order['orderId']}")
             return redirect('core:open_orders')
@@ -87,6 +87,46 @@ BINANCE_API_KEY = os.environ.get('BINANCE_API_KEY')
 BINANCE_API_SECRET = os.environ.get('BINANCE_API_SECRET')
 BINANCE_TESTNET = os.environ.get('BINANCE_TESTNET', 'False').lower() in ['true', '1', 't']
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+NEWS_API_KEY = os.environ.get('NEWS_API_KEY')
+# Moedas acompanhadas pelo agente (sentimento e ciclo de decisão, todas numa única chamada em lote por
+# grupo de perfis). Vazio = todas as criptomoedas cadastradas.
+TRADING_AGENT_SYMBOLS = env.list('TRADING_AGENT_SYMBOLS', default=['BTC', 'ETH'])
+# Ciclo de decisão (trading_agent.tasks.run_trading_cycle_for_all_users): chamadas simultâneas ao Gemini,
+# fichas por minuto de cada chave de API (trading_agent.rate_limit) e prazo do ciclo, abaixo do intervalo do beat.
+GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', 16))
+GEMINI_REQUESTS_PER_MINUTE = int(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 10))
+GEMINI_CYCLE_DEADLINE_SECONDS = 10 * 60
+# Cliente HTTP do Gemini (core.gemini): conexões mantidas vivas por processo (acompanha a concorrência acima
+# e as threads do gunicorn), tentativas extras em 429/5xx, fator do backoff (s) e timeout de conexão (s).
+GEMINI_HTTP_POOL_SIZE = GEMINI_MAX_CONCURRENCY
+GEMINI_HTTP_RETRIES = 3
+GEMINI_HTTP_BACKOFF = 1.0
+GEMINI_CONNECT_TIMEOUT = 5
+# Registro de clientes Binance (core.binance_clients): ociosidade até o descarte, validade do
+# desvio de relógio medido com get_server_time() e número máximo de clientes por processo.
+BINANCE_CLIENT_IDLE_SECONDS = 600
+BINANCE_TIME_OFFSET_REFRESH_SECONDS = 300
+BINANCE_CLIENT_POOL_SIZE = 256
+# Orçamento de peso da Binance (core.binance_governor), compartilhado via cache por web e workers:
+# peso por minuto e ordens por 10s da Binance, fração do limite por prioridade e espera máxima (s).
+BINANCE_WEIGHT_LIMIT_PER_MINUTE = int(os.environ.get('BINANCE_WEIGHT_LIMIT_PER_MINUTE', 6000))
+BINANCE_ORDER_LIMIT_PER_10S = 100
+BINANCE_WEIGHT_SHARE = {'LOW': 0.5, 'NORMAL': 0.8, 'HIGH': 0.95}
+BINANCE_GOVERNOR_MAX_WAIT = {'LOW': 60, 'NORMAL': 15, 'HIGH': 5}
+# Índice de regras dos pares (core.symbol_rules): releitura do cache pelo processo e validade do índice no cache.
+SYMBOL_RULES_LOCAL_SECONDS = 300
+SYMBOL_RULES_ENTRY_TTL = 6 * 3600
+# Candles locais (core.klines): por quanto tempo um intervalo que a Binance não tem (antes da listagem
+# do par ou buraco da corretora) deixa de ser pedido de novo.
+KLINE_CHECKED_RANGES_TTL = 30 * 24 * 3600
+
+# --- Criptografia das credenciais dos usuários (core.encryption) ---
+# Para rotacionar: defina a nova chave em DJANGO_FIELD_ENCRYPTION_KEY, mova a anterior para
+# DJANGO_FIELD_ENCRYPTION_OLD_KEYS (separadas por vírgula) e rode `manage.py reencrypt_secrets`.
+FIELD_ENCRYPTION_KEY = env('DJANGO_FIELD_ENCRYPTION_KEY', default='')
+FIELD_ENCRYPTION_OLD_KEYS = env.list('DJANGO_FIELD_ENCRYPTION_OLD_KEYS', default=[])
+# Segundos que um segredo decifrado fica em memória por perfil (0 desativa).
+FIELD_ENCRYPTION_SECRET_CACHE_SECONDS = 60
 
 LOGIN_URL, LOGIN_REDIRECT_URL, LOGOUT_REDIRECT_URL = 'core:login', 'core:dashboard', 'core:index'
 
@@ -105,6 +145,8 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'core.tasks.update_all_cryptocurrency_prices', 'schedule': 60.0, },
     'update-exchange-rates-every-minute': {
         'task': 'core.tasks.update_exchange_rates', 'schedule': 60.0, },
+    'refresh-symbol-rules-every-hour': {
+        'task': 'core.tasks.refresh_symbol_rules', 'schedule': crontab(minute=30, hour='*'), },
     'create-daily-snapshots': {
         'task': 'core.tasks.create_daily_portfolio_snapshots', 'schedule': crontab(hour=23, minute=55), },
     'calculate-indicators-every-hour': {
@@ -129,6 +171,22 @@ CELERY_BEAT_SCHEDULE = {
     },
 }
 
+# --- Cache de decisões da IA nos backtests (trading_agent.decision_cache) ---
+DECISION_CACHE_PATH = os.environ.get('DECISION_CACHE_PATH', os.path.join(BASE_DIR, 'backtest_decisions.sqlite3'))
+
+# --- Artefatos de backtest (trading_agent.artifacts) ---
+BACKTEST_ARTIFACTS_DIR = os.environ.get('BACKTEST_ARTIFACTS_DIR', os.path.join(BASE_DIR, 'backtest_artifacts'))
+# Cache de resultados de simulações idênticas (trading_agent.result_cache): entradas mantidas (LRU) e TTL em segundos.
+BACKTEST_RESULT_CACHE_SIZE = int(os.environ.get('BACKTEST_RESULT_CACHE_SIZE', 256))
+BACKTEST_RESULT_CACHE_TTL = 2 * 24 * 3600
+# Andamento por long polling (trading_agent.views.backtest_progress_view): pedidos segurados ao mesmo tempo
+# por processo do gunicorn (--threads 8); os excedentes respondem na hora e o navegador repete depois.
+BACKTEST_PROGRESS_MAX_LONG_POLLS = 4
+
+# --- Cache de Preços (core.price_cache) ---
+PRICE_CACHE_FRESH_SECONDS = int(os.environ.get('PRICE_CACHE_FRESH_SECONDS', 30))
+PRICE_CACHE_ENTRY_TTL = int(os.environ.get('PRICE_CACHE_ENTRY_TTL', 600))
+
 # --- Trading Agent Settings ---
 AGENT_BUY_RISK_PERCENTAGE = Decimal('0.05')
 AGENT_SELL_RISK_PERCENTAGE = Decimal('1.0')
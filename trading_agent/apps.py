@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TradingAgentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trading_agent'
+
+    def ready(self):
+        import trading_agent.signals
@@ -0,0 +1,78 @@
+# trading_agent/artifacts.py
+"""
+Artefatos de backtest: curva de patrimônio, drawdown e lista de trades gravados em colunas num
+arquivo `.npz` (BACKTEST_ARTIFACTS_DIR), referenciado por BacktestReport.artifact. As métricas de
+risco são calculadas uma vez, de forma vetorizada, e guardadas em BacktestReport.metrics.
+"""
+import os
+
+import numpy as np
+from django.conf import settings
+
+SIDE_CODES = {'BUY': 1, 'SELL': -1}
+# Candles diários de cripto: o mercado não fecha.
+PERIODS_PER_YEAR = 365
+
+
+def artifacts_dir():
+    return getattr(settings, 'BACKTEST_ARTIFACTS_DIR', os.path.join(settings.BASE_DIR, 'backtest_artifacts'))
+
+
+def _ratio(numerator, denominator, periods_per_year):
+    return round(float(numerator / denominator * np.sqrt(periods_per_year)), 4) if denominator > 0 else None
+
+
+def compute_metrics(equity, exposed=None, trade_pnl=None, trade_sides=None, periods_per_year=PERIODS_PER_YEAR):
+    """Devolve (métricas, série de drawdown em %). Sharpe e Sortino são anualizados, sem taxa livre de risco."""
+    equity = np.asarray(equity, dtype=float)
+    peaks = np.maximum.accumulate(equity)
+    drawdown = np.where(peaks > 0, (peaks - equity) / peaks * 100, 0.0)
+    returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.zeros(0)
+
+    metrics = {'sharpe': None, 'sortino': None, 'max_drawdown_percent': round(float(drawdown.max()), 2) if len(drawdown) else 0.0,
+               'exposure_percent': None, 'win_rate_percent': None}
+    if len(returns) > 1:
+        metrics['sharpe'] = _ratio(returns.mean(), returns.std(ddof=1), periods_per_year)
+        metrics['sortino'] = _ratio(returns.mean(), np.sqrt(np.mean(np.minimum(returns, 0) ** 2)), periods_per_year)
+    if exposed is not None and len(exposed):
+        metrics['exposure_percent'] = round(float(np.mean(exposed) * 100), 2)
+    if trade_pnl is not None:
+        sells = np.asarray(trade_sides) == SIDE_CODES['SELL']
+        if sells.any():
+            metrics['win_rate_percent'] = round(float(np.mean(np.asarray(trade_pnl)[sells] > 0) * 100), 2)
+    return metrics, drawdown
+
+
+def save_artifact(report, times, equity, exposed=None, trades=(), symbols=None):
+    """
+    Grava o artefato do relatório e preenche `report.artifact` e `report.metrics` (sem salvar o relatório).
+    `trades`: linhas (barra, índice do ativo em `symbols`, lado, preço, quantidade, resultado da venda).
+    """
+    trades = list(trades)
+    bar, asset, side, price, quantity, pnl = zip(*trades) if trades else ([],) * 6
+    sides = np.array([SIDE_CODES[s] for s in side], dtype=np.int8)
+    metrics, drawdown = compute_metrics(equity, exposed, np.array(pnl, dtype=float), sides)
+
+    os.makedirs(artifacts_dir(), exist_ok=True)
+    filename = f"backtest_{report.id}.npz"
+    np.savez_compressed(
+        os.path.join(artifacts_dir(), filename),
+        times=np.asarray(times, dtype=np.int64), equity=np.asarray(equity, dtype=float), drawdown=drawdown,
+        exposed=np.asarray(exposed if exposed is not None else [], dtype=bool),
+        trade_bar=np.array(bar, dtype=np.int64), trade_asset=np.array(asset, dtype=np.int32), trade_side=sides,
+        trade_price=np.array(price, dtype=float), trade_quantity=np.array(quantity, dtype=float), trade_pnl=np.array(pnl, dtype=float),
+        symbols=np.array(symbols or [report.symbol]),
+    )
+    report.artifact, report.metrics = filename, metrics
+    return metrics
+
+
+def load_artifact(report):
+    """Lê o artefato do relatório ({nome: array}) ou devolve None se ele não existir."""
+    if not report.artifact:
+        return None
+    path = os.path.join(artifacts_dir(), os.path.basename(report.artifact))
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
@@ -0,0 +1,344 @@
+# trading_agent/backtest.py
+"""
+Motor vetorizado de backtest da estratégia MACD + RSI.
+
+Os indicadores são calculados uma única vez sobre a série inteira (pandas_ta), as condições de
+entrada e saída viram máscaras NumPy e a simulação de caixa/posição percorre apenas as barras com
+sinal, usando floats. O resultado é o mesmo do laço barra a barra com Decimal usado antes.
+"""
+import itertools
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+
+from core.klines import KLINE_COLUMNS
+
+# Barras descartadas no início para o aquecimento dos indicadores (MACD 26 + sinal 9).
+WARMUP_BARS = 35
+# Caixa mínimo para abrir uma compra (mesma regra do agente).
+MIN_CASH_TO_BUY = 10.0
+
+
+@dataclass
+class BacktestResult:
+    final_value: float
+    total_trades: int
+    # Cada trade: (índice da barra, 'BUY'/'SELL', preço, quantidade de cripto, resultado da venda sobre o preço médio).
+    trades: list = field(default_factory=list)
+    equity: np.ndarray = None
+    holdings: np.ndarray = None
+
+
+def klines_to_frame(klines):
+    df = pd.DataFrame(klines, columns=KLINE_COLUMNS)
+    df.set_index(pd.to_datetime(df['time'], unit='ms'), inplace=True)
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        df[col] = pd.to_numeric(df[col])
+    return df
+
+
+def compute_indicators(close, rsi_length=14, macd_fast=12, macd_slow=26, macd_signal=9):
+    """Devolve (rsi, macd_diff) como arrays, com 0 no lugar dos valores ainda não aquecidos."""
+    close = close if isinstance(close, pd.Series) else pd.Series(close, dtype=float)
+    rsi = ta.rsi(close, length=rsi_length)
+    macd = ta.macd(close, fast=macd_fast, slow=macd_slow, signal=macd_signal)
+    macd_line = macd[f'MACD_{macd_fast}_{macd_slow}_{macd_signal}'].fillna(0).to_numpy()
+    signal_line = macd[f'MACDs_{macd_fast}_{macd_slow}_{macd_signal}'].fillna(0).to_numpy()
+    return rsi.fillna(0).to_numpy(), macd_line - signal_line
+
+
+def signal_masks(rsi, macd_diff, rsi_upper=70.0, rsi_lower=30.0, start_index=WARMUP_BARS):
+    """Máscaras de compra (cruzamento de alta do MACD com RSI < rsi_upper) e venda (cruzamento de baixa com RSI > rsi_lower)."""
+    previous = np.empty_like(macd_diff)
+    previous[0], previous[1:] = np.nan, macd_diff[:-1]
+    buy = (macd_diff > 0) & (previous <= 0) & (rsi < rsi_upper)
+    sell = (macd_diff < 0) & (previous >= 0) & (rsi > rsi_lower)
+    buy[:start_index] = sell[:start_index] = False
+    return buy, sell
+
+
+def simulate(close, buy, sell, initial_capital, buy_fraction, sell_fraction, with_equity=False):
+    """Simula caixa e posição percorrendo só as barras com sinal. As frações são em [0, 1]."""
+    close = np.asarray(close, dtype=float)
+    cash, holdings, average_cost, trades = float(initial_capital), 0.0, 0.0, []
+    event_indices = np.flatnonzero(buy | sell)
+    cash_at, holdings_at = np.empty(len(event_indices)), np.empty(len(event_indices))
+    for n, i in enumerate(event_indices.tolist()):
+        price = close[i]
+        if buy[i] and cash > MIN_CASH_TO_BUY:
+            amount = cash * buy_fraction
+            quantity = amount / price
+            average_cost = (average_cost * holdings + amount) / (holdings + quantity)
+            holdings += quantity; cash -= amount
+            trades.append((i, 'BUY', price, quantity, 0.0))
+        elif sell[i] and holdings > 0:
+            quantity = holdings * sell_fraction
+            cash += quantity * price; holdings -= quantity
+            trades.append((i, 'SELL', price, quantity, quantity * (price - average_cost)))
+        cash_at[n], holdings_at[n] = cash, holdings
+
+    result = BacktestResult(final_value=cash + holdings * close[-1], total_trades=len(trades), trades=trades)
+    if with_equity:
+        # Propaga o estado de cada evento até o próximo (forward fill por índice).
+        position = np.searchsorted(event_indices, np.arange(len(close)), side='right') - 1
+        cash_path = np.append(cash_at, float(initial_capital))[position]
+        holdings_path = np.append(holdings_at, 0.0)[position]
+        result.equity, result.holdings = cash_path + holdings_path * close, holdings_path
+    return result
+
+
+def run_strategy(close, initial_capital, buy_fraction, sell_fraction, rsi_upper=70.0, rsi_lower=30.0,
+                 macd_fast=12, macd_slow=26, macd_signal=9, with_equity=False):
+    rsi, macd_diff = compute_indicators(close, macd_fast=macd_fast, macd_slow=macd_slow, macd_signal=macd_signal)
+    buy, sell = signal_masks(rsi, macd_diff, rsi_upper, rsi_lower)
+    return simulate(close, buy, sell, initial_capital, buy_fraction, sell_fraction, with_equity=with_equity)
+
+
+# --- Varredura de parâmetros ---
+
+SWEEP_PARAMETERS = ('buy_risk_percentage', 'sell_risk_percentage', 'rsi_upper', 'rsi_lower', 'macd')
+
+
+def parameter_grid(grid):
+    """Produto cartesiano da grade {parâmetro: [valores]}, ordenado por períodos do MACD (que definem os indicadores)."""
+    values = [grid[name] for name in SWEEP_PARAMETERS]
+    combinations = [dict(zip(SWEEP_PARAMETERS, combo)) for combo in itertools.product(*values)]
+    combinations = [c for c in combinations if c['rsi_lower'] < c['rsi_upper'] and c['macd'][0] < c['macd'][1]]
+    return sorted(combinations, key=lambda c: tuple(c['macd']))
+
+
+def max_drawdown_percent(equity):
+    peaks = np.maximum.accumulate(equity)
+    return float(np.max((peaks - equity) / peaks) * 100) if len(equity) else 0.0
+
+
+def evaluate_combinations(close, initial_capital, combinations):
+    """Roda cada combinação sobre a mesma série; os indicadores são calculados uma vez por trio de períodos do MACD."""
+    close = np.asarray(close, dtype=float)
+    indicators, rows = {}, []
+    for params in combinations:
+        fast, slow, signal = params['macd']
+        if (fast, slow, signal) not in indicators:
+            indicators[(fast, slow, signal)] = compute_indicators(close, macd_fast=fast, macd_slow=slow, macd_signal=signal)
+        rsi, macd_diff = indicators[(fast, slow, signal)]
+        buy, sell = signal_masks(rsi, macd_diff, params['rsi_upper'], params['rsi_lower'], start_index=max(WARMUP_BARS, slow + signal))
+        result = simulate(close, buy, sell, initial_capital, params['buy_risk_percentage'] / 100,
+                          params['sell_risk_percentage'] / 100, with_equity=True)
+        rows.append({
+            **params,
+            'final_value': round(result.final_value, 2),
+            'profit_loss_percent': round((result.final_value - initial_capital) / initial_capital * 100, 2) if initial_capital else 0.0,
+            'total_trades': result.total_trades,
+            'max_drawdown_percent': round(max_drawdown_percent(result.equity), 2),
+        })
+    return rows
+
+
+def rank_results(rows, key='profit_loss_percent'):
+    ranked = sorted(rows, key=lambda r: (-r[key], r['max_drawdown_percent']))
+    return [{'rank': position, **row} for position, row in enumerate(ranked, start=1)]
+
+
+# --- Walk-forward ---
+
+def walk_forward_windows(n_bars, train_bars, test_bars):
+    """Janelas (início do treino, início do teste, fim do teste) que avançam `test_bars` barras por vez."""
+    windows, test_start = [], train_bars
+    while test_start < n_bars:
+        windows.append((test_start - train_bars, test_start, min(test_start + test_bars, n_bars)))
+        test_start += test_bars
+    return windows
+
+
+def evaluate_window(close, indicators, combinations, initial_capital, train_start, test_start, test_end):
+    """
+    Otimiza os parâmetros no trecho de treino e aplica os vencedores no trecho de teste.
+    `indicators` = {(rápido, lento, sinal): (rsi, macd_diff)} calculados uma vez sobre a série inteira;
+    cada janela apenas fatia os arrays (os indicadores são causais, então não há lookahead).
+    """
+    close = np.asarray(close, dtype=float)
+    masks = {}
+
+    def run(params, start, end, with_equity=False):
+        fast, slow, signal = params['macd']
+        mask_key = (fast, slow, signal, params['rsi_upper'], params['rsi_lower'])
+        if mask_key not in masks:
+            rsi, macd_diff = indicators[(fast, slow, signal)]
+            masks[mask_key] = signal_masks(rsi, macd_diff, params['rsi_upper'], params['rsi_lower'], start_index=max(WARMUP_BARS, slow + signal))
+        buy, sell = masks[mask_key]
+        return simulate(close[start:end], buy[start:end], sell[start:end], initial_capital,
+                        params['buy_risk_percentage'] / 100, params['sell_risk_percentage'] / 100, with_equity=with_equity)
+
+    in_sample = [(run(params, train_start, test_start, with_equity=True), params) for params in combinations]
+    best_result, best_params = min(in_sample, key=lambda item: (-item[0].final_value, max_drawdown_percent(item[0].equity)))
+    out_of_sample = run(best_params, test_start, test_end, with_equity=True)
+    return {
+        'train': [train_start, test_start], 'test': [test_start, test_end], 'params': best_params,
+        'in_sample_profit_loss_percent': round((best_result.final_value / initial_capital - 1) * 100, 2),
+        'out_of_sample_profit_loss_percent': round((out_of_sample.final_value / initial_capital - 1) * 100, 2),
+        'total_trades': out_of_sample.total_trades,
+        'equity': out_of_sample.equity.tolist(),
+        'exposed': (out_of_sample.holdings > 0).tolist(),
+        'trades': [[test_start + i, side, price, quantity, pnl] for i, side, price, quantity, pnl in out_of_sample.trades],
+    }
+
+
+def stitch_equity(window_results, initial_capital):
+    """Encadeia as curvas fora da amostra: cada janela começa com o capital final da anterior (retornos compostos)."""
+    capital, curve = float(initial_capital), []
+    for window in sorted(window_results, key=lambda w: w['test'][0]):
+        equity = np.asarray(window['equity'], dtype=float) / initial_capital * capital
+        curve.extend(equity.tolist())
+        capital = equity[-1] if len(equity) else capital
+    return curve
+
+
+# --- Portfólio multiativo ---
+
+@dataclass
+class PortfolioResult:
+    final_value: float
+    total_trades: int
+    equity: np.ndarray
+    # Por ativo (mesma ordem das colunas): P/L em moeda, número de trades e quantidade final.
+    profit_loss: np.ndarray
+    trades_per_asset: np.ndarray
+    holdings: np.ndarray
+    # Barras em que havia alguma posição aberta.
+    exposed: np.ndarray = None
+    # Cada trade: (barra, coluna do ativo, 'BUY'/'SELL', preço, quantidade, resultado da venda sobre o preço médio).
+    trades: list = field(default_factory=list)
+
+
+def align_closes(series):
+    """
+    Alinha {símbolo: (open_times, closes)} numa matriz (barras x ativos) pela união dos timestamps.
+    Barras em que um ativo não tem candle ficam NaN. Retorna (times, símbolos, matriz).
+    """
+    symbols = list(series)
+    times = np.unique(np.concatenate([np.asarray(series[s][0], dtype=np.int64) for s in symbols]))
+    matrix = np.full((len(times), len(symbols)), np.nan)
+    for column, symbol in enumerate(symbols):
+        symbol_times, closes = series[symbol]
+        matrix[np.searchsorted(times, symbol_times), column] = closes
+    return times, symbols, matrix
+
+
+def portfolio_signal_masks(close_matrix, rsi_upper=70.0, rsi_lower=30.0, macd_fast=12, macd_slow=26, macd_signal=9):
+    """Calcula os indicadores de cada coluna sobre os próprios candles e devolve as máscaras de compra/venda (barras x ativos)."""
+    present = ~np.isnan(close_matrix)
+    buy, sell = np.zeros_like(present), np.zeros_like(present)
+    for column in range(close_matrix.shape[1]):
+        rows = np.flatnonzero(present[:, column])
+        if not len(rows):
+            continue
+        # O cruzamento compara com o candle anterior do próprio ativo, e o aquecimento conta só os candles dele.
+        rsi, macd_diff = compute_indicators(close_matrix[rows, column], macd_fast=macd_fast, macd_slow=macd_slow, macd_signal=macd_signal)
+        buy[rows, column], sell[rows, column] = signal_masks(rsi, macd_diff, rsi_upper, rsi_lower, start_index=max(WARMUP_BARS, macd_slow + macd_signal))
+    return buy, sell
+
+
+def simulate_portfolio(close_matrix, buy, sell, initial_capital, buy_fraction, sell_fraction):
+    """
+    Caixa único compartilhado entre os ativos. Em cada barra com sinal as vendas são feitas primeiro;
+    as compras seguem na ordem das colunas, cada uma usando `buy_fraction` do caixa restante.
+    """
+    n_bars, n_assets = close_matrix.shape
+    prices = pd.DataFrame(close_matrix).ffill().to_numpy()
+    cash, holdings, average_cost, trades = float(initial_capital), np.zeros(n_assets), np.zeros(n_assets), []
+    cash_flow, trades_per_asset = np.zeros(n_assets), np.zeros(n_assets, dtype=int)
+    event_rows = np.flatnonzero((buy | sell).any(axis=1))
+    cash_at, holdings_at = np.empty(len(event_rows)), np.empty((len(event_rows), n_assets))
+
+    for n, t in enumerate(event_rows.tolist()):
+        price = prices[t]
+        sells = sell[t] & (holdings > 0)
+        if sells.any():
+            quantity = holdings[sells] * sell_fraction
+            proceeds = quantity * price[sells]
+            holdings[sells] -= quantity; cash_flow[sells] += proceeds; trades_per_asset[sells] += 1
+            cash += proceeds.sum()
+            pnl = quantity * (price[sells] - average_cost[sells])
+            trades.extend((t, column, 'SELL', price[column], q, p) for column, q, p in zip(np.flatnonzero(sells).tolist(), quantity.tolist(), pnl.tolist()))
+        buys = np.flatnonzero(buy[t] & ~sell[t])
+        if len(buys):
+            # Caixa antes de cada compra: cash * (1 - f)^k; só compra enquanto ele passar do mínimo.
+            cash_before = cash * (1 - buy_fraction) ** np.arange(len(buys))
+            buys, amounts = buys[cash_before > MIN_CASH_TO_BUY], (cash_before * buy_fraction)[cash_before > MIN_CASH_TO_BUY]
+            quantity = amounts / price[buys]
+            average_cost[buys] = (average_cost[buys] * holdings[buys] + amounts) / (holdings[buys] + quantity)
+            holdings[buys] += quantity; cash_flow[buys] -= amounts; trades_per_asset[buys] += 1
+            cash -= amounts.sum()
+            trades.extend((t, column, 'BUY', price[column], q, 0.0) for column, q in zip(buys.tolist(), quantity.tolist()))
+        cash_at[n], holdings_at[n] = cash, holdings
+
+    position = np.searchsorted(event_rows, np.arange(n_bars), side='right') - 1
+    cash_path = np.append(cash_at, float(initial_capital))[position]
+    holdings_path = np.vstack([holdings_at, np.zeros(n_assets)])[position]
+    equity = cash_path + np.nansum(holdings_path * prices, axis=1)
+    last_prices = np.nan_to_num(prices[-1])
+    return PortfolioResult(
+        final_value=float(equity[-1]) if n_bars else float(initial_capital), total_trades=int(trades_per_asset.sum()),
+        equity=equity, profit_loss=cash_flow + holdings * last_prices, trades_per_asset=trades_per_asset, holdings=holdings,
+        exposed=(holdings_path > 0).any(axis=1), trades=trades,
+    )
+
+
+# --- Monte Carlo / bootstrap (BacktestReport.mode == 'MONTE_CARLO') ---
+MONTE_CARLO_PERCENTILES = (5, 25, 50, 75, 95)
+# Células (caminhos × passos) por lote: limita a memória de cada matriz a ~32 MB.
+MONTE_CARLO_MAX_CELLS = 4_000_000
+
+
+def monte_carlo(returns, initial_capital, n_paths=10_000, block_size=1, seed=None, max_cells=MONTE_CARLO_MAX_CELLS, on_batch=None):
+    """
+    Reamostra `returns` com reposição, em blocos contíguos de `block_size` (preserva a autocorrelação
+    de curto prazo), e acumula cada caminho a partir de `initial_capital`. Os caminhos são linhas de uma
+    matriz (caminhos × passos), gerada em lotes de no máximo `max_cells` células.
+    `on_batch(caminhos)` é chamado a cada lote concluído (andamento).
+    Retorna (valores finais, drawdowns máximos em %), um valor por caminho.
+    """
+    returns = np.asarray(returns, dtype=float)
+    n_steps = len(returns)
+    final_values, drawdowns = np.full(n_paths, float(initial_capital)), np.zeros(n_paths)
+    if not n_steps:
+        if on_batch:
+            on_batch(n_paths)
+        return final_values, drawdowns
+    block_size = max(1, min(int(block_size), n_steps))
+    n_blocks = -(-n_steps // block_size)
+    offsets = np.arange(block_size)
+    rng = np.random.default_rng(seed)
+    chunk = max(1, max_cells // n_steps)
+
+    for start in range(0, n_paths, chunk):
+        rows = min(chunk, n_paths - start)
+        block_starts = rng.integers(0, n_steps - block_size + 1, size=(rows, n_blocks))
+        index = (block_starts[:, :, None] + offsets).reshape(rows, -1)[:, :n_steps]
+        growth = np.cumprod(1.0 + returns[index], axis=1)
+        # O capital inicial (1.0) também conta como pico.
+        peaks = np.maximum(np.maximum.accumulate(growth, axis=1), 1.0)
+        final_values[start:start + rows] = initial_capital * growth[:, -1]
+        drawdowns[start:start + rows] = ((peaks - growth) / peaks).max(axis=1) * 100
+        if on_batch:
+            on_batch(rows)
+    return final_values, drawdowns
+
+
+def trade_returns(equity, trade_bars, trade_pnl):
+    """Resultado relativo de cada venda: P/L realizado sobre o patrimônio da barra anterior."""
+    equity, trade_bars = np.asarray(equity, dtype=float), np.asarray(trade_bars, dtype=int)
+    before = equity[np.maximum(trade_bars - 1, 0)]
+    return np.asarray(trade_pnl, dtype=float) / before
+
+
+def distribution_summary(final_values, drawdowns, initial_capital, percentiles=MONTE_CARLO_PERCENTILES):
+    """Percentis do valor final e do drawdown máximo, e a probabilidade de terminar no prejuízo."""
+    final_p, drawdown_p = np.percentile(final_values, percentiles), np.percentile(drawdowns, percentiles)
+    return {
+        'final_value': {f"p{p}": round(float(v), 2) for p, v in zip(percentiles, final_p)},
+        'max_drawdown_percent': {f"p{p}": round(float(v), 2) for p, v in zip(percentiles, drawdown_p)},
+        'probability_of_loss_percent': round(float(np.mean(final_values < initial_capital) * 100), 2),
+    }
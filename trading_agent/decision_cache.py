@@ -0,0 +1,66 @@
+# trading_agent/decision_cache.py
+"""
+Cache local (SQLite) de respostas do Gemini para backtests, endereçado pelo conteúdo da chamada.
+
+A chave é o SHA-256 de (modelo, prompt, generationConfig). Em modo 'record' as respostas já
+vistas são servidas do arquivo e as novas são gravadas; em modo 'replay' só o arquivo é usado,
+sem rede. Assim uma simulação repetida é determinística e praticamente instantânea.
+"""
+import hashlib
+import json
+import sqlite3
+
+from django.utils import timezone
+
+MODES = ('off', 'record', 'replay')
+
+
+class DecisionCache:
+    def __init__(self, path, mode='record'):
+        if mode not in MODES:
+            raise ValueError(f"Modo de cache inválido: {mode}. Use um de {MODES}.")
+        self.path, self.mode = str(path), mode
+        self.hits = self.misses = 0
+        self._conn = None
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS decisions (key TEXT PRIMARY KEY, model TEXT, prompt TEXT, response TEXT, created_at TEXT)"
+            )
+        return self._conn
+
+    @staticmethod
+    def key(model_name, prompt, generation_config):
+        content = json.dumps([model_name, prompt, generation_config], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        row = self.conn.execute("SELECT response FROM decisions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, model_name, prompt, response):
+        if self.mode != 'record':
+            return
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO decisions (key, model, prompt, response, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, prompt, json.dumps(response), timezone.now().isoformat()),
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,56 @@
+# trading_agent/decision_groups.py
+"""
+Agrupamento dos perfis do ciclo de decisão.
+
+O contexto técnico e de sentimento das moedas é o mesmo para todos os usuários; o prompt só muda
+com o modelo, as instruções de estratégia e as posições. Perfis com o mesmo (modelo, hash da
+estratégia, faixa de posição em cada moeda) recebem as mesmas decisões de uma única chamada ao
+Gemini (em lote, com todas as moedas), replicadas como um TradingSignal por usuário e moeda. O
+tamanho de cada ordem continua individual: é calculado na execução com os percentuais de risco
+de cada perfil.
+"""
+import hashlib
+import random
+from dataclasses import dataclass, field
+
+FLAT, OPEN = 'FLAT', 'OPEN'
+
+
+def holding_bucket(holding):
+    return OPEN if holding is not None and holding.quantity > 0 else FLAT
+
+
+def strategy_hash(strategy_prompt):
+    return hashlib.sha256((strategy_prompt or '').encode('utf-8')).hexdigest()[:16]
+
+
+@dataclass
+class DecisionGroup:
+    cryptos: list
+    model: str
+    strategy_hash: str
+    holding_buckets: tuple
+    members: list = field(default_factory=list)
+
+    @property
+    def key(self):
+        return (self.model, self.strategy_hash, self.holding_buckets)
+
+    def position(self, crypto):
+        """Posição descrita no prompt: igual para todo o grupo, sem a quantidade de cada usuário."""
+        bucket = self.holding_buckets[self.cryptos.index(crypto)]
+        return f"0 {crypto.symbol}" if bucket == FLAT else f"uma posição aberta em {crypto.symbol}"
+
+    def callers(self, attempts=2):
+        """Perfis cuja chave de API pode fazer a chamada do grupo, em ordem aleatória para dividir o custo entre eles."""
+        return random.sample(self.members, min(attempts, len(self.members)))
+
+
+def group_profiles(profiles, cryptos, holdings):
+    """Agrupa `profiles` para as moedas `cryptos`; `holdings` mapeia (id do perfil, símbolo) para o Holding."""
+    groups = {}
+    for profile in profiles:
+        buckets = tuple(holding_bucket(holdings.get((profile.pk, crypto.pk))) for crypto in cryptos)
+        group = DecisionGroup(cryptos, profile.gemini_model, strategy_hash(profile.agent_strategy_prompt), buckets)
+        groups.setdefault(group.key, group).members.append(profile)
+    return list(groups.values())
@@ -2,6 +2,7 @@
 from django import forms
 from decimal import Decimal
 from core.models import Cryptocurrency
+from .models import BacktestReport
 
 class BacktestForm(forms.Form):
     """
@@ -18,6 +19,7 @@ class BacktestForm(forms.Form):
     # Campo para selecionar a criptomoeda
     symbol = forms.ModelChoiceField(
         queryset=Cryptocurrency.objects.all(),
+        required=False,
         label="Criptomoeda",
         widget=forms.Select(attrs={'class': 'form-input'})
     )
@@ -34,3 +36,123 @@ class BacktestForm(forms.Form):
         initial=Decimal('1000.0'),
         widget=forms.NumberInput(attrs={'class': 'form-input', 'step': '100'})
     )
+
+    # --- Varredura de parâmetros / walk-forward (opcional) ---
+    mode = forms.ChoiceField(
+        choices=BacktestReport.MODE_CHOICES,
+        required=False,
+        initial='SINGLE',
+        label="Modo",
+        help_text="Varredura: testa todas as combinações das listas abaixo e ordena os resultados. "
+                  "Walk-forward: otimiza a grade em cada janela de treino e a avalia na janela seguinte. "
+                  "Portfólio: aplica a estratégia a vários ativos com um caixa único. "
+                  "Monte Carlo: reamostra os retornos e os trades da simulação para estimar a dispersão dos resultados.",
+        widget=forms.Select(attrs={'class': 'form-input'})
+    )
+    buy_risk_values = forms.CharField(
+        required=False, initial="2, 5, 10", label="Risco de Compra (%)",
+        widget=forms.TextInput(attrs={'class': 'form-input'})
+    )
+    sell_risk_values = forms.CharField(
+        required=False, initial="50, 100", label="Risco de Venda (%)",
+        widget=forms.TextInput(attrs={'class': 'form-input'})
+    )
+    rsi_upper_values = forms.CharField(
+        required=False, initial="65, 70, 75", label="RSI Máximo p/ Compra",
+        widget=forms.TextInput(attrs={'class': 'form-input'})
+    )
+    rsi_lower_values = forms.CharField(
+        required=False, initial="25, 30, 35", label="RSI Mínimo p/ Venda",
+        widget=forms.TextInput(attrs={'class': 'form-input'})
+    )
+    macd_values = forms.CharField(
+        required=False, initial="12/26/9, 8/21/5", label="Períodos MACD (rápido/lento/sinal)",
+        widget=forms.TextInput(attrs={'class': 'form-input'})
+    )
+
+    symbols = forms.ModelMultipleChoiceField(
+        queryset=Cryptocurrency.objects.all(),
+        required=False,
+        label="Ativos do Portfólio (vazio = todos)",
+        widget=forms.SelectMultiple(attrs={'class': 'form-input'})
+    )
+    train_days = forms.IntegerField(
+        required=False, initial=180, min_value=60, label="Janela de Treino (dias)",
+        widget=forms.NumberInput(attrs={'class': 'form-input'})
+    )
+    test_days = forms.IntegerField(
+        required=False, initial=30, min_value=7, label="Janela de Teste (dias)",
+        widget=forms.NumberInput(attrs={'class': 'form-input'})
+    )
+
+    mc_paths = forms.IntegerField(
+        required=False, initial=10000, min_value=100, max_value=100000, label="Caminhos (Monte Carlo)",
+        widget=forms.NumberInput(attrs={'class': 'form-input', 'step': '1000'})
+    )
+    mc_block_size = forms.IntegerField(
+        required=False, initial=5, min_value=1, max_value=60, label="Tamanho do Bloco (dias)",
+        widget=forms.NumberInput(attrs={'class': 'form-input'})
+    )
+
+    MAX_SWEEP_COMBINATIONS = 2000
+
+    def _parse_numbers(self, field_name, min_value, max_value):
+        try:
+            values = sorted({float(v) for v in self.cleaned_data.get(field_name, '').replace(';', ',').split(',') if v.strip()})
+        except ValueError:
+            self.add_error(field_name, "Use uma lista de números separados por vírgula.")
+            return []
+        if not values or any(v < min_value or v > max_value for v in values):
+            self.add_error(field_name, f"Informe valores entre {min_value} e {max_value}.")
+        return values
+
+    def clean(self):
+        cleaned_data = super().clean()
+        mode = cleaned_data.get('mode') or 'SINGLE'
+        if mode == 'PORTFOLIO':
+            cleaned_data['grid'] = {'symbols': [c.symbol for c in cleaned_data.get('symbols') or []]}
+            return cleaned_data
+        if not cleaned_data.get('symbol'):
+            self.add_error('symbol', "Selecione a criptomoeda.")
+        if mode == 'SINGLE':
+            return cleaned_data
+        if mode == 'MONTE_CARLO':
+            cleaned_data['grid'] = {
+                'paths': cleaned_data.get('mc_paths') or self.fields['mc_paths'].initial,
+                'block_size': cleaned_data.get('mc_block_size') or self.fields['mc_block_size'].initial,
+            }
+            return cleaned_data
+
+        macd_periods = []
+        for item in cleaned_data.get('macd_values', '').split(','):
+            if not item.strip():
+                continue
+            try:
+                fast, slow, signal = (int(p) for p in item.split('/'))
+            except ValueError:
+                self.add_error('macd_values', "Use o formato rápido/lento/sinal, ex: 12/26/9.")
+                break
+            if not 1 < fast < slow <= 100 or not 1 < signal <= 50:
+                self.add_error('macd_values', f"Períodos MACD inválidos: {item.strip()}.")
+                break
+            macd_periods.append([fast, slow, signal])
+
+        grid = {
+            'buy_risk_percentage': self._parse_numbers('buy_risk_values', 0.1, 100),
+            'sell_risk_percentage': self._parse_numbers('sell_risk_values', 0.1, 100),
+            'rsi_upper': self._parse_numbers('rsi_upper_values', 1, 99),
+            'rsi_lower': self._parse_numbers('rsi_lower_values', 1, 99),
+            'macd': macd_periods,
+        }
+        total = 1
+        for values in grid.values():
+            total *= len(values)
+        if not macd_periods and 'macd_values' not in self.errors:
+            self.add_error('macd_values', "Informe ao menos um trio de períodos.")
+        elif total > self.MAX_SWEEP_COMBINATIONS:
+            raise forms.ValidationError(f"A grade gera {total} combinações; o máximo é {self.MAX_SWEEP_COMBINATIONS}.")
+        if cleaned_data.get('mode') == 'WALK_FORWARD':
+            grid['train_bars'] = cleaned_data.get('train_days') or self.fields['train_days'].initial
+            grid['test_bars'] = cleaned_data.get('test_days') or self.fields['test_days'].initial
+        cleaned_data['grid'] = grid
+        return cleaned_data
@@ -0,0 +1,144 @@
+# trading_agent/indicators.py
+"""
+Motor incremental de indicadores técnicos (RSI-14, MACD 12/26/9, BBands 20/2 e ATR-14).
+
+Cada novo candle fechado atualiza o estado em O(1) (médias de Wilder, estados das EMAs e uma
+janela móvel para as Bandas de Bollinger), em vez de recalcular todo o histórico com o pandas_ta.
+As recorrências reproduzem as do pandas_ta/pandas (`ewm` com e sem `adjust`, EMA semeada pela SMA),
+então os valores coincidem com os do pandas_ta calculado sobre a mesma série.
+O estado é serializável em JSON para ser persistido entre execuções (ver IndicatorState).
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+
+class _EWM:
+    """Média exponencial com a mesma aritmética do `Series.ewm(...).mean()` do pandas."""
+    def __init__(self, alpha, adjust, min_periods=1):
+        com = (1.0 - alpha) / alpha
+        self.alpha = 1.0 / (1.0 + com)
+        self.adjust = adjust
+        self.min_periods = max(min_periods, 1)
+        self.weighted, self.old_wt, self.nobs = None, 1.0, 0
+
+    def update(self, value):
+        if value is None:
+            return self.value
+        self.nobs += 1
+        if self.weighted is None:
+            self.weighted = value
+        else:
+            new_wt = 1.0 if self.adjust else self.alpha
+            self.old_wt *= 1.0 - self.alpha
+            if self.weighted != value:
+                self.weighted = (self.old_wt * self.weighted + new_wt * value) / (self.old_wt + new_wt)
+            self.old_wt = self.old_wt + new_wt if self.adjust else 1.0
+        return self.value
+
+    @property
+    def value(self):
+        return self.weighted if self.nobs >= self.min_periods else None
+
+    def to_state(self):
+        return [self.weighted, self.old_wt, self.nobs]
+
+    def load_state(self, state):
+        self.weighted, self.old_wt, self.nobs = state
+
+
+class _SeededEMA:
+    """EMA do pandas_ta: semeada pela média simples dos primeiros `length` valores, depois `ewm(adjust=False)`."""
+    def __init__(self, length):
+        self.length = length
+        self.seed = []
+        self.ewm = _EWM(2.0 / (length + 1.0), adjust=False)
+
+    def update(self, value):
+        if value is None:
+            return self.value
+        if len(self.seed) < self.length:
+            self.seed.append(value)
+            if len(self.seed) == self.length:
+                self.ewm.update(float(np.sum(np.array(self.seed, dtype=np.float64)) / self.length))
+            return self.value
+        return self.ewm.update(value)
+
+    @property
+    def value(self):
+        return self.ewm.value
+
+    def to_state(self):
+        return [self.seed, self.ewm.to_state()]
+
+    def load_state(self, state):
+        self.seed = list(state[0])
+        self.ewm.load_state(state[1])
+
+
+class IndicatorEngine:
+    RSI_LENGTH, MACD_FAST, MACD_SLOW, MACD_SIGNAL = 14, 12, 26, 9
+    BB_LENGTH, BB_STD, ATR_LENGTH = 20, 2.0, 14
+
+    def __init__(self, state=None):
+        self.prev_close = None
+        self.rsi_gain = _EWM(1.0 / self.RSI_LENGTH, adjust=True, min_periods=self.RSI_LENGTH)
+        self.rsi_loss = _EWM(1.0 / self.RSI_LENGTH, adjust=True, min_periods=self.RSI_LENGTH)
+        self.ema_fast = _SeededEMA(self.MACD_FAST)
+        self.ema_slow = _SeededEMA(self.MACD_SLOW)
+        self.macd_signal = _SeededEMA(self.MACD_SIGNAL)
+        self.atr = _EWM(1.0 / self.ATR_LENGTH, adjust=True, min_periods=self.ATR_LENGTH)
+        self.bb_window = deque(maxlen=self.BB_LENGTH)
+        self.values = {}
+        if state:
+            self.load_state(state)
+
+    def update(self, high, low, close):
+        """Processa um candle fechado e devolve os valores atuais (None enquanto o indicador aquece)."""
+        high, low, close = float(high), float(low), float(close)
+        change = close - self.prev_close if self.prev_close is not None else None
+        gain = loss = true_range = None
+        if change is not None:
+            gain, loss = (0.0 if change < 0 else change), (0.0 if change > 0 else change)
+            true_range = max(abs(high - low), abs(high - self.prev_close), abs(self.prev_close - low))
+        self.prev_close = close
+
+        avg_gain, avg_loss = self.rsi_gain.update(gain), self.rsi_loss.update(loss)
+        rsi = None
+        if avg_gain is not None and avg_loss is not None and avg_gain + abs(avg_loss):
+            rsi = 100 * avg_gain / (avg_gain + abs(avg_loss))
+
+        fast, slow = self.ema_fast.update(close), self.ema_slow.update(close)
+        macd_line = fast - slow if fast is not None and slow is not None else None
+        macd_signal = self.macd_signal.update(macd_line)
+
+        self.bb_window.append(close)
+        bollinger_high = bollinger_low = None
+        if len(self.bb_window) == self.BB_LENGTH:
+            mean = sum(self.bb_window) / self.BB_LENGTH
+            std = math.sqrt(sum((x - mean) ** 2 for x in self.bb_window) / self.BB_LENGTH)
+            bollinger_high, bollinger_low = mean + self.BB_STD * std, mean - self.BB_STD * std
+
+        self.values = {
+            'rsi': rsi, 'macd_line': macd_line, 'macd_signal': macd_signal,
+            'bollinger_high': bollinger_high, 'bollinger_low': bollinger_low, 'atr': self.atr.update(true_range),
+        }
+        return self.values
+
+    def to_state(self):
+        return {
+            'prev_close': self.prev_close,
+            'rsi_gain': self.rsi_gain.to_state(), 'rsi_loss': self.rsi_loss.to_state(),
+            'ema_fast': self.ema_fast.to_state(), 'ema_slow': self.ema_slow.to_state(),
+            'macd_signal': self.macd_signal.to_state(), 'atr': self.atr.to_state(),
+            'bb_window': list(self.bb_window), 'values': self.values,
+        }
+
+    def load_state(self, state):
+        self.prev_close = state['prev_close']
+        self.rsi_gain.load_state(state['rsi_gain']); self.rsi_loss.load_state(state['rsi_loss'])
+        self.ema_fast.load_state(state['ema_fast']); self.ema_slow.load_state(state['ema_slow'])
+        self.macd_signal.load_state(state['macd_signal']); self.atr.load_state(state['atr'])
+        self.bb_window.extend(state['bb_window'])
+        self.values = state.get('values', {})
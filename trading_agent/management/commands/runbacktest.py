@@ -3,13 +3,19 @@ import pandas as pd
 import pandas_ta as ta
 import time
 from decimal import Decimal
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from binance.client import Client
 
 from core.models import Cryptocurrency, UserProfile
+from core.klines import KlineStore, KLINE_COLUMNS
 # (CORREÇÃO) Alterado o import de relativo para absoluto
 from trading_agent.models import TradingSignal
 from trading_agent.services import get_gemini_trade_decision
+from trading_agent.decision_cache import DecisionCache, MODES as CACHE_MODES
+
+# Barras necessárias antes da primeira decisão (aquecimento dos indicadores).
+MIN_BARS = 50
 
 # Mock de classes para simular objetos do banco de dados em memória
 class MockTechAnalysis:
@@ -37,27 +43,31 @@ class Command(BaseCommand):
         parser.add_argument('--symbol', type=str, help='Símbolo da criptomoeda para backtest (ex: BTC)', default='BTC')
         parser.add_argument('--start', type=str, help='Data de início do backtest (ex: "1 year ago")', default='1 year ago')
         parser.add_argument('--capital', type=float, help='Capital inicial para a simulação em USDT', default=1000.0)
+        parser.add_argument('--interval', type=str, help='Intervalo dos candles (ex: 1d, 4h, 1h)', default=Client.KLINE_INTERVAL_1DAY)
+        parser.add_argument('--cache-mode', choices=CACHE_MODES, default='record', help="Cache de decisões da IA: 'record' grava e reaproveita, 'replay' usa só o cache (sem rede), 'off' desliga")
+        parser.add_argument('--cache-file', type=str, default=getattr(settings, 'DECISION_CACHE_PATH', 'backtest_decisions.sqlite3'), help='Arquivo SQLite do cache de decisões')
 
     def handle(self, *args, **options):
         symbol = options['symbol']
         start_date = options['start']
         initial_capital = Decimal(options['capital'])
+        interval = options['interval']
+        decision_cache = DecisionCache(options['cache_file'], mode=options['cache_mode'])
 
-        self.stdout.write(f"Iniciando backtest para {symbol} desde {start_date} com capital inicial de ${initial_capital:.2f}")
+        self.stdout.write(f"Iniciando backtest para {symbol} ({interval}) desde {start_date} com capital inicial de ${initial_capital:.2f}")
 
         # 1. Obter dados históricos
         try:
-            client = Client()
             crypto = Cryptocurrency.objects.get(symbol=symbol)
-            klines = client.get_historical_klines(f"{symbol}{crypto.price_currency}", Client.KLINE_INTERVAL_1DAY, start_date)
+            klines = KlineStore().fetch(f"{symbol}{crypto.price_currency}", interval, start_date)
             
             if not klines:
                 self.stdout.write(self.style.ERROR(f"Não foram encontrados dados históricos para {symbol}."))
                 return
 
-            df = pd.DataFrame(klines, columns=['time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'])
+            df = pd.DataFrame(klines, columns=KLINE_COLUMNS)
             df['time'] = pd.to_datetime(df['time'], unit='ms')
-            df['close'] = pd.to_numeric(df['close']).astype(str)
+            df['close'] = pd.to_numeric(df['close'])
             df.set_index('time', inplace=True)
         except Cryptocurrency.DoesNotExist:
             self.stdout.write(self.style.ERROR(f"Criptomoeda {symbol} não encontrada no banco de dados."))
@@ -76,39 +86,39 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR("Nenhum UserProfile encontrado para a simulação."))
             return
         
-        # 3. Loop de simulação
-        for index, row in df.iterrows():
-            if len(df.loc[:index]) < 50: 
+        # 3. Indicadores calculados uma única vez sobre toda a série. Todos são causais (o valor da
+        # barra i só depende das barras até i), então equivalem ao recálculo sobre cada prefixo.
+        df.ta.rsi(length=14, append=True)
+        df.ta.macd(fast=12, slow=26, signal=9, append=True)
+        df.ta.bbands(length=20, std=2, append=True)
+        indicator_rows = zip(
+            df.index, df['close'].astype(str), df['RSI_14'], df['MACD_12_26_9'], df['MACDs_12_26_9'], df['BBU_20_2.0'], df['BBL_20_2.0']
+        )
+        intraday = not interval.endswith(('d', 'w', 'M'))
+
+        # 4. Loop de simulação
+        for position, (index, close, rsi, macd_line, macd_signal, bband_high, bband_low) in enumerate(indicator_rows):
+            if position < MIN_BARS - 1:
                 continue
 
-            current_price = Decimal(row['close'])
-            
-            past_data = df.loc[:index].copy()
-            past_data['close'] = pd.to_numeric(past_data['close'])
-
-            past_data.ta.rsi(length=14, append=True)
-            past_data.ta.macd(fast=12, slow=26, signal=9, append=True)
-            past_data.ta.bbands(length=20, std=2, append=True)
-            latest_indicators = past_data.iloc[-1]
-            
-            mock_tech = MockTechAnalysis(
-                latest_indicators.get('RSI_14'),
-                latest_indicators.get('MACD_12_26_9'),
-                latest_indicators.get('MACDs_12_26_9'),
-                latest_indicators.get('BBU_20_2.0'),
-                latest_indicators.get('BBL_20_2.0')
-            )
+            current_price = Decimal(close)
+            when = index if intraday else index.date()
+            mock_tech = MockTechAnalysis(rsi, macd_line, macd_signal, bband_high, bband_low)
             mock_sentiment = MockSentiment()
             mock_holding = MockHolding(crypto_holdings, avg_buy_price)
+            # O prompt deve ver o preço da barra simulada, não o preço atual do banco (e fica determinístico para o cache).
+            crypto.current_price = current_price
 
+            hits_before = decision_cache.hits
             ai_decision_data = get_gemini_trade_decision(
-                user_profile, crypto, mock_tech, mock_sentiment, mock_holding, save_signal=False
+                user_profile, crypto, [mock_tech], [mock_sentiment], mock_holding, save_signal=False, decision_cache=decision_cache
             )
-            
-            time.sleep(2)
+
+            if decision_cache.hits == hits_before and decision_cache.mode != 'replay':
+                time.sleep(2)
 
             if not ai_decision_data:
-                self.stdout.write(self.style.WARNING(f"Não foi possível obter a decisão da IA para {index.date()}. Pulando..."))
+                self.stdout.write(self.style.WARNING(f"Não foi possível obter a decisão da IA para {when}. Pulando..."))
                 continue
 
             decision = ai_decision_data.get('decision')
@@ -124,7 +134,7 @@ class Command(BaseCommand):
                 
                 cash -= buy_amount
                 trades.append({'date': index, 'type': 'BUY', 'price': current_price, 'amount': crypto_bought})
-                self.stdout.write(f"{index.date()}: COMPRA de {crypto_bought:.6f} {symbol} a ${current_price:.2f}")
+                self.stdout.write(f"{when}: COMPRA de {crypto_bought:.6f} {symbol} a ${current_price:.2f}")
 
             elif decision == 'SELL' and confidence > 0.4 and crypto_holdings > 0:
                 sell_amount = crypto_holdings * (user_profile.agent_sell_risk_percentage / Decimal('100.0'))
@@ -135,22 +145,22 @@ class Command(BaseCommand):
                     avg_buy_price = Decimal('0.0')
 
                 trades.append({'date': index, 'type': 'SELL', 'price': current_price, 'amount': sell_amount})
-                self.stdout.write(f"{index.date()}: VENDA de {sell_amount:.6f} {symbol} a ${current_price:.2f}")
+                self.stdout.write(f"{when}: VENDA de {sell_amount:.6f} {symbol} a ${current_price:.2f}")
 
-        # 4. Apresentar resultados
-        final_price = Decimal(df.iloc[-1]['close'])
+        # 5. Apresentar resultados
+        final_price = Decimal(str(df['close'].iloc[-1]))
         final_portfolio_value = cash + crypto_holdings * final_price
         profit_loss = final_portfolio_value - initial_capital
         profit_loss_percent = (profit_loss / initial_capital) * 100
 
-        buy_and_hold_value = (initial_capital / Decimal(df.iloc[0]['close'])) * final_price
+        buy_and_hold_value = (initial_capital / Decimal(str(df['close'].iloc[0]))) * final_price
         buy_and_hold_pl = buy_and_hold_value - initial_capital
         buy_and_hold_pl_percent = (buy_and_hold_pl / initial_capital) * 100
 
         self.stdout.write("\n" + "="*40)
         self.stdout.write(self.style.SUCCESS("Backtesting Concluído!"))
         self.stdout.write("="*40)
-        self.stdout.write(f"Período Analisado: {df.index[0].date()} a {df.index[-1].date()}")
+        self.stdout.write(f"Período Analisado: {df.index[0]} a {df.index[-1]}" if intraday else f"Período Analisado: {df.index[0].date()} a {df.index[-1].date()}")
         self.stdout.write(f"Capital Inicial:      ${initial_capital:12,.2f}")
         self.stdout.write(f"Valor Final (Agente): ${final_portfolio_value:12,.2f}")
         self.stdout.write(self.style.SUCCESS(f"Lucro/Prejuízo:       ${profit_loss:12,.2f} ({profit_loss_percent:.2f}%)"))
@@ -159,5 +169,8 @@ class Command(BaseCommand):
         self.stdout.write(f"Lucro/Prejuízo (B&H): ${buy_and_hold_pl:12,.2f} ({buy_and_hold_pl_percent:.2f}%)")
         self.stdout.write("-"*40)
         self.stdout.write(f"Total de Trades: {len(trades)}")
+        if decision_cache.enabled:
+            self.stdout.write(f"Cache de Decisões ({decision_cache.mode}): {decision_cache.hits} acertos, {decision_cache.misses} faltas")
+        decision_cache.close()
         self.stdout.write("="*40)
 
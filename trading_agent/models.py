@@ -21,11 +21,25 @@ class TechnicalAnalysis(models.Model):
         ordering = ['-timestamp']
         unique_together = ('cryptocurrency', 'timeframe', 'timestamp')
 
+class IndicatorState(models.Model):
+    """Estado serializado do motor incremental de indicadores (trading_agent.indicators) por cripto e timeframe."""
+    cryptocurrency = models.ForeignKey(Cryptocurrency, on_delete=models.CASCADE, related_name='indicator_states')
+    timeframe = models.CharField(max_length=10, default='1d')
+    last_open_time = models.BigIntegerField(null=True, blank=True, help_text="Abertura (ms) do último candle fechado processado.")
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Estado de Indicadores"
+        verbose_name_plural = "Estados de Indicadores"
+        unique_together = ('cryptocurrency', 'timeframe')
+
 class MarketSentiment(models.Model):
     cryptocurrency = models.ForeignKey(Cryptocurrency, on_delete=models.CASCADE, related_name='sentiments')
     sentiment_score = models.DecimalField(max_digits=4, decimal_places=2, help_text="De -1.0 (muito negativo) a +1.0 (muito positivo)")
     summary = models.TextField(help_text="Resumo gerado pela IA sobre as notícias e o sentimento.")
-    raw_news_data = models.TextField(blank=True, help_text="Dados brutos (ex: manchetes) usados para a análise.")
+    raw_news_data = models.TextField(blank=True, help_text="(Legado) Manchetes usadas na análise; as análises novas referenciam `articles`.")
+    articles = models.ManyToManyField('NewsArticle', blank=True, related_name='sentiments', help_text="Manchetes usadas na análise.")
     timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
@@ -33,6 +47,33 @@ class MarketSentiment(models.Model):
         verbose_name_plural = "Sentimentos de Mercado"
         ordering = ['-timestamp']
 
+class NewsArticle(models.Model):
+    """Manchete já vista na NewsAPI (só o que a análise de sentimento usa), gravada uma vez por moeda."""
+    cryptocurrency = models.ForeignKey(Cryptocurrency, on_delete=models.CASCADE, related_name='news_articles')
+    url_hash = models.CharField(max_length=64, help_text="SHA-256 da URL, para deduplicar sem indexar a URL inteira.")
+    url = models.URLField(max_length=1000)
+    title = models.CharField(max_length=500)
+    source = models.CharField(max_length=100, blank=True)
+    published_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Notícia"
+        verbose_name_plural = "Notícias"
+        ordering = ['-published_at']
+        unique_together = ('cryptocurrency', 'url_hash')
+
+class NewsCursor(models.Model):
+    """Ponto da ingestão incremental da NewsAPI por moeda e hash do último conjunto de manchetes analisado."""
+    cryptocurrency = models.OneToOneField(Cryptocurrency, on_delete=models.CASCADE, related_name='news_cursor')
+    last_published_at = models.DateTimeField(null=True, blank=True)
+    last_url = models.URLField(max_length=1000, blank=True)
+    headlines_hash = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Cursor de Notícias"
+        verbose_name_plural = "Cursores de Notícias"
+
 class TradingSignal(models.Model):
     DECISION_CHOICES = [('BUY', 'Comprar'), ('SELL', 'Vender'), ('HOLD', 'Manter')]
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='signals')
@@ -57,10 +98,22 @@ class BacktestReport(models.Model):
         ('COMPLETED', 'Concluído'),
         ('FAILED', 'Falhou'),
     ]
+    MODE_CHOICES = [
+        ('SINGLE', 'Simulação Única'),
+        ('SWEEP', 'Varredura de Parâmetros'),
+        ('WALK_FORWARD', 'Walk-Forward'),
+        ('PORTFOLIO', 'Portfólio'),
+        ('MONTE_CARLO', 'Monte Carlo'),
+    ]
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='backtests')
     symbol = models.CharField(max_length=20)
     start_date = models.CharField(max_length=50)
     initial_capital = models.DecimalField(max_digits=20, decimal_places=2)
+    mode = models.CharField(max_length=15, choices=MODE_CHOICES, default='SINGLE')
+    parameters = models.JSONField(default=dict, blank=True, help_text="Parâmetros da simulação (na varredura, a grade de valores).")
+    results = models.JSONField(null=True, blank=True, help_text="Na varredura: tabela de métricas por combinação, ordenada pelo P/L. No walk-forward: parâmetros e P/L de cada janela. No portfólio: contribuição de cada ativo. No Monte Carlo: percentis do valor final e do drawdown.")
+    artifact = models.CharField(max_length=255, blank=True, help_text="Arquivo .npz com curva de patrimônio, drawdown e trades (trading_agent.artifacts).")
+    metrics = models.JSONField(null=True, blank=True, help_text="Sharpe, Sortino, drawdown máximo, exposição e taxa de acerto.")
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
     final_value = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
     profit_loss_percent = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -0,0 +1,66 @@
+# trading_agent/news.py
+"""
+Ingestão incremental da NewsAPI.
+
+Cada execução pede só o que saiu desde o último publishedAt visto (NewsCursor) e grava as
+manchetes novas, sem repetição, em NewsArticle (título, fonte, URL e data). O conjunto analisado
+é sempre o das NEWS_HEADLINES_COUNT manchetes mais recentes; se o hash dele não mudou desde a
+última análise, a chamada ao Gemini é dispensada.
+"""
+import hashlib
+
+from datetime import timezone as dt_timezone
+
+from django.utils.dateparse import parse_datetime
+
+from .models import NewsArticle, NewsCursor
+
+NEWS_HEADLINES_COUNT = 20
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def headlines_hash(articles):
+    return hashlib.sha256("\n".join(sorted(a.url_hash for a in articles)).encode('utf-8')).hexdigest()
+
+
+def news_query(crypto):
+    return f'"{crypto.name}" OR "{crypto.symbol}" AND (crypto OR cryptocurrency OR blockchain)'
+
+
+def ingest_news(newsapi, crypto):
+    """Busca na NewsAPI as notícias de `crypto` publicadas desde o cursor e grava as novas. Retorna quantas."""
+    cursor, _ = NewsCursor.objects.get_or_create(cryptocurrency=crypto)
+    params = {'q': news_query(crypto), 'language': 'en', 'sort_by': 'publishedAt', 'page_size': NEWS_HEADLINES_COUNT}
+    if cursor.last_published_at:
+        # A newsapi-python só aceita YYYY-MM-DD ou YYYY-MM-DDTHH:MM:SS (sem fuso); a NewsAPI usa UTC.
+        params['from_param'] = cursor.last_published_at.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    response = newsapi.get_everything(**params)
+
+    candidates = {}
+    for article in (response or {}).get('articles') or []:
+        url, title = article.get('url'), (article.get('title') or '').strip()
+        published_at = parse_datetime(article.get('publishedAt') or '')
+        if not url or not title or title == '[Removed]' or published_at is None: continue
+        candidates.setdefault(url_hash(url), NewsArticle(
+            cryptocurrency=crypto, url_hash=url_hash(url), url=url[:1000], title=title[:500],
+            source=((article.get('source') or {}).get('name') or '')[:100], published_at=published_at,
+        ))
+    # A NewsAPI devolve de novo as notícias publicadas no mesmo instante do cursor.
+    known = set(NewsArticle.objects.filter(cryptocurrency=crypto, url_hash__in=candidates).values_list('url_hash', flat=True))
+    new_articles = [a for h, a in candidates.items() if h not in known]
+    if not new_articles:
+        return 0
+
+    NewsArticle.objects.bulk_create(new_articles, ignore_conflicts=True)
+    newest = max(new_articles, key=lambda a: a.published_at)
+    if cursor.last_published_at is None or newest.published_at >= cursor.last_published_at:
+        cursor.last_published_at, cursor.last_url = newest.published_at, newest.url
+        cursor.save(update_fields=['last_published_at', 'last_url', 'updated_at'])
+    return len(new_articles)
+
+
+def latest_headlines(crypto):
+    return list(NewsArticle.objects.filter(cryptocurrency=crypto).order_by('-published_at')[:NEWS_HEADLINES_COUNT])
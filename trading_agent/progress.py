@@ -0,0 +1,86 @@
+# trading_agent/progress.py
+"""
+Andamento dos backtests publicado no cache (Redis) em vez de lido do banco.
+
+Cada relatório tem um evento (status, total, unidade, início) gravado só nas mudanças de estado, e
+contadores separados para as unidades processadas e a sequência: as tarefas chamam
+`BacktestProgress.advance()` conforme processam barras, combinações ou janelas (inclusive de workers
+diferentes) sem reescrever o evento, então nenhum avanço simultâneo apaga outro. `get_progress()`
+junta tudo na leitura e calcula o ETA. Toda gravação de BacktestReport publica o status
+(trading_agent.signals). A página acompanha por long polling em `backtest_progress_view`.
+"""
+import time
+
+from django.core.cache import cache
+
+PROGRESS_KEY = "backtest-progress:{report_id}"
+DONE_KEY = "backtest-progress:{report_id}:done"
+SEQ_KEY = "backtest-progress:{report_id}:seq"
+# Patrimônio e mensagem do último avanço (o último a gravar vence; não afetam status nem contagem).
+LIVE_KEY = "backtest-progress:{report_id}:live"
+PROGRESS_TTL = 24 * 3600
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED')
+
+
+def get_progress(report_id):
+    keys = {name: key.format(report_id=report_id) for name, key in
+            (('event', PROGRESS_KEY), ('done', DONE_KEY), ('seq', SEQ_KEY), ('live', LIVE_KEY))}
+    values = cache.get_many(list(keys.values()))
+    event = values.get(keys['event'])
+    if event is None:
+        return None
+    live = values.get(keys['live']) or {}
+    event = {**event, 'done': values.get(keys['done'], event.get('done')), 'seq': values.get(keys['seq'], event.get('seq'))}
+    if live.get('equity') is not None:
+        event['equity'] = live['equity']
+    if live.get('updated_at', 0) > event.get('updated_at', 0):
+        event['message'], event['updated_at'] = live.get('message'), live['updated_at']
+
+    event['eta_seconds'] = None
+    if event.get('total') and event.get('done') and event.get('started_at') and event.get('status') not in TERMINAL_STATUSES:
+        elapsed = time.time() - event['started_at']
+        event['eta_seconds'] = round(elapsed / event['done'] * (event['total'] - event['done']), 1)
+    return event
+
+
+def _incr(key, delta):
+    # cache.incr falha se a chave não existe; add() é atômico e só cria se ainda não houver valor.
+    cache.add(key, 0, timeout=PROGRESS_TTL)
+    return cache.incr(key, delta)
+
+
+class BacktestProgress:
+    def __init__(self, report_id):
+        self.report_id = report_id
+
+    def _key(self, key):
+        return key.format(report_id=self.report_id)
+
+    def _publish(self, **fields):
+        # Só mudanças de estado (status/início) passam por aqui, não os avanços dos workers.
+        event = {**(cache.get(self._key(PROGRESS_KEY)) or {}), **fields, 'updated_at': time.time()}
+        event['seq'] = _incr(self._key(SEQ_KEY), 1)
+        cache.set(self._key(PROGRESS_KEY), event, timeout=PROGRESS_TTL)
+        return get_progress(self.report_id)
+
+    def status(self, status, profile_id=None, message=None):
+        fields = {'status': status, 'message': message}
+        if profile_id is not None:
+            fields['profile_id'] = profile_id
+        return self._publish(**fields)
+
+    def start(self, total, unit, message=None):
+        """Começa a contagem de `total` unidades ('barras', 'combinações', 'janelas', 'ativos')."""
+        cache.set(self._key(DONE_KEY), 0, timeout=PROGRESS_TTL)
+        cache.delete(self._key(LIVE_KEY))
+        return self._publish(status='RUNNING', done=0, total=total, unit=unit, equity=None, started_at=time.time(), message=message)
+
+    def advance(self, count=1, equity=None, message=None):
+        _incr(self._key(DONE_KEY), count)
+        if equity is not None:
+            equity = round(float(equity), 2)
+        else:
+            equity = (cache.get(self._key(LIVE_KEY)) or {}).get('equity')
+        cache.set(self._key(LIVE_KEY), {'equity': equity, 'message': message, 'updated_at': time.time()}, timeout=PROGRESS_TTL)
+        _incr(self._key(SEQ_KEY), 1)
+        return get_progress(self.report_id)
@@ -0,0 +1,55 @@
+# trading_agent/rate_limit.py
+"""
+Balde de fichas por chave de API do Gemini, guardado no cache (Redis) para valer entre todos os
+workers: cada chave tem GEMINI_REQUESTS_PER_MINUTE fichas por janela de um minuto. Quem não
+consegue ficha espera a próxima janela (ou desiste no prazo dado), em vez de dormir um tempo fixo.
+"""
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.encryption import fingerprint
+
+BUCKET_KEY = "gemini-bucket:{name}:{window}"
+
+
+class TokenBucket:
+    def __init__(self, name, capacity, period=60):
+        self.name, self.capacity, self.period = name, capacity, period
+
+    @classmethod
+    def for_api_key(cls, api_key):
+        return cls(fingerprint(api_key), getattr(settings, 'GEMINI_REQUESTS_PER_MINUTE', 10))
+
+    def try_acquire(self):
+        """Consome uma ficha. Retorna 0 se conseguiu ou os segundos até a próxima janela."""
+        now = time.time()
+        window = int(now // self.period)
+        key = BUCKET_KEY.format(name=self.name, window=window)
+        cache.add(key, 0, timeout=self.period + 5)
+        try:
+            used = cache.incr(key)
+        except ValueError:  # a chave expirou entre o add e o incr
+            cache.add(key, 1, timeout=self.period + 5)
+            used = 1
+        if used <= self.capacity:
+            return 0
+        return (window + 1) * self.period - now
+
+    def acquire(self, timeout, cancelled=None):
+        """Espera por uma ficha por até `timeout` segundos (ou até `cancelled` ser sinalizado)."""
+        deadline = time.monotonic() + timeout
+        while not (cancelled and cancelled.is_set()):
+            wait = self.try_acquire()
+            if not wait:
+                return True
+            wait += random.uniform(0, 0.5)  # espalha os workers que acordam na virada da janela
+            if time.monotonic() + wait > deadline:
+                return False
+            if cancelled:
+                cancelled.wait(wait)
+            else:
+                time.sleep(wait)
+        return False
@@ -0,0 +1,68 @@
+# trading_agent/result_cache.py
+"""
+Cache de resultados de simulações únicas (BacktestReport.mode == 'SINGLE').
+
+A chave combina os parâmetros da estratégia com uma impressão digital dos candles usados: quando
+chega uma barra nova (ou um candle é corrigido) a chave muda e a entrada antiga simplesmente deixa
+de ser encontrada, até sair pela política LRU. Um acerto preenche o novo relatório copiando os
+resultados guardados, inclusive o artefato (.npz), que é compartilhado e não é recalculado.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+RESULT_KEY = "backtest-result:{key}"
+LRU_INDEX_KEY = "backtest-result:lru"
+CLONED_FIELDS = ('final_value', 'profit_loss_percent', 'buy_and_hold_profit_loss_percent', 'total_trades', 'parameters', 'artifact', 'metrics')
+
+
+def data_fingerprint(klines):
+    """Hash de (abertura, fechamento) de todos os candles: muda com barras novas, buracos preenchidos ou correções."""
+    digest = hashlib.sha256()
+    for kline in klines:
+        digest.update(f"{kline[0]}:{kline[4]};".encode())
+    return f"{len(klines)}:{digest.hexdigest()}"
+
+
+def result_key(symbol, start_ms, initial_capital, buy_risk_percentage, sell_risk_percentage, fingerprint):
+    # float(): Decimal('1000') (formulário) e Decimal('1000.00') (banco) precisam gerar a mesma chave.
+    content = json.dumps([symbol, start_ms, float(initial_capital), float(buy_risk_percentage), float(sell_risk_percentage), fingerprint])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class BacktestResultCache:
+    def __init__(self, max_entries=None, ttl=None):
+        # max_entries: resultados mantidos (os menos usados recentemente saem primeiro).
+        # ttl: tempo (s) que uma entrada fica no cache mesmo sem ser despejada.
+        self.max_entries = max_entries if max_entries is not None else getattr(settings, 'BACKTEST_RESULT_CACHE_SIZE', 256)
+        self.ttl = ttl if ttl is not None else getattr(settings, 'BACKTEST_RESULT_CACHE_TTL', 2 * 24 * 3600)
+
+    def get(self, key):
+        entry = cache.get(RESULT_KEY.format(key=key))
+        if entry is not None:
+            self._touch(key)
+        return entry
+
+    def put(self, key, report):
+        cache.set(RESULT_KEY.format(key=key), {field: getattr(report, field) for field in CLONED_FIELDS}, timeout=self.ttl)
+        self._touch(key)
+
+    def _touch(self, key):
+        # Índice LRU: lista de chaves da menos para a mais recente. Uma corrida entre workers, no pior
+        # caso, deixa uma entrada despejada viva até o TTL.
+        index = [k for k in cache.get(LRU_INDEX_KEY, []) if k != key] + [key]
+        evicted, index = index[:-self.max_entries], index[-self.max_entries:]
+        if evicted:
+            cache.delete_many([RESULT_KEY.format(key=k) for k in evicted])
+        cache.set(LRU_INDEX_KEY, index, timeout=None)
+
+    @staticmethod
+    def apply(entry, report):
+        """Preenche `report` com um resultado do cache (sem salvar)."""
+        for field, value in entry.items():
+            setattr(report, field, value)
+        report.status, report.error_message, report.completed_at = 'COMPLETED', None, timezone.now()
+        return report
@@ -1,6 +1,4 @@
 # trading_agent/services.py
-import requests
-import json
 from decimal import Decimal
 from django.conf import settings
 from django.utils import timezone
@@ -9,11 +7,9 @@ from .models import TradingSignal
 from core.models import UserProfile, Cryptocurrency, Holding
 from binance.client import Client
 from binance.exceptions import BinanceAPIException
+from core.gemini import gemini_client
 from core.views import get_binance_client, _process_successful_order
-
-def get_gemini_api_url(model_name: str):
-    """Constrói a URL da API para o modelo Gemini especificado."""
-    return f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
+from core.symbol_rules import symbol_rules
 
 def get_gemini_sentiment_analysis(profile: UserProfile, crypto: Cryptocurrency, headlines: str):
     """
@@ -25,21 +21,17 @@ def get_gemini_sentiment_analysis(profile: UserProfile, crypto: Cryptocurrency,
         return None
 
     model_name = profile.gemini_model
-    api_url = get_gemini_api_url(model_name) + f"?key={gemini_api_key}"
-    
     prompt = f"Analise o sentimento das seguintes manchetes sobre {crypto.name} ({crypto.symbol}). Responda com um score de -1.0 (muito negativo) a 1.0 (muito positivo) e um breve resumo.\n\nNotícias:\n{headlines}"
     json_schema = {"type": "OBJECT", "properties": {"sentiment_score": {"type": "NUMBER"}, "summary": {"type": "STRING"}}, "required": ["sentiment_score", "summary"]}
     payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"responseMimeType": "application/json", "responseSchema": json_schema, "temperature": 0.2}}
 
     try:
-        response = requests.post(api_url, headers={'Content-Type': 'application/json'}, json=payload, timeout=45)
-        response.raise_for_status()
-        return json.loads(response.json()['candidates'][0]['content']['parts'][0]['text'])
+        return gemini_client.generate_json(model_name, gemini_api_key, payload, read_timeout=45)
     except Exception as e:
         print(f"Erro na API Gemini ({model_name}) para Sentimento: {e}")
     return None
 
-def get_gemini_trade_decision(profile: UserProfile, crypto: Cryptocurrency, tech_data_history: list, sentiment_data_history: list, holding_data: Holding, save_signal=True):
+def _tech_prompt_section(tech_data_history: list):
     tech_lines = []
     for i, d in enumerate(reversed(tech_data_history)):
         try:
@@ -56,44 +48,121 @@ def get_gemini_trade_decision(profile: UserProfile, crypto: Cryptocurrency, tech
         macd_diff = macd_line - macd_signal
         
         tech_lines.append(f"  - Dia T-{i}: RSI={rsi:.2f}, MACD_diff={macd_diff:.8f}, ATR={atr:.8f}")
-    
-    tech_prompt_section = "\n".join(tech_lines)
-    sentiment_prompt_section = "\n".join([f"  - Dia T-{i}: Score={getattr(d, 'sentiment_score', 0.5):.2f}, Resumo: \"{getattr(d, 'summary', 'N/A')}\"" for i, d in enumerate(reversed(sentiment_data_history))])
+    return "\n".join(tech_lines)
+
+def _sentiment_prompt_section(sentiment_data_history: list):
+    return "\n".join([f"  - Dia T-{i}: Score={getattr(d, 'sentiment_score', 0.5):.2f}, Resumo: \"{getattr(d, 'summary', 'N/A')}\"" for i, d in enumerate(reversed(sentiment_data_history))])
+
+def get_gemini_trade_decision(profile: UserProfile, crypto: Cryptocurrency, tech_data_history: list, sentiment_data_history: list, holding_data: Holding, save_signal=True, decision_cache=None, position=None):
+    # position: texto da posição no prompt; por padrão, a quantidade do holding_data.
+    position = position or f"{holding_data.quantity if holding_data else '0'} {crypto.symbol}"
+    tech_prompt_section = _tech_prompt_section(tech_data_history)
+    sentiment_prompt_section = _sentiment_prompt_section(sentiment_data_history)
     adaptive_strategy_section = f"**Modificações de Estratégia Ativas:**\n{profile.agent_strategy_prompt}" if profile.agent_strategy_prompt else ""
     
     # (APRIMORADO) Prompt mais direto para incentivar decisões.
-    prompt = f"Você é um analista quantitativo. Seu objetivo é identificar e agir em oportunidades de trade claras para {crypto.symbol}. Analise os dados e gere um sinal de 'BUY' ou 'SELL' se houver uma confluência forte de indicadores. Caso contrário, gere 'HOLD'.\n\n**Contexto:**\n- Possui: {holding_data.quantity if holding_data else '0'} {crypto.symbol}\n- Preço Atual: {crypto.current_price}\n\n**Dados Históricos:**\n- Análise Técnica:\n{tech_prompt_section}\n- Análise de Sentimento:\n{sentiment_prompt_section}\n\n{adaptive_strategy_section}\n**Instruções:**\n1. Gere um sinal 'BUY' ou 'SELL' apenas se houver uma oportunidade clara.\n2. Forneça um score de confiança alto (acima de 0.7) para sinais de compra/venda.\n3. Justifique sua decisão com base nos dados."
-
-    gemini_api_key = profile.gemini_api_key
-    if not gemini_api_key or "DECRYPTION_FAILED" in gemini_api_key:
-        print(f"Chave da API Gemini não configurada para o usuário {profile.user.username}.")
-        return None
+    prompt = f"Você é um analista quantitativo. Seu objetivo é identificar e agir em oportunidades de trade claras para {crypto.symbol}. Analise os dados e gere um sinal de 'BUY' ou 'SELL' se houver uma confluência forte de indicadores. Caso contrário, gere 'HOLD'.\n\n**Contexto:**\n- Possui: {position}\n- Preço Atual: {crypto.current_price}\n\n**Dados Históricos:**\n- Análise Técnica:\n{tech_prompt_section}\n- Análise de Sentimento:\n{sentiment_prompt_section}\n\n{adaptive_strategy_section}\n**Instruções:**\n1. Gere um sinal 'BUY' ou 'SELL' apenas se houver uma oportunidade clara.\n2. Forneça um score de confiança alto (acima de 0.7) para sinais de compra/venda.\n3. Justifique sua decisão com base nos dados."
 
     model_name = profile.gemini_model
-    api_url = get_gemini_api_url(model_name) + f"?key={gemini_api_key}"
     json_schema = {"type": "OBJECT", "properties": {"decision": {"type": "STRING", "enum": ["BUY", "SELL", "HOLD"]},"confidence_score": {"type": "NUMBER"},"stop_loss_price": {"type": "NUMBER"},"take_profit_price": {"type": "NUMBER"},"justification": {"type": "STRING"}}, "required": ["decision", "confidence_score", "justification"]}
     payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"responseMimeType": "application/json", "responseSchema": json_schema, "temperature": 0.3}}
 
+    # Backtests podem usar um cache local de decisões (trading_agent.decision_cache).
+    cache_key = decision_cache.key(model_name, prompt, payload['generationConfig']) if decision_cache and decision_cache.enabled else None
+    decision_data = decision_cache.get(cache_key) if cache_key else None
+    if decision_data is None and cache_key and decision_cache.mode == 'replay':
+        print(f"Decisão {cache_key[:12]} não encontrada no cache de replay.")
+        return None
+
+    gemini_api_key = profile.gemini_api_key if decision_data is None else None
+    if decision_data is None and (not gemini_api_key or "DECRYPTION_FAILED" in gemini_api_key):
+        print(f"Chave da API Gemini não configurada para o usuário {profile.user.username}.")
+        return None
+
     try:
-        response = requests.post(api_url, headers={'Content-Type': 'application/json'}, json=payload, timeout=45)
-        response.raise_for_status()
-        decision_data = json.loads(response.json()['candidates'][0]['content']['parts'][0]['text'])
+        if decision_data is None:
+            decision_data = gemini_client.generate_json(model_name, gemini_api_key, payload, read_timeout=45)
+            if cache_key:
+                decision_cache.put(cache_key, model_name, prompt, decision_data)
 
         if save_signal:
-            TradingSignal.objects.create(
-                user_profile=profile, cryptocurrency=crypto,
-                decision=decision_data.get('decision'),
-                confidence_score=Decimal(str(decision_data.get('confidence_score', '0.0'))),
-                stop_loss_price=Decimal(str(decision_data.get('stop_loss_price'))) if decision_data.get('stop_loss_price') else None,
-                take_profit_price=Decimal(str(decision_data.get('take_profit_price'))) if decision_data.get('take_profit_price') else None,
-                justification=decision_data.get('justification', 'N/A')
-            )
+            save_trading_signal(profile, crypto, decision_data)
         return decision_data
     except Exception as e:
         print(f"Erro na API Gemini ({profile.gemini_model}) para decisão: {e}")
-        if 'response' in locals(): print(f"Resposta da API: {response.text}")
+        if getattr(e, 'response', None) is not None: print(f"Resposta da API: {e.response.text}")
     return None
 
+DECISIONS = ('BUY', 'SELL', 'HOLD')
+
+def get_gemini_batch_trade_decisions(profile: UserProfile, contexts: list):
+    """
+    Decide todas as moedas em UMA chamada. `contexts` é uma lista de
+    (crypto, tech_data_history, sentiment_data_history, position), com `position` como em
+    get_gemini_trade_decision. Retorna {símbolo: decision_data} só com as decisões válidas, ou None.
+    """
+    gemini_api_key = profile.gemini_api_key
+    if not gemini_api_key or "DECRYPTION_FAILED" in gemini_api_key:
+        print(f"Chave da API Gemini não configurada para o usuário {profile.user.username}.")
+        return None
+
+    asset_sections = "\n\n".join(
+        f"### {crypto.symbol}\n- Possui: {position}\n- Preço Atual: {crypto.current_price}\n- Análise Técnica:\n{_tech_prompt_section(tech)}\n- Análise de Sentimento:\n{_sentiment_prompt_section(sentiments)}"
+        for crypto, tech, sentiments, position in contexts
+    )
+    adaptive_strategy_section = f"**Modificações de Estratégia Ativas:**\n{profile.agent_strategy_prompt}" if profile.agent_strategy_prompt else ""
+    prompt = f"Você é um analista quantitativo. Seu objetivo é identificar e agir em oportunidades de trade claras em cada um dos ativos abaixo. Para cada ativo, gere um sinal de 'BUY' ou 'SELL' se houver uma confluência forte de indicadores. Caso contrário, gere 'HOLD'.\n\n**Ativos:**\n\n{asset_sections}\n\n{adaptive_strategy_section}\n**Instruções:**\n1. Responda com exatamente uma decisão por ativo, identificada pelo campo 'symbol'.\n2. Gere um sinal 'BUY' ou 'SELL' apenas se houver uma oportunidade clara.\n3. Forneça um score de confiança alto (acima de 0.7) para sinais de compra/venda.\n4. Justifique cada decisão com base nos dados do próprio ativo."
+
+    symbols = [crypto.symbol for crypto, *_ in contexts]
+    model_name = profile.gemini_model
+    item_schema = {"type": "OBJECT", "properties": {"symbol": {"type": "STRING", "enum": symbols}, "decision": {"type": "STRING", "enum": list(DECISIONS)},"confidence_score": {"type": "NUMBER"},"stop_loss_price": {"type": "NUMBER"},"take_profit_price": {"type": "NUMBER"},"justification": {"type": "STRING"}}, "required": ["symbol", "decision", "confidence_score", "justification"]}
+    payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"responseMimeType": "application/json", "responseSchema": {"type": "ARRAY", "items": item_schema}, "temperature": 0.3}}
+
+    try:
+        # Mais ativos, mais texto para gerar: o timeout de leitura cresce com o lote.
+        items = gemini_client.generate_json(model_name, gemini_api_key, payload, read_timeout=45 + 10 * len(contexts))
+    except Exception as e:
+        print(f"Erro na API Gemini ({model_name}) para decisão em lote: {e}")
+        if getattr(e, 'response', None) is not None: print(f"Resposta da API: {e.response.text}")
+        return None
+    decisions = split_batch_decisions(items, symbols)
+    missing = set(symbols) - set(decisions)
+    if missing: print(f"Decisão em lote sem resposta válida para: {', '.join(sorted(missing))}.")
+    return decisions or None
+
+def split_batch_decisions(items, symbols):
+    """Valida a resposta em lote: só itens de símbolos pedidos (o primeiro de cada), decisão conhecida e confiança numérica."""
+    decisions = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict): continue
+        symbol = str(item.get('symbol', '')).upper()
+        if symbol not in symbols or symbol in decisions or item.get('decision') not in DECISIONS: continue
+        try:
+            confidence = min(max(float(item.get('confidence_score')), 0.0), 1.0)
+        except (TypeError, ValueError):
+            continue
+        decision = {**item, 'symbol': symbol, 'confidence_score': round(confidence, 2)}
+        for price_field in ('stop_loss_price', 'take_profit_price'):
+            if not isinstance(decision.get(price_field), (int, float)) or decision[price_field] <= 0:
+                decision.pop(price_field, None)
+        decisions[symbol] = decision
+    return decisions
+
+def build_trading_signal(profile: UserProfile, crypto: Cryptocurrency, decision_data: dict):
+    return TradingSignal(
+        user_profile=profile, cryptocurrency=crypto,
+        decision=decision_data.get('decision'),
+        confidence_score=Decimal(str(decision_data.get('confidence_score', '0.0'))),
+        stop_loss_price=Decimal(str(decision_data.get('stop_loss_price'))) if decision_data.get('stop_loss_price') else None,
+        take_profit_price=Decimal(str(decision_data.get('take_profit_price'))) if decision_data.get('take_profit_price') else None,
+        justification=decision_data.get('justification', 'N/A')
+    )
+
+def save_trading_signal(profile: UserProfile, crypto: Cryptocurrency, decision_data: dict):
+    signal = build_trading_signal(profile, crypto, decision_data)
+    signal.save()
+    return signal
+
 def get_gemini_reflection(profile: UserProfile, performance_data_str: str):
     gemini_api_key = profile.gemini_api_key
     if not gemini_api_key or "DECRYPTION_FAILED" in gemini_api_key:
@@ -103,14 +172,11 @@ def get_gemini_reflection(profile: UserProfile, performance_data_str: str):
     prompt = f"Você é um gestor de risco. Analise o relatório de performance de um agente de IA e forneça uma reflexão e sugestões concretas para melhorar a estratégia.\n\nRelatório:\n{performance_data_str}\n\nSua tarefa:\n1.  **Reflexão (ai_reflection):** O que funcionou e o que não funcionou?\n2.  **Sugestões (suggested_modifications):** Sugira 1-2 regras claras e acionáveis. Exemplo: 'Se RSI > 75, considere vender parte da posição.' ou 'Evite comprar se ATR estiver 50% acima da média.'"
     
     model_name = profile.gemini_model
-    api_url = get_gemini_api_url(model_name) + f"?key={gemini_api_key}"
     json_schema = {"type": "OBJECT", "properties": {"ai_reflection": {"type": "STRING"}, "suggested_modifications": {"type": "STRING"}}, "required": ["ai_reflection", "suggested_modifications"]}
     payload = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": {"responseMimeType": "application/json", "responseSchema": json_schema, "temperature": 0.5}}
 
     try:
-        response = requests.post(api_url, headers={'Content-Type': 'application/json'}, json=payload, timeout=60)
-        response.raise_for_status()
-        return json.loads(response.json()['candidates'][0]['content']['parts'][0]['text'])
+        return gemini_client.generate_json(model_name, gemini_api_key, payload, read_timeout=60)
     except Exception as e:
         print(f"Erro na API Gemini ({profile.gemini_model}) para reflexão: {e}")
     return None
@@ -134,11 +200,7 @@ def execute_trade_from_signal(signal: TradingSignal):
         elif signal.decision == 'SELL':
             holding = Holding.objects.get(user_profile=signal.user_profile, cryptocurrency=crypto)
             quantity_to_sell = holding.quantity * (signal.user_profile.agent_sell_risk_percentage / Decimal('100.0'))
-            symbol_info = client.get_symbol_info(api_symbol)
-            lot_size_filter = next((f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'), None)
-            if lot_size_filter:
-                from core.views import adjust_quantity_to_lot_size
-                quantity_to_sell = adjust_quantity_to_lot_size(str(quantity_to_sell), lot_size_filter['stepSize'])
+            quantity_to_sell = symbol_rules.get(api_symbol, client, signal.user_profile.use_testnet).adjust_quantity(quantity_to_sell)
             if quantity_to_sell <= 0:
                 signal.justification += "\n[Execução Falhou: Quantidade a vender é zero]"
                 signal.save()
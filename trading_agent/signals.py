@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import BacktestReport
+from .progress import BacktestProgress, get_progress
+
+
+@receiver(post_save, sender=BacktestReport)
+def publish_backtest_status(sender, instance, **kwargs):
+    # Toda mudança de status chega à página pelo cache, sem que ela precise consultar o banco.
+    previous = get_progress(instance.id)
+    if previous and previous.get('status') == instance.status:
+        return
+    BacktestProgress(instance.id).status(instance.status, profile_id=instance.user_profile_id, message=instance.error_message)
@@ -1,54 +1,78 @@
 # trading_agent/tasks.py
-import pandas as pd
-import pandas_ta as ta
+import numpy as np
 import requests
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from decimal import Decimal
-from celery import shared_task
+from celery import chord, shared_task
+from functools import lru_cache
 from django.utils import timezone
-from datetime import timedelta
+from datetime import timedelta, datetime, timezone as dt_timezone
 from django.db.models import F, Sum, Q, Value, CharField
 from django.db.models.functions import Concat
 from django.shortcuts import get_object_or_404
 
 from django.conf import settings
 from binance.client import Client
+from binance.helpers import date_to_milliseconds, interval_to_milliseconds
 from newsapi import NewsApiClient
 
 from core.models import Cryptocurrency, UserProfile, Holding, Transaction
-from .models import TechnicalAnalysis, MarketSentiment, TradingSignal, BacktestReport, StrategyLog
-from .services import get_gemini_trade_decision, execute_trade_from_signal, get_gemini_sentiment_analysis, get_gemini_reflection
+from core.price_cache import PriceCache
+from core.klines import KlineStore
+from .backtest import (
+    WARMUP_BARS, align_closes, compute_indicators, distribution_summary, evaluate_combinations, evaluate_window, klines_to_frame,
+    monte_carlo, parameter_grid, portfolio_signal_masks, rank_results, run_strategy, simulate_portfolio, stitch_equity,
+    trade_returns, walk_forward_windows,
+)
+from .artifacts import save_artifact
+from .decision_groups import group_profiles
+from .indicators import IndicatorEngine
+from .news import headlines_hash, ingest_news, latest_headlines
+from .progress import BacktestProgress
+from .rate_limit import TokenBucket
+from .result_cache import BacktestResultCache, data_fingerprint, result_key
+from .models import TechnicalAnalysis, IndicatorState, MarketSentiment, NewsCursor, TradingSignal, BacktestReport, StrategyLog
+from .services import get_gemini_batch_trade_decisions, execute_trade_from_signal, get_gemini_sentiment_analysis, get_gemini_reflection, build_trading_signal
+
+INDICATOR_WARMUP_BARS = 200
 
 @shared_task(name="trading_agent.tasks.calculate_technical_indicators_for_all_cryptos")
-def calculate_technical_indicators_for_all_cryptos():
-    client = Client()
+def calculate_technical_indicators_for_all_cryptos(timeframe=Client.KLINE_INTERVAL_1DAY):
+    # Cada execução só processa os candles fechados desde a anterior; o estado dos indicadores fica em IndicatorState.
+    kline_store = KlineStore()
+    now_ms = int(timezone.now().timestamp() * 1000)
+    warmup_start_ms = now_ms - INDICATOR_WARMUP_BARS * interval_to_milliseconds(timeframe)
     for crypto in Cryptocurrency.objects.all():
         try:
-            klines = client.get_klines(symbol=f"{crypto.symbol}{crypto.price_currency}", interval=Client.KLINE_INTERVAL_1DAY, limit=200)
-            if not klines: continue
-            
-            df = pd.DataFrame(klines, columns=['time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'])
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col])
-            
-            df.ta.rsi(length=14, append=True); df.ta.macd(fast=12, slow=26, signal=9, append=True)
-            df.ta.bbands(length=20, std=2, append=True); df.ta.atr(length=14, append=True)
-            
-            latest = df.iloc[-1]
+            state, _ = IndicatorState.objects.get_or_create(cryptocurrency=crypto, timeframe=timeframe)
+            start_ms = state.last_open_time + 1 if state.last_open_time is not None else warmup_start_ms
+            klines = kline_store.fetch(f"{crypto.symbol}{crypto.price_currency}", timeframe, start_ms)
+            closed_klines = [k for k in klines if k[6] < now_ms]
+            if not closed_klines: continue
+
+            engine = IndicatorEngine(state.state)
+            for kline in closed_klines:
+                values = engine.update(kline[2], kline[3], kline[4])
+            state.state, state.last_open_time = engine.to_state(), closed_klines[-1][0]
+            state.save()
+
             TechnicalAnalysis.objects.update_or_create(
-                cryptocurrency=crypto, timeframe='1d', timestamp__date=timezone.now().date(),
-                defaults={
-                    'rsi': latest.get('RSI_14'), 'macd_line': latest.get('MACD_12_26_9'),
-                    'macd_signal': latest.get('MACDs_12_26_9'), 'bollinger_high': latest.get('BBU_20_2.0'),
-                    'bollinger_low': latest.get('BBL_20_2.0'), 'atr': latest.get('ATRr_14'),
-                    'timestamp': timezone.now()
-                }
+                cryptocurrency=crypto, timeframe=timeframe,
+                timestamp=datetime.fromtimestamp((closed_klines[-1][6] + 1) / 1000, tz=dt_timezone.utc),
+                defaults=values
             )
         except Exception as e:
             print(f"Erro ao calcular indicadores para {crypto.symbol}: {e}")
     return "Análises técnicas concluídas."
 
+def _tracked_cryptocurrencies():
+    # TRADING_AGENT_SYMBOLS vazio acompanha todas as moedas cadastradas (as mesmas da análise técnica).
+    symbols = getattr(settings, 'TRADING_AGENT_SYMBOLS', ['BTC', 'ETH'])
+    return Cryptocurrency.objects.filter(symbol__in=symbols) if symbols else Cryptocurrency.objects.all()
+
 @shared_task(name="trading_agent.tasks.analyze_market_sentiment_for_all_cryptos")
 def analyze_market_sentiment_for_all_cryptos():
     newsapi = NewsApiClient(api_key=settings.NEWS_API_KEY)
@@ -58,58 +82,107 @@ def analyze_market_sentiment_for_all_cryptos():
 
     profile_for_analysis = profiles_with_keys.first()
     
-    cryptos_to_analyze = Cryptocurrency.objects.filter(symbol__in=['BTC', 'ETH']) 
+    cryptos_to_analyze = _tracked_cryptocurrencies()
+    bucket, analyzed, unchanged = TokenBucket.for_api_key(profile_for_analysis.gemini_api_key), 0, 0
     
     for crypto in cryptos_to_analyze:
         try:
-            query = f'"{crypto.name}" OR "{crypto.symbol}" AND (crypto OR cryptocurrency OR blockchain)'
-            all_articles = newsapi.get_everything(q=query, language='en', sort_by='relevancy', page_size=20)
-            if not all_articles or not all_articles.get('articles'): continue
+            new_count = ingest_news(newsapi, crypto)
+            articles = latest_headlines(crypto)
+            if not articles: continue
+
+            # Mesmas manchetes da última análise: o sentimento não muda, nada de chamada ao Gemini nem linha nova.
+            cursor, digest = NewsCursor.objects.get(cryptocurrency=crypto), headlines_hash(articles)
+            if digest == cursor.headlines_hash:
+                unchanged += 1
+                continue
 
-            headlines = "\n".join([article['title'] for article in all_articles['articles']])
-            sentiment_data = get_gemini_sentiment_analysis(profile_for_analysis, crypto, headlines)
+            print(f"{crypto.symbol}: {new_count} notícia(s) nova(s); analisando {len(articles)} manchetes.")
+            if not bucket.acquire(timeout=60): continue
+            sentiment_data = get_gemini_sentiment_analysis(profile_for_analysis, crypto, "\n".join(a.title for a in articles))
 
             if sentiment_data:
-                MarketSentiment.objects.update_or_create(
+                sentiment, _ = MarketSentiment.objects.update_or_create(
                     cryptocurrency=crypto, timestamp__date=timezone.now().date(),
                     defaults={
                         'sentiment_score': sentiment_data.get('sentiment_score'),
                         'summary': sentiment_data.get('summary'),
-                        'raw_news_data': headlines, 'timestamp': timezone.now()
+                        'raw_news_data': '', 'timestamp': timezone.now()
                     }
                 )
-                time.sleep(5)
+                sentiment.articles.set(articles)
+                cursor.headlines_hash = digest
+                cursor.save(update_fields=['headlines_hash', 'updated_at'])
+                analyzed += 1
         except Exception as e:
             print(f"Erro ao analisar sentimento para {crypto.symbol}: {e}")
-    return f"Análises de sentimento concluídas."
+    return f"Análises de sentimento concluídas: {analyzed} analisada(s), {unchanged} sem notícias novas."
+
+def _decide_concurrently(jobs, timeout):
+    """
+    Pede as decisões ao Gemini em paralelo (até GEMINI_MAX_CONCURRENCY threads): uma chamada em lote,
+    com todas as moedas, por grupo de perfis (trading_agent.decision_groups), com cada chave de API
+    limitada pelo seu TokenBucket. O que não termina em `timeout` segundos é cancelado e descartado.
+    As threads só fazem a chamada HTTP; os sinais são gravados por quem chama, na thread da tarefa.
+    Retorna ([(job, {símbolo: decision_data}), ...], número de chamadas canceladas pelo prazo).
+    """
+    cancelled, deadline = threading.Event(), time.monotonic() + timeout
+
+    def decide(job):
+        group, history = job
+        contexts = [(crypto, *history[crypto.pk], group.position(crypto)) for crypto in group.cryptos]
+        # Se a chave de um membro falhar, outro membro do grupo tenta.
+        for profile in group.callers():
+            if not TokenBucket.for_api_key(profile.gemini_api_key).acquire(deadline - time.monotonic(), cancelled):
+                return None
+            decisions = get_gemini_batch_trade_decisions(profile, contexts)
+            if decisions:
+                return decisions
+        return None
+
+    executor = ThreadPoolExecutor(max_workers=getattr(settings, 'GEMINI_MAX_CONCURRENCY', 16), thread_name_prefix='gemini')
+    futures = {executor.submit(decide, job): job for job in jobs}
+    done, pending = wait(futures, timeout=timeout)
+    cancelled.set()
+    # As chamadas em andamento terminam sozinhas (timeout do requests); o resultado delas é ignorado.
+    executor.shutdown(wait=False, cancel_futures=True)
+    decisions = [(futures[f], f.result()) for f in done if f.exception() is None and f.result()]
+    return decisions, len(pending)
 
 @shared_task(name="trading_agent.tasks.run_trading_cycle_for_all_users")
 def run_trading_cycle_for_all_users():
-    active_profiles = UserProfile.objects.filter(enable_auto_trading=True).exclude(Q(_gemini_api_key__isnull=True) | Q(_gemini_api_key__exact=''))
+    active_profiles = list(
+        UserProfile.objects.filter(enable_auto_trading=True).exclude(Q(_gemini_api_key__isnull=True) | Q(_gemini_api_key__exact='')).select_related('user')
+    )
     if not active_profiles: return "Nenhum usuário com trading automático e chave de IA ativado."
-    
-    cryptos_to_analyze = Cryptocurrency.objects.filter(symbol__in=['BTC', 'ETH'])
-    
+    active_profiles = [p for p in active_profiles if "DECRYPTION_FAILED" not in p.gemini_api_key]
+
+    cryptos_to_analyze = list(_tracked_cryptocurrencies())
+    history = {}
     for crypto in cryptos_to_analyze:
-        print(f"--- Iniciando ciclo de análise para {crypto.symbol} ---")
-        
-        latest_tech_analyses = list(TechnicalAnalysis.objects.filter(cryptocurrency=crypto).order_by('-timestamp')[:3])
+        latest_tech_analyses = list(TechnicalAnalysis.objects.filter(cryptocurrency=crypto, timeframe='1d').order_by('-timestamp')[:3])
         latest_sentiments = list(MarketSentiment.objects.filter(cryptocurrency=crypto).order_by('-timestamp')[:3])
         
         if len(latest_tech_analyses) < 3 or len(latest_sentiments) < 3:
             print(f"Dados históricos insuficientes para {crypto.symbol}. Pulando análise.")
             continue
+        history[crypto.pk] = (latest_tech_analyses, latest_sentiments)
 
-        for profile in active_profiles:
-            current_holding = Holding.objects.filter(user_profile=profile, cryptocurrency=crypto).first()
-            
-            print(f"Analisando {crypto.symbol} para o usuário {profile.user.username}...")
-            get_gemini_trade_decision(
-                profile, crypto, latest_tech_analyses, latest_sentiments, current_holding
-            )
-            time.sleep(2)
+    cryptos = [crypto for crypto in cryptos_to_analyze if crypto.pk in history]
+    if not cryptos: return "Nenhuma moeda com dados históricos suficientes."
+    holdings = {(h.user_profile_id, h.cryptocurrency_id): h for h in Holding.objects.filter(cryptocurrency__in=cryptos, user_profile__in=active_profiles)}
+    jobs = [(group, history) for group in group_profiles(active_profiles, cryptos, holdings)]
+
+    print(f"--- Iniciando ciclo de decisão: {len(jobs)} chamada(s) para {len(cryptos)} moeda(s) e {len(active_profiles)} usuário(s) ---")
+    decisions, late = _decide_concurrently(jobs, getattr(settings, 'GEMINI_CYCLE_DEADLINE_SECONDS', 600))
+    signals = TradingSignal.objects.bulk_create([
+        build_trading_signal(profile, crypto, decisions_by_symbol[crypto.symbol])
+        for (group, _), decisions_by_symbol in decisions for crypto in group.cryptos if crypto.symbol in decisions_by_symbol
+        for profile in group.members
+    ])
+    if late: print(f"{late} chamada(s) canceladas por estourar o prazo do ciclo.")
 
-    return f"Ciclo de decisão concluído para {cryptos_to_analyze.count()} moeda(s) e {active_profiles.count()} usuário(s)."
+    return f"Ciclo de decisão concluído para {len(cryptos_to_analyze)} moeda(s) e {len(active_profiles)} usuário(s): {len(decisions)} chamada(s), {len(signals)} sinal(is), {late} cancelado(s)."
 
 @shared_task(name="trading_agent.tasks.process_unexecuted_signals")
 def process_unexecuted_signals():
@@ -140,13 +213,13 @@ def reflect_on_performance():
                 trades_by_crypto[trade.cryptocurrency.symbol] = []
             trades_by_crypto[trade.cryptocurrency.symbol].append(trade)
 
+        quotes = PriceCache().get_many(trades[0].cryptocurrency for trades in trades_by_crypto.values())
         performance_data, total_pl, win_count = [], Decimal('0.0'), 0
         for symbol, trades in trades_by_crypto.items():
-            crypto = trades[0].cryptocurrency
             buy_cost = sum(t.total_value for t in trades if t.transaction_type == 'BUY')
             sell_revenue = sum(t.total_value for t in trades if t.transaction_type == 'SELL')
             net_cash_flow = sell_revenue - buy_cost
-            current_price = crypto.current_price or Decimal('0')
+            current_price = quotes[symbol].price or Decimal('0')
             buy_qty = sum(t.quantity_crypto for t in trades if t.transaction_type == 'BUY')
             sell_qty = sum(t.quantity_crypto for t in trades if t.transaction_type == 'SELL')
             net_asset_change_qty = buy_qty - sell_qty
@@ -167,72 +240,107 @@ def reflect_on_performance():
         time.sleep(10)
     return "Ciclo de reflexão de performance concluído."
 
+def _buy_and_hold_percent(initial_capital, initial_price, final_price):
+    if initial_price <= 0 or initial_capital <= 0:
+        return Decimal('0.0')
+    buy_and_hold_value = (initial_capital / initial_price) * final_price
+    return ((buy_and_hold_value - initial_capital) / initial_capital) * 100
+
+def _single_backtest_klines(crypto, start_date, sync=True):
+    """
+    Candles diários fechados da simulação única. O início é arredondado para a próxima abertura diária
+    (as barras são as mesmas), para que pedidos do mesmo dia tenham a mesma chave no cache de resultados.
+    """
+    step = interval_to_milliseconds(Client.KLINE_INTERVAL_1DAY)
+    start_ms = -(-date_to_milliseconds(start_date) // step) * step
+    pair = f"{crypto.symbol}{crypto.price_currency}"
+    if sync:
+        klines = KlineStore().fetch(pair, Client.KLINE_INTERVAL_1DAY, start_ms)
+    else:
+        klines = KlineStore.stored(pair, Client.KLINE_INTERVAL_1DAY, start_ms)
+    now_ms = int(timezone.now().timestamp() * 1000)
+    return start_ms, [k for k in klines if k[6] < now_ms]
+
+def _single_backtest_key(report, start_ms, klines):
+    profile = report.user_profile
+    return result_key(report.symbol, start_ms, report.initial_capital, profile.agent_buy_risk_percentage,
+                      profile.agent_sell_risk_percentage, data_fingerprint(klines))
+
+def fill_from_result_cache(report):
+    """
+    Conclui na hora uma simulação única idêntica a uma já calculada, usando só os candles do banco.
+    Só vale se o banco já tiver a última barra fechada; caso contrário a tarefa sincroniza e calcula.
+    Retorna True se o relatório foi preenchido e salvo.
+    """
+    crypto = Cryptocurrency.objects.filter(symbol=report.symbol).first()
+    if crypto is None:
+        return False
+    start_ms, klines = _single_backtest_klines(crypto, report.start_date, sync=False)
+    step = interval_to_milliseconds(Client.KLINE_INTERVAL_1DAY)
+    last_closed_open_ms = (int(timezone.now().timestamp() * 1000) // step - 1) * step
+    if not klines or klines[-1][0] < last_closed_open_ms:
+        return False
+    entry = BacktestResultCache().get(_single_backtest_key(report, start_ms, klines))
+    if entry is None:
+        return False
+    BacktestResultCache.apply(entry, report).save()
+    return True
+
+def _simulate_single(report, klines):
+    """Simulação determinística de uma série: preenche resultados, parâmetros e artefato de `report` (sem salvar)."""
+    user_profile = report.user_profile
+    if not klines or len(klines) < WARMUP_BARS:
+         raise ValueError(f"Dados históricos insuficientes para o backtest. Necessário no mínimo {WARMUP_BARS} dias de dados, mas foram obtidos {len(klines) if klines else 0}.")
+
+    df = klines_to_frame(klines)
+    close = df['close'].to_numpy()
+    if len(close) <= WARMUP_BARS:
+         raise ValueError(f"Dados históricos insuficientes após o período de warm-up dos indicadores.")
+
+    # A simulação é vetorizada (milissegundos mesmo para anos de candles): um único avanço ao final basta.
+    progress = BacktestProgress(report.id)
+    progress.start(len(close), 'barras')
+    result = run_strategy(
+        close, float(report.initial_capital),
+        float(user_profile.agent_buy_risk_percentage) / 100, float(user_profile.agent_sell_risk_percentage) / 100,
+        with_equity=True,
+    )
+    progress.advance(len(close), equity=result.final_value)
+    save_artifact(report, df['time'].to_numpy(), result.equity, result.holdings > 0,
+                  [(i, 0, side, price, quantity, pnl) for i, side, price, quantity, pnl in result.trades])
+    final_price = Decimal(str(close[-1]))
+    report.final_value = Decimal(str(round(result.final_value, 2)))
+    
+    if report.initial_capital > 0:
+        report.profit_loss_percent = ((report.final_value - report.initial_capital) / report.initial_capital) * 100
+    else:
+        report.profit_loss_percent = Decimal('0.0')
+
+    report.buy_and_hold_profit_loss_percent = _buy_and_hold_percent(report.initial_capital, Decimal(str(close[0])), final_price)
+    report.parameters = {
+        'buy_risk_percentage': float(user_profile.agent_buy_risk_percentage), 'sell_risk_percentage': float(user_profile.agent_sell_risk_percentage),
+        'rsi_upper': 70, 'rsi_lower': 30, 'macd': [12, 26, 9],
+    }
+    report.total_trades = result.total_trades
+    return result, close
+
 @shared_task(name="trading_agent.tasks.run_backtest_task")
 def run_backtest_task(report_id):
     report = get_object_or_404(BacktestReport, id=report_id)
     try:
         report.status = 'RUNNING'; report.save()
-        user_profile, crypto = report.user_profile, Cryptocurrency.objects.get(symbol=report.symbol)
+        crypto = Cryptocurrency.objects.get(symbol=report.symbol)
 
-        client = Client()
-        klines = client.get_historical_klines(f"{crypto.symbol}{crypto.price_currency}", Client.KLINE_INTERVAL_1DAY, report.start_date)
-        
-        REQUIRED_KLINES_FOR_INDICATORS = 35 
-        if not klines or len(klines) < REQUIRED_KLINES_FOR_INDICATORS:
-             raise ValueError(f"Dados históricos insuficientes para o backtest. Necessário no mínimo {REQUIRED_KLINES_FOR_INDICATORS} dias de dados, mas foram obtidos {len(klines) if klines else 0}.")
-
-        df = pd.DataFrame(klines, columns=['time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'])
-        df.set_index(pd.to_datetime(df['time'], unit='ms'), inplace=True)
-        for col in ['open', 'high', 'low', 'close']: df[col] = pd.to_numeric(df[col])
+        start_ms, klines = _single_backtest_klines(crypto, report.start_date)
+        result_cache, cache_key = BacktestResultCache(), _single_backtest_key(report, start_ms, klines)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            BacktestResultCache.apply(cached, report)
+            return f"Backtest {report.id} concluído (cache)."
 
-        cash, crypto_holdings, trades = report.initial_capital, Decimal('0.0'), 0
-        
-        df.ta.rsi(length=14, append=True)
-        df.ta.macd(fast=12, slow=26, signal=9, append=True)
-        
-        df.fillna(0, inplace=True)
-        df['MACD_diff'] = df['MACD_12_26_9'] - df['MACDs_12_26_9']
-        
-        loop_start_index = REQUIRED_KLINES_FOR_INDICATORS
-        if len(df) <= loop_start_index:
-             raise ValueError(f"Dados históricos insuficientes após o período de warm-up dos indicadores.")
-
-        for i in range(loop_start_index, len(df)):
-            current_row = df.iloc[i]
-            previous_row = df.iloc[i-1]
-            current_price = Decimal(current_row['close'])
-
-            buy_condition = (current_row['MACD_diff'] > 0 and previous_row['MACD_diff'] <= 0 and current_row['RSI_14'] < 70)
-            sell_condition = (current_row['MACD_diff'] < 0 and previous_row['MACD_diff'] >= 0 and current_row['RSI_14'] > 30)
-            
-            if buy_condition and cash > 10:
-                buy_amount = cash * (user_profile.agent_buy_risk_percentage / Decimal('100.0'))
-                crypto_bought = buy_amount / current_price
-                crypto_holdings += crypto_bought; cash -= buy_amount; trades += 1
-            elif sell_condition and crypto_holdings > 0:
-                sell_amount = crypto_holdings * (user_profile.agent_sell_risk_percentage / Decimal('100.0'))
-                cash += sell_amount * current_price; crypto_holdings -= sell_amount; trades += 1
-
-        final_price = Decimal(df.iloc[-1]['close'])
-        report.final_value = cash + crypto_holdings * final_price
-        
-        if report.initial_capital > 0:
-            report.profit_loss_percent = ((report.final_value - report.initial_capital) / report.initial_capital) * 100
-        else:
-            report.profit_loss_percent = Decimal('0.0')
-
-        initial_price = Decimal(df.iloc[0]['close'])
-        if initial_price > 0:
-            buy_and_hold_value = (report.initial_capital / initial_price) * final_price
-            if report.initial_capital > 0:
-                report.buy_and_hold_profit_loss_percent = ((buy_and_hold_value - report.initial_capital) / report.initial_capital) * 100
-            else:
-                report.buy_and_hold_profit_loss_percent = Decimal('0.0')
-        else:
-            report.buy_and_hold_profit_loss_percent = Decimal('0.0')
-            
-        report.total_trades = trades
+        _simulate_single(report, klines)
         report.status = 'COMPLETED'
+        result_cache.put(cache_key, report)
     except ValueError as ve: 
         report.status = 'FAILED'; report.error_message = str(ve)
         print(f"ERRO DE VALIDAÇÃO NO BACKTEST {report.id}: {ve}")
@@ -244,3 +352,256 @@ def run_backtest_task(report_id):
         report.save()
 
     return f"Backtest {report.id} concluído."
+
+# --- Monte Carlo (BacktestReport.mode == 'MONTE_CARLO') ---
+
+@shared_task(name="trading_agent.tasks.run_monte_carlo_task")
+def run_monte_carlo_task(report_id):
+    """
+    Roda a simulação única e reamostra o resultado milhares de vezes: os retornos diários da curva de
+    patrimônio (bootstrap em blocos) e a sequência de trades fechados. O relatório guarda os percentis.
+    """
+    report = get_object_or_404(BacktestReport, id=report_id)
+    try:
+        report.status = 'RUNNING'; report.save()
+        crypto = Cryptocurrency.objects.get(symbol=report.symbol)
+        settings_mc = {'paths': int(report.parameters.get('paths', 10_000)), 'block_size': int(report.parameters.get('block_size', 5))}
+        _, klines = _single_backtest_klines(crypto, report.start_date)
+        result, _ = _simulate_single(report, klines)
+
+        initial_capital, paths = float(report.initial_capital), settings_mc['paths']
+        progress = BacktestProgress(report.id)
+        progress.start(2 * paths, 'caminhos')
+        # Retornos a partir da primeira barra em que a estratégia pode operar (antes disso o patrimônio é constante).
+        equity = result.equity[WARMUP_BARS - 1:]
+        final_values, drawdowns = monte_carlo(np.diff(equity) / equity[:-1], initial_capital, paths, settings_mc['block_size'],
+                                              seed=report.id, on_batch=progress.advance)
+        sells = [(i, pnl) for i, side, _, _, pnl in result.trades if side == 'SELL']
+        trades_summary = None
+        if sells:
+            bars, pnl = zip(*sells)
+            trade_values, trade_drawdowns = monte_carlo(trade_returns(result.equity, bars, pnl), initial_capital, paths,
+                                                        seed=report.id, on_batch=progress.advance)
+            trades_summary = distribution_summary(trade_values, trade_drawdowns, initial_capital)
+        else:
+            progress.advance(paths)
+
+        report.results = {
+            **settings_mc, 'closed_trades': len(sells),
+            'returns': distribution_summary(final_values, drawdowns, initial_capital), 'trades': trades_summary,
+        }
+        report.parameters = {**report.parameters, **settings_mc}
+        report.status = 'COMPLETED'
+    except ValueError as ve:
+        report.status = 'FAILED'; report.error_message = str(ve)
+        print(f"ERRO DE VALIDAÇÃO NO BACKTEST {report.id}: {ve}")
+    except Exception as e:
+        report.status = 'FAILED'; report.error_message = str(e)
+        print(f"ERRO INESPERADO NO BACKTEST {report.id}: {e}")
+    finally:
+        report.completed_at = timezone.now()
+        report.save()
+    return f"Monte Carlo {report.id} concluído."
+
+# --- Varredura de parâmetros (BacktestReport.mode == 'SWEEP') ---
+SWEEP_CHUNK_SIZE = 20
+
+@lru_cache(maxsize=4)
+def _report_series(report_id):
+    # Cada processo do worker lê os candles de uma varredura uma única vez e os reutiliza em todos os lotes.
+    report = BacktestReport.objects.get(id=report_id)
+    crypto = Cryptocurrency.objects.get(symbol=report.symbol)
+    klines = KlineStore.stored(f"{crypto.symbol}{crypto.price_currency}", Client.KLINE_INTERVAL_1DAY,
+                               report.parameters['start_ms'], report.parameters.get('end_ms'))
+    df = klines_to_frame(klines)
+    return df['time'].to_numpy(), df['close'].to_numpy()
+
+@lru_cache(maxsize=16)
+def _report_indicators(report_id, macd):
+    return compute_indicators(_report_series(report_id)[1], macd_fast=macd[0], macd_slow=macd[1], macd_signal=macd[2])
+
+def _prepare_distributed_backtest(report):
+    """Sincroniza os candles e fixa o início e o fim da série antes de distribuir as tarefas. Retorna (combinações, nº de barras)."""
+    report.status = 'RUNNING'; report.save()
+    crypto = Cryptocurrency.objects.get(symbol=report.symbol)
+    # Resolve a data relativa ("1 year ago") uma vez, para todas as tarefas usarem a mesma série.
+    start_ms = date_to_milliseconds(report.start_date)
+    klines = KlineStore().fetch(f"{crypto.symbol}{crypto.price_currency}", Client.KLINE_INTERVAL_1DAY, start_ms)
+    # O candle do dia ainda aberto muda a cada sincronização: fica fora, para todos os lotes verem as mesmas barras.
+    now_ms = int(time.time() * 1000)
+    klines = [k for k in klines if k[6] < now_ms]
+    if not klines or len(klines) <= WARMUP_BARS:
+        raise ValueError(f"Dados históricos insuficientes para o backtest. Necessário no mínimo {WARMUP_BARS + 1} dias de dados, mas foram obtidos {len(klines) if klines else 0}.")
+
+    combinations = parameter_grid(report.parameters)
+    if not combinations:
+        raise ValueError("A grade de parâmetros não gerou nenhuma combinação válida.")
+    # Fim fixo: candles gravados depois (novo dia, outra sincronização) não entram em lotes/janelas desta execução.
+    report.parameters['start_ms'], report.parameters['end_ms'] = start_ms, klines[-1][0]
+    report.save()
+    return combinations, len(klines)
+
+def _fail_report(report, error):
+    report.status = 'FAILED'; report.error_message = str(error); report.completed_at = timezone.now()
+    report.save()
+    print(f"ERRO NO BACKTEST {report.id} ({report.mode}): {error}")
+
+@shared_task(name="trading_agent.tasks.run_backtest_sweep_task")
+def run_backtest_sweep_task(report_id):
+    report = get_object_or_404(BacktestReport, id=report_id)
+    try:
+        combinations, _ = _prepare_distributed_backtest(report)
+        report.parameters['combinations_requested'] = len(combinations)
+        report.save()
+        chunks = [combinations[i:i + SWEEP_CHUNK_SIZE] for i in range(0, len(combinations), SWEEP_CHUNK_SIZE)]
+        BacktestProgress(report.id).start(len(combinations), 'combinações')
+        chord(run_sweep_chunk_task.s(report.id, chunk) for chunk in chunks)(finish_backtest_sweep.s(report.id))
+    except Exception as e:
+        _fail_report(report, e)
+    return f"Varredura {report.id} distribuída."
+
+@shared_task(name="trading_agent.tasks.run_sweep_chunk_task")
+def run_sweep_chunk_task(report_id, combinations):
+    try:
+        report = BacktestReport.objects.get(id=report_id)
+        rows = evaluate_combinations(_report_series(report_id)[1], float(report.initial_capital), combinations)
+        # Patrimônio exibido: o melhor resultado deste lote.
+        BacktestProgress(report_id).advance(len(combinations), equity=max((r['final_value'] for r in rows), default=None))
+        return rows
+    except Exception as e:
+        # None marca o lote como perdido: finish_backtest_sweep não ranqueia uma grade incompleta.
+        print(f"ERRO EM LOTE DA VARREDURA {report_id}: {e}")
+        return None
+
+@shared_task(name="trading_agent.tasks.finish_backtest_sweep")
+def finish_backtest_sweep(chunk_results, report_id):
+    report = get_object_or_404(BacktestReport, id=report_id)
+    rows = [row for chunk in chunk_results if chunk is not None for row in chunk]
+    requested = report.parameters.get('combinations_requested', len(rows))
+    report.parameters['combinations_evaluated'] = len(rows)
+    failed_chunks = sum(1 for chunk in chunk_results if chunk is None)
+    if not rows:
+        report.status, report.error_message = 'FAILED', "Nenhuma combinação da varredura foi concluída."
+    elif failed_chunks or len(rows) < requested:
+        report.status = 'FAILED'
+        report.error_message = (f"{failed_chunks} lote(s) da varredura falharam: só {len(rows)} de {requested} combinações "
+                                f"foram avaliadas, e a melhor de uma grade parcial não é confiável.")
+    else:
+        report.results = rank_results(rows)
+        best, close = report.results[0], _report_series(report_id)[1]
+        report.final_value = Decimal(str(best['final_value']))
+        report.profit_loss_percent = Decimal(str(best['profit_loss_percent']))
+        report.total_trades = best['total_trades']
+        report.buy_and_hold_profit_loss_percent = _buy_and_hold_percent(report.initial_capital, Decimal(str(close[0])), Decimal(str(close[-1])))
+        report.status = 'COMPLETED'
+    report.completed_at = timezone.now()
+    report.save()
+    return f"Varredura {report.id} concluída com {len(rows)} de {requested} combinações."
+
+# --- Walk-forward (BacktestReport.mode == 'WALK_FORWARD') ---
+
+@shared_task(name="trading_agent.tasks.run_walk_forward_task")
+def run_walk_forward_task(report_id):
+    report = get_object_or_404(BacktestReport, id=report_id)
+    try:
+        _, n_bars = _prepare_distributed_backtest(report)
+        windows = walk_forward_windows(n_bars, report.parameters['train_bars'], report.parameters['test_bars'])
+        if not windows:
+            raise ValueError(f"Histórico de {n_bars} dias é curto demais para uma janela de treino de {report.parameters['train_bars']} dias.")
+        BacktestProgress(report.id).start(len(windows), 'janelas')
+        chord(run_walk_forward_window_task.s(report.id, *window) for window in windows)(finish_walk_forward.s(report.id))
+    except Exception as e:
+        _fail_report(report, e)
+    return f"Walk-forward {report.id} distribuído."
+
+@shared_task(name="trading_agent.tasks.run_walk_forward_window_task")
+def run_walk_forward_window_task(report_id, train_start, test_start, test_end):
+    try:
+        report = BacktestReport.objects.get(id=report_id)
+        combinations = parameter_grid(report.parameters)
+        # Indicadores calculados uma vez por processo sobre a série inteira; a janela só fatia os arrays.
+        indicators = {tuple(macd): _report_indicators(report_id, tuple(macd)) for macd in {tuple(c['macd']) for c in combinations}}
+        window = evaluate_window(_report_series(report_id)[1], indicators, combinations, float(report.initial_capital), train_start, test_start, test_end)
+        BacktestProgress(report_id).advance(1)
+        return window
+    except Exception as e:
+        print(f"ERRO NA JANELA {test_start}-{test_end} DO WALK-FORWARD {report_id}: {e}")
+        return None
+
+@shared_task(name="trading_agent.tasks.finish_walk_forward")
+def finish_walk_forward(window_results, report_id):
+    report = get_object_or_404(BacktestReport, id=report_id)
+    windows = sorted((w for w in window_results if w), key=lambda w: w['test'][0])
+    if not windows or len(windows) < len(window_results):
+        _fail_report(report, f"{len(window_results) - len(windows)} janela(s) do walk-forward falharam.")
+        return f"Walk-forward {report.id} falhou."
+
+    times, close = _report_series(report_id)
+    initial_capital = float(report.initial_capital)
+    curve = stitch_equity(windows, initial_capital)
+    first_bar, last_bar = windows[0]['test'][0], windows[-1]['test'][1] - 1
+    # As janelas guardam a barra absoluta de cada trade; o artefato começa em first_bar.
+    save_artifact(report, times[first_bar:last_bar + 1], curve, [e for w in windows for e in w['exposed']],
+                  [(i - first_bar, 0, side, price, quantity, pnl) for w in windows for i, side, price, quantity, pnl in w['trades']])
+    report.results = [{k: v for k, v in w.items() if k not in ('equity', 'exposed', 'trades')} for w in windows]
+    report.final_value = Decimal(str(round(curve[-1], 2)))
+    report.profit_loss_percent = (report.final_value - report.initial_capital) / report.initial_capital * 100
+    report.total_trades = sum(w['total_trades'] for w in windows)
+    report.buy_and_hold_profit_loss_percent = _buy_and_hold_percent(report.initial_capital, Decimal(str(close[first_bar])), Decimal(str(close[last_bar])))
+    report.status, report.completed_at = 'COMPLETED', timezone.now()
+    report.save()
+    return f"Walk-forward {report.id} concluído com {len(windows)} janelas."
+
+# --- Portfólio multiativo (BacktestReport.mode == 'PORTFOLIO') ---
+
+@shared_task(name="trading_agent.tasks.run_portfolio_backtest_task")
+def run_portfolio_backtest_task(report_id):
+    report = get_object_or_404(BacktestReport, id=report_id)
+    try:
+        report.status = 'RUNNING'; report.save()
+        user_profile, symbols = report.user_profile, report.parameters.get('symbols')
+        cryptos = Cryptocurrency.objects.filter(symbol__in=symbols) if symbols else Cryptocurrency.objects.all()
+        start_ms, kline_store, series = date_to_milliseconds(report.start_date), KlineStore(), {}
+        progress = BacktestProgress(report.id)
+        progress.start(len(cryptos), 'ativos', "Sincronizando candles")
+        for crypto in cryptos:
+            klines = kline_store.fetch(f"{crypto.symbol}{crypto.price_currency}", Client.KLINE_INTERVAL_1DAY, start_ms)
+            progress.advance(1, message=crypto.symbol)
+            if len(klines) > WARMUP_BARS:
+                series[crypto.symbol] = (np.array([k[0] for k in klines]), np.array([float(k[4]) for k in klines]))
+        if not series:
+            raise ValueError(f"Nenhum ativo tem o mínimo de {WARMUP_BARS + 1} dias de dados no período.")
+
+        times, symbols, close_matrix = align_closes(series)
+        buy, sell = portfolio_signal_masks(close_matrix)
+        result = simulate_portfolio(close_matrix, buy, sell, float(report.initial_capital),
+                                    float(user_profile.agent_buy_risk_percentage) / 100, float(user_profile.agent_sell_risk_percentage) / 100)
+
+        initial_capital = float(report.initial_capital)
+        report.final_value = Decimal(str(round(result.final_value, 2)))
+        report.profit_loss_percent = (report.final_value - report.initial_capital) / report.initial_capital * 100
+        report.total_trades = result.total_trades
+        # Buy & hold de referência: o capital dividido igualmente entre os ativos desde o primeiro candle de cada um.
+        first_prices = np.array([series[s][1][0] for s in symbols])
+        last_prices = np.array([series[s][1][-1] for s in symbols])
+        report.buy_and_hold_profit_loss_percent = Decimal(str(round(float(np.mean(last_prices / first_prices - 1) * 100), 2)))
+        report.results = sorted([
+            {'symbol': symbol, 'profit_loss': round(float(result.profit_loss[i]), 2),
+             'contribution_percent': round(float(result.profit_loss[i]) / initial_capital * 100, 2),
+             'total_trades': int(result.trades_per_asset[i]),
+             'buy_and_hold_percent': round(float(last_prices[i] / first_prices[i] - 1) * 100, 2)}
+            for i, symbol in enumerate(symbols)
+        ], key=lambda row: -row['profit_loss'])
+        save_artifact(report, times, result.equity, result.exposed, result.trades, symbols)
+        report.parameters = {**report.parameters, 'symbols': symbols}
+        report.status = 'COMPLETED'
+    except ValueError as ve:
+        report.status = 'FAILED'; report.error_message = str(ve)
+        print(f"ERRO DE VALIDAÇÃO NO BACKTEST {report.id}: {ve}")
+    except Exception as e:
+        report.status = 'FAILED'; report.error_message = str(e)
+        print(f"ERRO INESPERADO NO BACKTEST {report.id}: {e}")
+    finally:
+        report.completed_at = timezone.now()
+        report.save()
+    return f"Backtest de portfólio {report.id} concluído."
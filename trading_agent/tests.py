@@ -1,3 +1,879 @@
-from django.test import TestCase
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from unittest.mock import patch, MagicMock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+from django.test import TestCase, override_settings
+
+from core.models import Cryptocurrency
+from .indicators import IndicatorEngine
+from .models import TechnicalAnalysis, IndicatorState
+
+
+def _random_walk(count, seed=7):
+    rng, price, rows = random.Random(seed), 100.0, []
+    for _ in range(count):
+        close = max(1.0, price * (1 + rng.uniform(-0.04, 0.04)))
+        high, low = max(price, close) * (1 + rng.uniform(0, 0.02)), min(price, close) * (1 - rng.uniform(0, 0.02))
+        rows.append((high, low, close))
+        price = close
+    return rows
+
+
+def _use_temporary_artifacts_dir(test):
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    settings_override = override_settings(BACKTEST_ARTIFACTS_DIR=directory.name)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    return directory.name
+
+
+class IndicatorEngineTests(TestCase):
+    COLUMNS = {'rsi': 'RSI_14', 'macd_line': 'MACD_12_26_9', 'macd_signal': 'MACDs_12_26_9',
+               'bollinger_high': 'BBU_20_2.0', 'bollinger_low': 'BBL_20_2.0', 'atr': 'ATRr_14'}
+
+    def _pandas_ta(self, bars):
+        df = pd.DataFrame(bars, columns=['high', 'low', 'close'])
+        df.ta.rsi(length=14, append=True); df.ta.macd(fast=12, slow=26, signal=9, append=True)
+        df.ta.bbands(length=20, std=2, append=True); df.ta.atr(length=14, append=True)
+        return df
+
+    def test_matches_pandas_ta_on_every_bar(self):
+        bars = _random_walk(150)
+        expected = self._pandas_ta(bars)
+        engine = IndicatorEngine()
+        for i, bar in enumerate(bars):
+            values = engine.update(*bar)
+            for field, column in self.COLUMNS.items():
+                reference = expected[column].iloc[i]
+                if pd.isna(reference):
+                    self.assertIsNone(values[field], f"{field} na barra {i}")
+                else:
+                    self.assertTrue(math.isclose(values[field], reference, rel_tol=1e-9, abs_tol=1e-9), f"{field} na barra {i}")
+
+    def test_persisted_state_continues_where_it_stopped(self):
+        bars = _random_walk(80)
+        continuous = IndicatorEngine()
+        for bar in bars:
+            expected = continuous.update(*bar)
+
+        engine = IndicatorEngine()
+        for bar in bars[:50]:
+            engine.update(*bar)
+        resumed = IndicatorEngine(json.loads(json.dumps(engine.to_state())))
+        for bar in bars[50:]:
+            values = resumed.update(*bar)
+        self.assertEqual(values, expected)
+
+
+class TechnicalIndicatorsTaskTests(TestCase):
+    DAY_MS = 86_400_000
+
+    def _klines(self, first_open, bars):
+        return [[first_open + i * self.DAY_MS, '0', str(h), str(l), str(c), '1', first_open + (i + 1) * self.DAY_MS - 1]
+                for i, (h, l, c) in enumerate(bars)]
+
+    @patch('trading_agent.tasks.KlineStore')
+    def test_only_new_closed_bars_are_processed(self, mock_store_class):
+        from django.utils import timezone
+        from .tasks import calculate_technical_indicators_for_all_cryptos
+        crypto = Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT')
+        now_ms = int(timezone.now().timestamp() * 1000)
+        today_open = now_ms - now_ms % self.DAY_MS
+        bars = _random_walk(61)
+        # 60 candles fechados + o candle de hoje, ainda aberto.
+        klines = self._klines(today_open - 60 * self.DAY_MS, bars)
+        mock_store_class.return_value.fetch.return_value = klines
+
+        calculate_technical_indicators_for_all_cryptos()
+        state = IndicatorState.objects.get(cryptocurrency=crypto, timeframe='1d')
+        self.assertEqual(state.last_open_time, klines[-2][0])
+        analysis = TechnicalAnalysis.objects.get(cryptocurrency=crypto)
+        engine = IndicatorEngine()
+        for bar in bars[:-1]:
+            expected = engine.update(*bar)
+        self.assertAlmostEqual(float(analysis.rsi), expected['rsi'], places=2)
+
+        # Próxima execução: a busca começa depois do último candle processado.
+        mock_store_class.return_value.fetch.return_value = klines[-1:]
+        calculate_technical_indicators_for_all_cryptos()
+        self.assertEqual(mock_store_class.return_value.fetch.call_args.args[2], klines[-2][0] + 1)
+        self.assertEqual(TechnicalAnalysis.objects.count(), 1)
+
+
+class VectorizedBacktestTests(TestCase):
+    DAY_MS = 86_400_000
+
+    def setUp(self):
+        _use_temporary_artifacts_dir(self)
+
+    def _legacy_trades(self, close, initial_capital, buy_risk, sell_risk):
+        # Laço barra a barra com Decimal, como o run_backtest_task fazia antes do motor vetorizado.
+        from decimal import Decimal
+        df = pd.DataFrame({'close': close})
+        df.ta.rsi(length=14, append=True); df.ta.macd(fast=12, slow=26, signal=9, append=True)
+        df.fillna(0, inplace=True)
+        df['MACD_diff'] = df['MACD_12_26_9'] - df['MACDs_12_26_9']
+        cash, holdings, trades = initial_capital, Decimal('0.0'), []
+        for i in range(35, len(df)):
+            row, previous = df.iloc[i], df.iloc[i - 1]
+            price = Decimal(row['close'])
+            if row['MACD_diff'] > 0 and previous['MACD_diff'] <= 0 and row['RSI_14'] < 70 and cash > 10:
+                amount = cash * (buy_risk / Decimal('100.0'))
+                holdings += amount / price; cash -= amount; trades.append((i, 'BUY'))
+            elif row['MACD_diff'] < 0 and previous['MACD_diff'] >= 0 and row['RSI_14'] > 30 and holdings > 0:
+                amount = holdings * (sell_risk / Decimal('100.0'))
+                cash += amount * price; holdings -= amount; trades.append((i, 'SELL'))
+        return trades, cash + holdings * Decimal(df.iloc[-1]['close'])
+
+    def test_same_trades_as_legacy_daily_loop(self):
+        from decimal import Decimal
+        from .backtest import run_strategy
+        close = [c for _, _, c in _random_walk(500, seed=3)]
+        expected_trades, expected_value = self._legacy_trades(close, Decimal('1000'), Decimal('5'), Decimal('100'))
+
+        result = run_strategy(close, 1000.0, 0.05, 1.0, with_equity=True)
+        self.assertGreater(len(expected_trades), 5)
+        self.assertEqual([(i, side) for i, side, *_ in result.trades], expected_trades)
+        self.assertAlmostEqual(result.final_value, float(expected_value), places=6)
+        self.assertAlmostEqual(result.equity[-1], result.final_value, places=9)
+
+    @patch('trading_agent.tasks.KlineStore')
+    def test_task_fills_report(self, mock_store_class):
+        from django.contrib.auth.models import User
+        from .models import BacktestReport
+        from .tasks import run_backtest_task
+        Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT')
+        user = User.objects.create_user(username='backtester', password='x')
+        report = BacktestReport.objects.create(user_profile=user.profile,
+                                               symbol='BTC', start_date='1 year ago UTC', initial_capital=1000)
+        bars = _random_walk(300, seed=3)
+        mock_store_class.return_value.fetch.return_value = [
+            [i * self.DAY_MS, '0', str(h), str(l), str(c), '1', (i + 1) * self.DAY_MS - 1] for i, (h, l, c) in enumerate(bars)
+        ]
+
+        run_backtest_task(report.id)
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'COMPLETED')
+        self.assertIsNotNone(report.final_value)
+        self.assertGreater(report.total_trades, 0)
+        self.assertEqual(report.artifact, f"backtest_{report.id}.npz")
+        self.assertEqual(set(report.metrics), {'sharpe', 'sortino', 'max_drawdown_percent', 'exposure_percent', 'win_rate_percent'})
+
+
+class BacktestResultCacheTests(TestCase):
+    DAY_MS = 86_400_000
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from django.utils import timezone
+        cache.clear()
+        _use_temporary_artifacts_dir(self)
+        Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT')
+        self.user = User.objects.create_user(username='cached', password='x')
+        today_ms = int(timezone.now().timestamp() * 1000) // self.DAY_MS * self.DAY_MS
+        # 300 barras fechadas até ontem e a barra de hoje, ainda aberta.
+        self.klines = [[today_ms - (300 - i) * self.DAY_MS, '0', str(h), str(l), str(c), '1', today_ms - (299 - i) * self.DAY_MS - 1]
+                       for i, (h, l, c) in enumerate(_random_walk(301, seed=5))]
+
+    def _report(self, **kwargs):
+        from .models import BacktestReport
+        return BacktestReport.objects.create(user_profile=self.user.profile, symbol='BTC', start_date='1 year ago UTC',
+                                             initial_capital=kwargs.get('initial_capital', 1000))
+
+    @patch('trading_agent.tasks.KlineStore')
+    def test_identical_request_is_cloned_until_a_new_bar_arrives(self, mock_store_class):
+        from .backtest import run_strategy
+        from .tasks import run_backtest_task
+        mock_store_class.return_value.fetch.return_value = self.klines
+        with patch('trading_agent.tasks.run_strategy', wraps=run_strategy) as strategy:
+            first, second, other_capital = self._report(), self._report(), self._report(initial_capital=2000)
+            for report in (first, second, other_capital):
+                run_backtest_task(report.id)
+            self.assertEqual(strategy.call_count, 2)
+
+            first.refresh_from_db(); second.refresh_from_db()
+            self.assertEqual(second.status, 'COMPLETED')
+            for field in ('final_value', 'profit_loss_percent', 'total_trades', 'artifact', 'metrics'):
+                self.assertEqual(getattr(second, field), getattr(first, field))
+
+            # O candle aberto de hoje não entra na simulação nem na chave.
+            mock_store_class.return_value.fetch.return_value = self.klines[:-1] + [self.klines[-1][:4] + ['1', '1', self.klines[-1][6]]]
+            run_backtest_task(self._report().id)
+            self.assertEqual(strategy.call_count, 2)
+
+            # Barra nova fechada: a chave muda e a simulação é recalculada.
+            mock_store_class.return_value.fetch.return_value = [k[:6] + [k[0] + 1] for k in self.klines]
+            run_backtest_task(self._report().id)
+            self.assertEqual(strategy.call_count, 3)
+
+    def test_lru_eviction(self):
+        from .result_cache import BacktestResultCache
+        result_cache, report = BacktestResultCache(max_entries=2), self._report()
+        result_cache.put('a', report); result_cache.put('b', report)
+        self.assertIsNotNone(result_cache.get('a'))
+        result_cache.put('c', report)
+        self.assertIsNone(result_cache.get('b'))
+        self.assertIsNotNone(result_cache.get('a'))
+        self.assertIsNotNone(result_cache.get('c'))
+
+    @patch('trading_agent.views.run_backtest_task')
+    @patch('trading_agent.tasks.KlineStore')
+    def test_view_completes_cached_request_without_task(self, mock_store_class, mock_task):
+        from django.urls import reverse
+        from .models import BacktestReport
+        from .tasks import run_backtest_task
+        mock_store_class.return_value.fetch.return_value = self.klines
+        mock_store_class.stored.return_value = self.klines
+        run_backtest_task(self._report().id)
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('trading_agent:backtest'), {'symbol': Cryptocurrency.objects.get().pk, 'start_date': '1 year ago',
+                                                                        'initial_capital': '1000', 'mode': 'SINGLE'})
+        self.assertEqual(response.status_code, 302)
+        mock_task.delay.assert_not_called()
+        self.assertEqual(BacktestReport.objects.filter(status='COMPLETED').count(), 2)
+
+        # Sem a última barra fechada no banco, o pedido vai para a tarefa (que sincroniza os candles).
+        mock_store_class.stored.return_value = self.klines[:-2]
+        self.client.post(reverse('trading_agent:backtest'), {'symbol': Cryptocurrency.objects.get().pk, 'start_date': '1 year ago',
+                                                            'initial_capital': '1000', 'mode': 'SINGLE'})
+        mock_task.delay.assert_called_once()
+
+
+class BacktestProgressTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from .models import BacktestReport
+        cache.clear()
+        self.user = User.objects.create_user(username='progress', password='x')
+        self.report = BacktestReport.objects.create(user_profile=self.user.profile, symbol='BTC', start_date='1 year ago UTC', initial_capital=1000)
+
+    def test_save_publishes_status_and_workers_advance_shared_counter(self):
+        from .progress import BacktestProgress, get_progress
+        event = get_progress(self.report.id)
+        self.assertEqual((event['status'], event['profile_id']), ('PENDING', self.user.profile.id))
+
+        BacktestProgress(self.report.id).start(100, 'combinações')
+        # Dois lotes em workers diferentes somam no mesmo contador.
+        BacktestProgress(self.report.id).advance(20, equity=1100.123)
+        event = BacktestProgress(self.report.id).advance(20)
+        self.assertEqual((event['done'], event['total'], event['equity']), (40, 100, 1100.12))
+        self.assertIsNotNone(event['eta_seconds'])
+
+        self.report.status = 'COMPLETED'; self.report.save()
+        event = get_progress(self.report.id)
+        self.assertEqual((event['status'], event['done'], event['eta_seconds']), ('COMPLETED', 40, None))
+
+    def test_concurrent_advances_never_move_done_backwards(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .progress import BacktestProgress, get_progress
+        BacktestProgress(self.report.id).start(200, 'combinações')
+        seen = []
+
+        def advance(_):
+            seen.append(BacktestProgress(self.report.id).advance(1, equity=1000)['done'])
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(advance, range(200)))
+        self.assertEqual(get_progress(self.report.id)['done'], 200)
+        self.assertEqual(max(seen), 200)
+        # Um avanço atrasado não sobrescreve o status publicado depois dele.
+        self.report.status = 'COMPLETED'; self.report.save()
+        BacktestProgress(self.report.id).advance(0)
+        self.assertEqual((get_progress(self.report.id)['status'], get_progress(self.report.id)['done']), ('COMPLETED', 200))
+
+    def test_long_poll_returns_on_new_event(self):
+        from django.contrib.auth.models import User
+        from django.urls import reverse
+        from .progress import BacktestProgress, get_progress
+        url = reverse('trading_agent:backtest_progress', args=[self.report.id])
+        self.client.force_login(self.user)
+        seq = self.client.get(url).json()['seq']
+        self.assertEqual(seq, get_progress(self.report.id)['seq'])
+
+        # Nada novo: o pedido espera; um evento publicado durante a espera é devolvido.
+        with patch('trading_agent.views.time.sleep', side_effect=lambda _: BacktestProgress(self.report.id).start(10, 'barras')) as sleep:
+            event = self.client.get(url, {'since': seq}).json()
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual((event['status'], event['total']), ('RUNNING', 10))
+
+        with patch('trading_agent.views.PROGRESS_LONG_POLL_SECONDS', 0):
+            self.assertEqual(self.client.get(url, {'since': event['seq']}).json()['seq'], event['seq'])
+
+        # Sem vaga de long polling livre: responde na hora, sem dormir, e pede para repetir depois.
+        from . import views
+        with patch.object(views, '_long_poll_slots', views.threading.BoundedSemaphore(1)) as slots, \
+                patch('trading_agent.views.time.sleep') as sleep:
+            slots.acquire()
+            busy = self.client.get(url, {'since': event['seq']}).json()
+        self.assertEqual(sleep.call_count, 0)
+        self.assertEqual(busy['retry_after'], views.PROGRESS_BUSY_RETRY_SECONDS)
+
+        self.client.force_login(User.objects.create_user(username='intruder', password='x'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class MonteCarloTests(TestCase):
+    DAY_MS = 86_400_000
+
+    def setUp(self):
+        _use_temporary_artifacts_dir(self)
+
+    def test_constant_returns_give_a_single_outcome(self):
+        from .backtest import monte_carlo
+        final_values, drawdowns = monte_carlo([0.01] * 100, 1000.0, n_paths=500, block_size=7, max_cells=1000)
+        self.assertTrue(np.allclose(final_values, 1000 * 1.01 ** 100))
+        self.assertEqual(drawdowns.max(), 0.0)
+
+    def test_paths_resample_the_series_and_chunking_keeps_the_shape(self):
+        from .backtest import distribution_summary, monte_carlo
+        returns = [0.1, -0.5]
+        batches = []
+        final_values, drawdowns = monte_carlo(returns, 100.0, n_paths=2000, seed=7, max_cells=50, on_batch=batches.append)
+        # Andamento publicado a cada lote, somando todos os caminhos.
+        self.assertGreater(len(batches), 2)
+        self.assertEqual(sum(batches), 2000)
+        # Cada caminho é uma combinação de dois sorteios: 121, 55 ou 25.
+        self.assertEqual(set(np.round(final_values, 6)), {121.0, 55.0, 25.0})
+        self.assertEqual(set(np.round(drawdowns, 6)), {0.0, 50.0, 75.0})
+        summary = distribution_summary(final_values, drawdowns, 100.0)
+        self.assertEqual(summary['final_value']['p50'], 55.0)
+        self.assertAlmostEqual(summary['probability_of_loss_percent'], 75, delta=3)
+
+    @patch('trading_agent.tasks.KlineStore')
+    def test_task_reports_percentiles(self, mock_store_class):
+        from django.contrib.auth.models import User
+        from .backtest import run_strategy
+        from .models import BacktestReport
+        from .tasks import run_monte_carlo_task
+        Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT')
+        user = User.objects.create_user(username='montecarlo', password='x')
+        report = BacktestReport.objects.create(user_profile=user.profile, symbol='BTC', start_date='1 year ago UTC', initial_capital=1000,
+                                               mode='MONTE_CARLO', parameters={'paths': 2000, 'block_size': 5})
+        bars = _random_walk(400, seed=3)
+        mock_store_class.return_value.fetch.return_value = [
+            [i * self.DAY_MS, '0', str(h), str(l), str(c), '1', (i + 1) * self.DAY_MS - 1] for i, (h, l, c) in enumerate(bars)
+        ]
+
+        run_monte_carlo_task(report.id)
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'COMPLETED', report.error_message)
+        single = run_strategy([c for _, _, c in bars], 1000.0, 0.05, 1.0)
+        self.assertEqual(float(report.final_value), round(single.final_value, 2))
+        self.assertEqual(report.parameters['paths'], 2000)
+        for method in ('returns', 'trades'):
+            final_value = report.results[method]['final_value']
+            self.assertTrue(final_value['p5'] <= final_value['p50'] <= final_value['p95'])
+        self.assertGreater(report.results['closed_trades'], 0)
+
+
+class BacktestArtifactTests(TestCase):
+    def setUp(self):
+        _use_temporary_artifacts_dir(self)
+
+    def test_metrics(self):
+        from .artifacts import compute_metrics
+        equity = [100, 110, 99, 121, 121]
+        metrics, drawdown = compute_metrics(equity, exposed=[True, True, False, True, False],
+                                            trade_pnl=[0, 5, 0, -2, 3], trade_sides=[1, -1, 1, -1, -1])
+        self.assertEqual(drawdown.tolist(), [0, 0, 10, 0, 0])
+        self.assertEqual(metrics['max_drawdown_percent'], 10.0)
+        self.assertEqual(metrics['exposure_percent'], 60.0)
+        # Só as vendas contam para a taxa de acerto.
+        self.assertAlmostEqual(metrics['win_rate_percent'], 66.67)
+        returns = pd.Series(equity).pct_change().dropna()
+        self.assertAlmostEqual(metrics['sharpe'], returns.mean() / returns.std() * math.sqrt(365), places=3)
+        self.assertIsNone(compute_metrics([100, 100, 100])[0]['sharpe'])
+
+    def test_artifact_round_trip_and_view(self):
+        from django.contrib.auth.models import User
+        from django.urls import reverse
+        from .artifacts import load_artifact, save_artifact
+        from .models import BacktestReport
+        user = User.objects.create_user(username='artifacts', password='x')
+        report = BacktestReport.objects.create(user_profile=user.profile, symbol='BTC', start_date='1 year ago UTC', initial_capital=1000)
+        times = np.arange(3000, dtype=np.int64) * 1000
+        equity = 1000 + np.cumsum(np.random.default_rng(1).normal(0, 5, 3000))
+        save_artifact(report, times, equity, equity > 1000, [(10, 0, 'BUY', 2.0, 5.0, 0.0), (20, 0, 'SELL', 3.0, 5.0, 5.0)])
+        report.save()
+
+        data = load_artifact(report)
+        self.assertTrue(np.array_equal(data['equity'], equity))
+        self.assertEqual(data['trade_side'].tolist(), [1, -1])
+        self.assertEqual(report.metrics['win_rate_percent'], 100.0)
+
+        self.client.force_login(user)
+        payload = self.client.get(reverse('trading_agent:backtest_artifact', args=[report.id])).json()
+        self.assertLessEqual(len(payload['equity']), 2001)
+        self.assertEqual(payload['times'][-1], int(times[-1]))
+        self.assertEqual(payload['trades'][1], {'time': 20000, 'symbol': 'BTC', 'side': 'SELL', 'price': 3.0, 'quantity': 5.0, 'pnl': 5.0})
+        other = User.objects.create_user(username='other', password='x')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('trading_agent:backtest_artifact', args=[report.id])).status_code, 404)
+
+
+class RunBacktestCommandTests(TestCase):
+    HOUR_MS = 3_600_000
+
+    @patch('trading_agent.management.commands.runbacktest.time.sleep')
+    @patch('trading_agent.management.commands.runbacktest.get_gemini_trade_decision')
+    @patch('trading_agent.management.commands.runbacktest.KlineStore')
+    def test_indicators_match_prefix_recomputation(self, mock_store_class, mock_decision, mock_sleep):
+        from io import StringIO
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT')
+        User.objects.create_user(username='backtester', password='x')
+        bars = _random_walk(80, seed=5)
+        mock_store_class.return_value.fetch.return_value = [
+            [i * self.HOUR_MS, '0', str(h), str(l), str(c), '1', (i + 1) * self.HOUR_MS - 1] for i, (h, l, c) in enumerate(bars)
+        ]
+        mock_decision.return_value = {'decision': 'HOLD', 'confidence_score': 0.5}
+
+        call_command('runbacktest', '--interval', '1h', '--cache-mode', 'off', stdout=StringIO())
+        self.assertEqual(mock_store_class.return_value.fetch.call_args.args[1], '1h')
+        self.assertEqual(mock_decision.call_count, len(bars) - 49)
+
+        # Sem lookahead: o RSI da última decisão é o mesmo calculado só com o prefixo até aquela barra.
+        prefix = pd.DataFrame({'close': [c for _, _, c in bars[:60]]})
+        prefix.ta.rsi(length=14, append=True)
+        tech = mock_decision.call_args_list[60 - 50].args[2][0]
+        self.assertAlmostEqual(tech.rsi, prefix['RSI_14'].iloc[-1], places=9)
+
+
+class DecisionCacheTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth.models import User
+        self.crypto = Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT', current_price=100)
+        self.profile = User.objects.create_user(username='backtester', password='x').profile
+        self.profile.gemini_api_key = 'test-key'
+        self.profile.save()
+        self.cache_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        self.addCleanup(os.remove, self.cache_file)
+
+    def _gemini_response(self, decision):
+        response = MagicMock()
+        response.json.return_value = {'candidates': [{'content': {'parts': [{'text': json.dumps(decision)}]}}]}
+        return response
+
+    @patch('core.gemini.gemini_client.session.post')
+    def test_record_then_replay_without_network(self, mock_post):
+        from .decision_cache import DecisionCache
+        from .services import get_gemini_trade_decision
+        decision = {'decision': 'BUY', 'confidence_score': 0.8, 'justification': 'teste'}
+        mock_post.return_value = self._gemini_response(decision)
+        tech = [MagicMock(rsi=40, macd_line=1, macd_signal=0.5, atr=2)]
+        sentiment = [MagicMock(sentiment_score=0.1, summary='neutro')]
+
+        recorder = DecisionCache(self.cache_file, mode='record')
+        self.assertEqual(get_gemini_trade_decision(self.profile, self.crypto, tech, sentiment, None, save_signal=False, decision_cache=recorder), decision)
+        self.assertEqual(get_gemini_trade_decision(self.profile, self.crypto, tech, sentiment, None, save_signal=False, decision_cache=recorder), decision)
+        self.assertEqual(mock_post.call_count, 1)
+        recorder.close()
+
+        mock_post.reset_mock()
+        replay = DecisionCache(self.cache_file, mode='replay')
+        self.assertEqual(get_gemini_trade_decision(self.profile, self.crypto, tech, sentiment, None, save_signal=False, decision_cache=replay), decision)
+        # Um prompt diferente não está no cache: em replay não há chamada de rede.
+        self.crypto.current_price = 101
+        self.assertIsNone(get_gemini_trade_decision(self.profile, self.crypto, tech, sentiment, None, save_signal=False, decision_cache=replay))
+        mock_post.assert_not_called()
+        self.assertEqual((replay.hits, replay.misses), (1, 1))
+
+
+class ParameterSweepTests(TestCase):
+    DAY_MS = 86_400_000
+    GRID = {'buy_risk_percentage': [5.0, 10.0], 'sell_risk_percentage': [100.0], 'rsi_upper': [70.0, 75.0],
+            'rsi_lower': [30.0], 'macd': [[12, 26, 9], [8, 21, 5]]}
+
+    def test_grid_combinations_match_single_runs(self):
+        from .backtest import evaluate_combinations, parameter_grid, rank_results, run_strategy
+        close = [c for _, _, c in _random_walk(400, seed=11)]
+        combinations = parameter_grid(self.GRID)
+        self.assertEqual(len(combinations), 8)
+        ranked = rank_results(evaluate_combinations(close, 1000.0, combinations))
+        self.assertEqual([r['rank'] for r in ranked], list(range(1, 9)))
+        self.assertEqual(ranked, sorted(ranked, key=lambda r: -r['profit_loss_percent']))
+
+        default = next(r for r in ranked if r['buy_risk_percentage'] == 5.0 and r['rsi_upper'] == 70.0 and r['macd'] == [12, 26, 9])
+        single = run_strategy(close, 1000.0, 0.05, 1.0)
+        self.assertEqual(default['total_trades'], single.total_trades)
+        self.assertEqual(default['final_value'], round(single.final_value, 2))
+
+    @patch('trading_agent.tasks.chord')
+    @patch('trading_agent.tasks.KlineStore')
+    def test_sweep_task_fans_out_and_ranks(self, mock_store_class, mock_chord):
+        from django.contrib.auth.models import User
+        from .models import BacktestReport
+        from .tasks import _report_series, finish_backtest_sweep, run_backtest_sweep_task, run_sweep_chunk_task
+        _report_series.cache_clear()
+        Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT')
+        user = User.objects.create_user(username='sweeper', password='x')
+        report = BacktestReport.objects.create(user_profile=user.profile, symbol='BTC', start_date='1 year ago UTC',
+                                               initial_capital=1000, mode='SWEEP', parameters=self.GRID)
+        klines = [[i * self.DAY_MS, '0', str(h), str(l), str(c), '1', (i + 1) * self.DAY_MS - 1] for i, (h, l, c) in enumerate(_random_walk(300, seed=11))]
+        mock_store_class.return_value.fetch.return_value = klines
+        mock_store_class.stored.return_value = klines
+
+        # O candle de hoje, ainda aberto, não entra: a série da varredura termina no último candle fechado.
+        open_candle = [300 * self.DAY_MS, '0', '1', '1', '1', '1', int(time.time() * 1000) + self.DAY_MS]
+        mock_store_class.return_value.fetch.return_value = klines + [open_candle]
+        with patch('trading_agent.tasks.SWEEP_CHUNK_SIZE', 3):
+            run_backtest_sweep_task(report.id)
+        chunks = [signature.args[1] for signature in mock_chord.call_args.args[0]]
+        self.assertEqual([len(c) for c in chunks], [3, 3, 2])
+        report.refresh_from_db()
+        self.assertEqual(report.parameters['end_ms'], 299 * self.DAY_MS)
+
+        chunk_results = [run_sweep_chunk_task(report.id, chunk) for chunk in chunks]
+        finish_backtest_sweep(chunk_results, report.id)
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'COMPLETED')
+        self.assertEqual(len(report.results), 8)
+        self.assertEqual(float(report.profit_loss_percent), report.results[0]['profit_loss_percent'])
+        # Os candles foram lidos do banco uma única vez para todos os lotes, até o fim fixado.
+        self.assertEqual(mock_store_class.stored.call_count, 1)
+        self.assertEqual(mock_store_class.stored.call_args.args[3], 299 * self.DAY_MS)
+        self.assertEqual((report.parameters['combinations_requested'], report.parameters['combinations_evaluated']), (8, 8))
+
+        # Um lote perdido invalida o ranking, em vez de eleger a melhor combinação de uma grade parcial.
+        with patch('trading_agent.tasks.evaluate_combinations', side_effect=MemoryError):
+            chunk_results[1] = run_sweep_chunk_task(report.id, chunks[1])
+        self.assertIsNone(chunk_results[1])
+        finish_backtest_sweep(chunk_results, report.id)
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'FAILED')
+        self.assertIn('só 5 de 8 combinações', report.error_message)
+        self.assertEqual(report.parameters['combinations_evaluated'], 5)
+
+    def test_form_builds_grid(self):
+        from .forms import BacktestForm
+        crypto = Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT')
+        form = BacktestForm({'symbol': crypto.pk, 'start_date': '1 year ago', 'initial_capital': '1000', 'mode': 'SWEEP',
+                             'buy_risk_values': '5, 10', 'sell_risk_values': '100', 'rsi_upper_values': '70',
+                             'rsi_lower_values': '30', 'macd_values': '12/26/9, 8/21/5'})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['grid']['macd'], [[12, 26, 9], [8, 21, 5]])
+        form = BacktestForm({'symbol': crypto.pk, 'start_date': '1 year ago', 'initial_capital': '1000', 'mode': 'SWEEP',
+                             'buy_risk_values': '5', 'sell_risk_values': '100', 'rsi_upper_values': '70',
+                             'rsi_lower_values': '30', 'macd_values': '26/12'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('macd_values', form.errors)
+
+
+class WalkForwardTests(TestCase):
+    DAY_MS = 86_400_000
+    GRID = {'buy_risk_percentage': [5.0, 20.0], 'sell_risk_percentage': [100.0], 'rsi_upper': [70.0],
+            'rsi_lower': [30.0], 'macd': [[12, 26, 9], [8, 21, 5]], 'train_bars': 120, 'test_bars': 40}
+
+    def setUp(self):
+        _use_temporary_artifacts_dir(self)
+
+    def test_windows_roll_forward(self):
+        from .backtest import walk_forward_windows
+        self.assertEqual(walk_forward_windows(250, 120, 40), [(0, 120, 160), (40, 160, 200), (80, 200, 240), (120, 240, 250)])
+
+    def test_out_of_sample_ignores_future_bars(self):
+        from .backtest import compute_indicators, evaluate_window, parameter_grid
+        close = [c for _, _, c in _random_walk(300, seed=21)]
+        combinations = parameter_grid(self.GRID)
+        indicators = {tuple(m): compute_indicators(close, macd_fast=m[0], macd_slow=m[1], macd_signal=m[2]) for m in self.GRID['macd']}
+        window = evaluate_window(close, indicators, combinations, 1000.0, 0, 120, 160)
+
+        # Alterar as barras depois da janela de teste não muda nada nela.
+        future_changed = close[:160] + [c * 3 for c in close[160:]]
+        indicators = {tuple(m): compute_indicators(future_changed, macd_fast=m[0], macd_slow=m[1], macd_signal=m[2]) for m in self.GRID['macd']}
+        self.assertEqual(evaluate_window(future_changed, indicators, combinations, 1000.0, 0, 120, 160), window)
+        self.assertEqual(len(window['equity']), 40)
+
+    @patch('trading_agent.tasks.chord')
+    @patch('trading_agent.tasks.KlineStore')
+    def test_task_stitches_out_of_sample_equity(self, mock_store_class, mock_chord):
+        from django.contrib.auth.models import User
+        from .models import BacktestReport
+        from .tasks import _report_indicators, _report_series, finish_walk_forward, run_walk_forward_task, run_walk_forward_window_task
+        _report_series.cache_clear(); _report_indicators.cache_clear()
+        Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT')
+        user = User.objects.create_user(username='walker', password='x')
+        report = BacktestReport.objects.create(user_profile=user.profile, symbol='BTC', start_date='1 year ago UTC',
+                                               initial_capital=1000, mode='WALK_FORWARD', parameters=self.GRID)
+        klines = [[i * self.DAY_MS, '0', str(h), str(l), str(c), '1', (i + 1) * self.DAY_MS - 1] for i, (h, l, c) in enumerate(_random_walk(250, seed=21))]
+        mock_store_class.return_value.fetch.return_value = klines
+        mock_store_class.stored.return_value = klines
+
+        run_walk_forward_task(report.id)
+        windows = [signature.args[1:] for signature in mock_chord.call_args.args[0]]
+        self.assertEqual(len(windows), 4)
+        window_results = [run_walk_forward_window_task(report.id, *w) for w in reversed(windows)]
+        finish_walk_forward(window_results, report.id)
+
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'COMPLETED')
+        from .artifacts import load_artifact
+        curve = load_artifact(report)
+        self.assertEqual(len(curve['equity']), 130)
+        self.assertEqual(curve['times'][0], 120 * self.DAY_MS)
+        self.assertEqual(float(report.final_value), round(curve['equity'][-1], 2))
+        self.assertEqual(len(curve['exposed']), 130)
+        # O gráfico mostra cada trade na data do candle em que ocorreu (barra absoluta i -> i * DAY_MS).
+        from django.urls import reverse
+        self.client.force_login(user)
+        response = self.client.get(reverse('trading_agent:backtest_artifact', args=[report.id]))
+        self.assertEqual(response.status_code, 200)
+        expected = sorted(bar * self.DAY_MS for w in window_results for bar, *_ in w['trades'])
+        self.assertTrue(expected)
+        self.assertEqual(sorted(t['time'] for t in response.json()['trades']), expected)
+        self.assertEqual(len(expected), report.total_trades)
+        self.assertEqual([w['test'][0] for w in report.results], [120, 160, 200, 240])
+        # Indicadores calculados uma vez por período de MACD, não uma vez por janela.
+        self.assertEqual(_report_indicators.cache_info().misses, 2)
+
+
+class PortfolioBacktestTests(TestCase):
+    DAY_MS = 86_400_000
+
+    def setUp(self):
+        _use_temporary_artifacts_dir(self)
+
+    def test_single_asset_portfolio_matches_single_backtest(self):
+        from .backtest import align_closes, portfolio_signal_masks, run_strategy, simulate_portfolio
+        close = [c for _, _, c in _random_walk(400, seed=31)]
+        times, symbols, matrix = align_closes({'BTC': (list(range(400)), close)})
+        buy, sell = portfolio_signal_masks(matrix)
+        result = simulate_portfolio(matrix, buy, sell, 1000.0, 0.05, 1.0)
+        single = run_strategy(close, 1000.0, 0.05, 1.0, with_equity=True)
+        self.assertEqual(result.total_trades, single.total_trades)
+        self.assertAlmostEqual(result.final_value, single.final_value, places=9)
+        self.assertTrue(((result.equity - single.equity) ** 2).max() < 1e-12)
+
+    def test_assets_are_aligned_and_share_cash(self):
+        from .backtest import align_closes, portfolio_signal_masks, simulate_portfolio
+        btc = [c for _, _, c in _random_walk(300, seed=31)]
+        eth = [c for _, _, c in _random_walk(200, seed=32)]
+        # ETH só começa a ser negociado 100 dias depois.
+        times, symbols, matrix = align_closes({'BTC': (range(300), btc), 'ETH': (range(100, 300), eth)})
+        self.assertEqual(matrix.shape, (300, 2))
+        self.assertTrue(np.isnan(matrix[:100, 1]).all())
+        buy, sell = portfolio_signal_masks(matrix)
+        self.assertFalse(buy[:100 + 35, 1].any())
+
+        result = simulate_portfolio(matrix, buy, sell, 1000.0, 0.5, 1.0)
+        self.assertEqual(result.total_trades, int(result.trades_per_asset.sum()))
+        # P/L total = soma das contribuições de cada ativo.
+        self.assertAlmostEqual(result.final_value - 1000.0, float(result.profit_loss.sum()), places=6)
+
+    @patch('trading_agent.tasks.KlineStore')
+    def test_task_reports_per_asset_contributions(self, mock_store_class):
+        from django.contrib.auth.models import User
+        from .models import BacktestReport
+        from .tasks import run_portfolio_backtest_task
+        for symbol in ('BTC', 'ETH', 'SOL'):
+            Cryptocurrency.objects.create(symbol=symbol, name=symbol, price_currency='USDT')
+        user = User.objects.create_user(username='portfolio', password='x')
+        report = BacktestReport.objects.create(user_profile=user.profile, symbol='PORTFOLIO', start_date='1 year ago UTC',
+                                               initial_capital=1000, mode='PORTFOLIO', parameters={'symbols': []})
+        klines = {pair: [[i * self.DAY_MS, '0', str(h), str(l), str(c), '1', (i + 1) * self.DAY_MS - 1]
+                         for i, (h, l, c) in enumerate(_random_walk(250, seed=seed))]
+                  for seed, pair in enumerate(['BTCUSDT', 'ETHUSDT', 'SOLUSDT'])}
+        mock_store_class.return_value.fetch.side_effect = lambda pair, interval, start: klines[pair]
+
+        run_portfolio_backtest_task(report.id)
+        report.refresh_from_db()
+        self.assertEqual(report.status, 'COMPLETED', report.error_message)
+        self.assertEqual(sorted(r['symbol'] for r in report.results), ['BTC', 'ETH', 'SOL'])
+        self.assertAlmostEqual(sum(r['profit_loss'] for r in report.results), float(report.final_value) - 1000, places=1)
+        from .artifacts import load_artifact
+        curve = load_artifact(report)
+        self.assertEqual(len(curve['equity']), 250)
+        self.assertEqual(sorted(curve['symbols'].tolist()), ['BTC', 'ETH', 'SOL'])
+        from django.urls import reverse
+        self.client.force_login(user)
+        trades = self.client.get(reverse('trading_agent:backtest_artifact', args=[report.id])).json()['trades']
+        self.assertEqual(len(trades), report.total_trades)
+        self.assertTrue(all(0 <= t['time'] < 250 * self.DAY_MS and t['time'] % self.DAY_MS == 0 for t in trades))
+
+
+class TradingCycleTests(TestCase):
+    DECISION = {'symbol': 'BTC', 'decision': 'BUY', 'confidence_score': 0.8, 'justification': 'teste'}
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        cache.clear()
+        self.btc = self._crypto_with_history('BTC', 'Bitcoin')
+        for i in range(4):
+            profile = User.objects.create_user(username=f'trader{i}', password='x').profile
+            profile.gemini_api_key, profile.enable_auto_trading = f'gemini-key-{i}', True
+            # Estratégias distintas: uma chamada por perfil (ver test_identical_contexts_share_one_call).
+            profile.agent_strategy_prompt = f'estratégia {i}'
+            profile.save()
+
+    def _crypto_with_history(self, symbol, name):
+        from django.utils import timezone
+        from datetime import timedelta
+        from .models import MarketSentiment
+        crypto = Cryptocurrency.objects.create(symbol=symbol, name=name, price_currency='USDT', current_price=100)
+        for i in range(3):
+            when = timezone.now() - timedelta(days=i)
+            TechnicalAnalysis.objects.create(cryptocurrency=crypto, timeframe='1d', rsi=50, timestamp=when)
+            MarketSentiment.objects.create(cryptocurrency=crypto, sentiment_score='0.1', summary='ok', timestamp=when)
+        return crypto
+
+    def test_decisions_run_concurrently(self):
+        from .models import TradingSignal
+        from .tasks import run_trading_cycle_for_all_users
+
+        def slow_decision(*args, **kwargs):
+            time.sleep(0.3)
+            return {'BTC': self.DECISION}
+
+        started_at = time.monotonic()
+        with patch('trading_agent.tasks.get_gemini_batch_trade_decisions', side_effect=slow_decision) as mock_decision:
+            result = run_trading_cycle_for_all_users()
+        self.assertLess(time.monotonic() - started_at, 0.9)
+        self.assertEqual(mock_decision.call_count, 4)
+        self.assertEqual(TradingSignal.objects.filter(decision='BUY').count(), 4)
+        self.assertIn('4 chamada(s), 4 sinal(is), 0 cancelado(s)', result)
+
+    @override_settings(GEMINI_CYCLE_DEADLINE_SECONDS=0.5)
+    def test_stragglers_are_cancelled_at_the_deadline(self):
+        from .models import TradingSignal
+        from .tasks import run_trading_cycle_for_all_users
+
+        def decision(profile, *args, **kwargs):
+            if profile.user.username == 'trader0':
+                time.sleep(1.5)
+            return {'BTC': self.DECISION}
+
+        with patch('trading_agent.tasks.get_gemini_batch_trade_decisions', side_effect=decision):
+            result = run_trading_cycle_for_all_users()
+        self.assertIn('3 chamada(s), 3 sinal(is), 1 cancelado(s)', result)
+        self.assertFalse(TradingSignal.objects.filter(user_profile__user__username='trader0').exists())
+
+    def test_identical_contexts_share_one_call(self):
+        from core.models import Holding, UserProfile
+        from .models import TradingSignal
+        from .tasks import run_trading_cycle_for_all_users
+        UserProfile.objects.update(agent_strategy_prompt='')
+        holder = UserProfile.objects.get(user__username='trader3')
+        Holding.objects.create(user_profile=holder, cryptocurrency=self.btc, quantity='0.5', average_buy_price='100')
+
+        with patch('trading_agent.tasks.get_gemini_batch_trade_decisions', return_value={'BTC': self.DECISION}) as mock_decision:
+            result = run_trading_cycle_for_all_users()
+        # trader0..2 (sem posição) dividem uma chamada; trader3 (com posição) tem a sua.
+        self.assertEqual(mock_decision.call_count, 2)
+        self.assertEqual(sorted(c.args[1][0][3] for c in mock_decision.call_args_list), ['0 BTC', 'uma posição aberta em BTC'])
+        self.assertEqual(TradingSignal.objects.count(), 4)
+        self.assertIn('2 chamada(s), 4 sinal(is)', result)
+
+    def test_all_coins_are_decided_in_one_call_per_user(self):
+        from .models import TradingSignal
+        from .tasks import run_trading_cycle_for_all_users
+        self._crypto_with_history('ETH', 'Ethereum')
+        # O modelo respondeu só para o BTC: o ETH fica sem sinal neste ciclo.
+        with patch('trading_agent.tasks.get_gemini_batch_trade_decisions', return_value={'BTC': self.DECISION}) as mock_decision:
+            result = run_trading_cycle_for_all_users()
+        self.assertEqual(mock_decision.call_count, 4)
+        self.assertEqual([context[0].symbol for context in mock_decision.call_args.args[1]], ['BTC', 'ETH'])
+        self.assertEqual(set(TradingSignal.objects.values_list('cryptocurrency', flat=True)), {'BTC'})
+        self.assertIn('4 chamada(s), 4 sinal(is)', result)
+
+    def test_tracked_universe_comes_from_settings(self):
+        from .tasks import run_trading_cycle_for_all_users
+        self._crypto_with_history('ETH', 'Ethereum')
+        self._crypto_with_history('SOL', 'Solana')
+        for symbols, expected in ((['BTC', 'SOL'], ['BTC', 'SOL']), ([], ['BTC', 'ETH', 'SOL'])):
+            with override_settings(TRADING_AGENT_SYMBOLS=symbols), \
+                    patch('trading_agent.tasks.get_gemini_batch_trade_decisions', return_value={}) as mock_decision:
+                run_trading_cycle_for_all_users()
+            self.assertEqual([context[0].symbol for context in mock_decision.call_args.args[1]], expected)
+
+    @patch('core.gemini.gemini_client.session.post')
+    def test_batch_response_is_validated_and_split(self, mock_post):
+        from core.models import UserProfile
+        from .services import get_gemini_batch_trade_decisions
+        eth = Cryptocurrency.objects.create(symbol='ETH', name='Ethereum', price_currency='USDT', current_price=10)
+        items = [
+            {'symbol': 'btc', 'decision': 'SELL', 'confidence_score': 1.7, 'stop_loss_price': 'n/a', 'justification': 'a'},
+            {'symbol': 'BTC', 'decision': 'BUY', 'confidence_score': 0.9, 'justification': 'duplicada'},
+            {'symbol': 'ETH', 'decision': 'COMPRAR', 'confidence_score': 0.9, 'justification': 'inválida'},
+            {'symbol': 'DOGE', 'decision': 'BUY', 'confidence_score': 0.9, 'justification': 'não pedida'},
+        ]
+        mock_post.return_value.json.return_value = {'candidates': [{'content': {'parts': [{'text': json.dumps(items)}]}}]}
+        profile = UserProfile.objects.get(user__username='trader0')
+        tech, sentiment = [MagicMock(rsi=40, macd_line=1, macd_signal=0.5, atr=2)], [MagicMock(sentiment_score=0.1, summary='neutro')]
+
+        decisions = get_gemini_batch_trade_decisions(profile, [(self.btc, tech, sentiment, '0 BTC'), (eth, tech, sentiment, '0 ETH')])
+        self.assertEqual(decisions, {'BTC': {'symbol': 'BTC', 'decision': 'SELL', 'confidence_score': 1.0, 'justification': 'a'}})
+        payload = mock_post.call_args.kwargs['json']
+        self.assertEqual(payload['generationConfig']['responseSchema']['type'], 'ARRAY')
+        self.assertEqual(payload['generationConfig']['responseSchema']['items']['properties']['symbol']['enum'], ['BTC', 'ETH'])
+        self.assertIn('### ETH', payload['contents'][0]['parts'][0]['text'])
+
+    @patch('trading_agent.rate_limit.time.time', return_value=6_000_030.0)
+    def test_token_bucket_is_shared_per_api_key(self, _):
+        from .rate_limit import TokenBucket
+        with override_settings(GEMINI_REQUESTS_PER_MINUTE=2):
+            first, second = TokenBucket.for_api_key('same-key'), TokenBucket.for_api_key('same-key')
+            self.assertEqual(first.try_acquire(), 0)
+            self.assertEqual(second.try_acquire(), 0)
+            self.assertGreater(first.try_acquire(), 0)
+            self.assertFalse(second.acquire(timeout=0))
+            self.assertEqual(TokenBucket.for_api_key('other-key').try_acquire(), 0)
+
+
+class NewsIngestionTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        cache.clear()
+        self.btc = Cryptocurrency.objects.create(symbol='BTC', name='Bitcoin', price_currency='USDT')
+        profile = User.objects.create_user(username='analyst', password='x').profile
+        profile.gemini_api_key = 'gemini-key'
+        profile.save()
+
+    @staticmethod
+    def _article(n, published_at):
+        return {'url': f'https://news.example/{n}', 'title': f'Manchete {n}', 'source': {'name': 'Exemplo'}, 'publishedAt': published_at}
+
+    @patch('trading_agent.tasks.get_gemini_sentiment_analysis', return_value={'sentiment_score': 0.3, 'summary': 'ok'})
+    @patch('trading_agent.tasks.NewsApiClient')
+    def test_only_new_headlines_reach_the_llm(self, mock_newsapi_class, mock_sentiment):
+        from .models import MarketSentiment, NewsArticle, NewsCursor
+        from .tasks import analyze_market_sentiment_for_all_cryptos
+        newsapi = mock_newsapi_class.return_value
+        first_batch = [self._article(2, '2025-01-02T10:00:00Z'), self._article(1, '2025-01-01T10:00:00Z')]
+        newsapi.get_everything.return_value = {'articles': first_batch}
+        analyze_market_sentiment_for_all_cryptos()
+        cursor = NewsCursor.objects.get(cryptocurrency=self.btc)
+        self.assertEqual(cursor.last_url, 'https://news.example/2')
+        self.assertEqual(NewsArticle.objects.count(), 2)
+        self.assertEqual(MarketSentiment.objects.get().articles.count(), 2)
+        self.assertEqual(MarketSentiment.objects.get().raw_news_data, '')
+
+        # A NewsAPI repete a notícia do instante do cursor: nada novo, nenhuma chamada ao Gemini.
+        newsapi.get_everything.return_value = {'articles': first_batch[:1]}
+        result = analyze_market_sentiment_for_all_cryptos()
+        from newsapi.utils import stringify_date_param
+        from_param = newsapi.get_everything.call_args.kwargs['from_param']
+        self.assertEqual(from_param, '2025-01-02T10:00:00')
+        self.assertEqual(stringify_date_param(from_param), from_param)  # formato aceito pela newsapi-python
+        self.assertEqual(mock_sentiment.call_count, 1)
+        self.assertIn('0 analisada(s), 1 sem notícias novas', result)
+
+        newsapi.get_everything.return_value = {'articles': [self._article(3, '2025-01-03T10:00:00Z'), first_batch[0]]}
+        analyze_market_sentiment_for_all_cryptos()
+        self.assertEqual(mock_sentiment.call_count, 2)
+        self.assertEqual(mock_sentiment.call_args.args[2].splitlines(), ['Manchete 3', 'Manchete 2', 'Manchete 1'])
+        self.assertEqual(NewsArticle.objects.count(), 3)
+        self.assertEqual(MarketSentiment.objects.count(), 1)
@@ -9,6 +9,8 @@ urlpatterns = [
     path('reports/', views.agent_reports_view, name='reports'),
     path('backtest/', views.backtest_view, name='backtest'),
     path('backtest-status/<int:report_id>/', views.backtest_status_view, name='backtest_status'),
+    path('backtest-progress/<int:report_id>/', views.backtest_progress_view, name='backtest_progress'),
+    path('backtest-artifact/<int:report_id>/', views.backtest_artifact_view, name='backtest_artifact'),
     
     # (NOVOS) URLs para o Gestor de Estratégia
     path('strategy-manager/', views.strategy_log_view, name='strategy_manager'),
@@ -3,15 +3,21 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.db.models import Count, Q, Sum
+from django.conf import settings
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.http import require_POST
 
 from .models import TradingSignal, BacktestReport, StrategyLog
+from .artifacts import load_artifact
+from .progress import TERMINAL_STATUSES, get_progress
 from .forms import BacktestForm
-from .tasks import run_backtest_task
+from .tasks import fill_from_result_cache, run_backtest_task, run_backtest_sweep_task, run_walk_forward_task, run_portfolio_backtest_task, run_monte_carlo_task
 from core.models import Transaction
 from decimal import Decimal
+import threading
+import time
+import numpy as np
 
 @login_required
 def agent_dashboard_view(request):
@@ -107,13 +113,23 @@ def backtest_view(request):
     form = BacktestForm(request.POST or None)
     if request.method == 'POST':
         if form.is_valid():
+            mode = form.cleaned_data.get('mode') or 'SINGLE'
             report = BacktestReport.objects.create(
                 user_profile=request.user.profile,
-                symbol=form.cleaned_data['symbol'].symbol,
+                symbol='PORTFOLIO' if mode == 'PORTFOLIO' else form.cleaned_data['symbol'].symbol,
                 start_date=form.cleaned_data['start_date'],
-                initial_capital=form.cleaned_data['initial_capital']
+                initial_capital=form.cleaned_data['initial_capital'],
+                mode=mode,
+                parameters=form.cleaned_data.get('grid', {})
             )
-            run_backtest_task.delay(report.id)
+            if mode == 'SINGLE' and fill_from_result_cache(report):
+                messages.success(request, f"Simulação para {report.symbol} concluída a partir de um resultado idêntico já calculado.")
+                return redirect('trading_agent:backtest')
+            {
+                'SINGLE': run_backtest_task, 'SWEEP': run_backtest_sweep_task,
+                'WALK_FORWARD': run_walk_forward_task, 'PORTFOLIO': run_portfolio_backtest_task,
+                'MONTE_CARLO': run_monte_carlo_task,
+            }[mode].delay(report.id)
             messages.success(request, f"Simulação para {report.symbol} iniciada. O relatório aparecerá abaixo quando concluído.")
             return redirect('trading_agent:backtest')
 
@@ -131,6 +147,74 @@ def backtest_status_view(request, report_id):
     return JsonResponse({'status': report.status})
 
 
+PROGRESS_LONG_POLL_SECONDS = 10
+PROGRESS_CHECK_INTERVAL = 0.5
+# Pedidos que podem ficar segurando uma thread do gunicorn ao mesmo tempo, por processo; os demais
+# respondem na hora e o navegador repete após PROGRESS_BUSY_RETRY_SECONDS.
+PROGRESS_MAX_LONG_POLLS = getattr(settings, 'BACKTEST_PROGRESS_MAX_LONG_POLLS', 4)
+PROGRESS_BUSY_RETRY_SECONDS = 3
+_long_poll_slots = threading.BoundedSemaphore(PROGRESS_MAX_LONG_POLLS)
+
+
+@login_required
+def backtest_progress_view(request, report_id):
+    """
+    Long polling do andamento (trading_agent.progress): responde assim que houver um evento com
+    sequência diferente de `?since=`, ou após PROGRESS_LONG_POLL_SECONDS. Só lê o cache (Redis).
+    Sem vaga de long polling livre, devolve o evento atual com `retry_after`.
+    """
+    since = request.GET.get('since')
+    profile_id = request.user.profile.id
+    holding = _long_poll_slots.acquire(blocking=False)
+    try:
+        deadline = time.monotonic() + (PROGRESS_LONG_POLL_SECONDS if holding else 0)
+        while True:
+            event = get_progress(report_id)
+            if event is None:
+                # Sem evento (relatório antigo ou expirado): o banco responde uma única vez.
+                report = get_object_or_404(BacktestReport, id=report_id, user_profile_id=profile_id)
+                return JsonResponse({'status': report.status, 'seq': None})
+            if event.get('profile_id') != profile_id:
+                raise Http404
+            if str(event['seq']) != since or event['status'] in TERMINAL_STATUSES or time.monotonic() >= deadline:
+                if not holding:
+                    event['retry_after'] = PROGRESS_BUSY_RETRY_SECONDS
+                return JsonResponse(event)
+            time.sleep(PROGRESS_CHECK_INTERVAL)
+    finally:
+        if holding:
+            _long_poll_slots.release()
+
+
+ARTIFACT_MAX_POINTS = 2000
+
+
+@login_required
+def backtest_artifact_view(request, report_id):
+    """Curva de patrimônio, drawdown e trades do relatório, lidos do artefato .npz (para o gráfico)."""
+    report = get_object_or_404(BacktestReport, id=report_id, user_profile=request.user.profile)
+    data = load_artifact(report)
+    if data is None:
+        return JsonResponse({'error': 'Artefato não encontrado para este relatório.'}, status=404)
+    # Amostragem simples para o gráfico: a última barra é sempre mantida.
+    step = max(1, -(-len(data['equity']) // ARTIFACT_MAX_POINTS))
+    index = np.unique(np.append(np.arange(0, len(data['equity']), step), len(data['equity']) - 1)) if len(data['equity']) else []
+    symbols = data['symbols'].tolist()
+    return JsonResponse({
+        'times': data['times'][index].tolist(),
+        'equity': np.round(data['equity'][index], 2).tolist(),
+        'drawdown': np.round(data['drawdown'][index], 2).tolist(),
+        'trades': [
+            {'time': int(data['times'][bar]), 'symbol': symbols[asset], 'side': 'BUY' if side > 0 else 'SELL',
+             'price': price, 'quantity': quantity, 'pnl': round(pnl, 2)}
+            for bar, asset, side, price, quantity, pnl in zip(
+                data['trade_bar'].tolist(), data['trade_asset'].tolist(), data['trade_side'].tolist(),
+                data['trade_price'].tolist(), data['trade_quantity'].tolist(), data['trade_pnl'].tolist())
+        ],
+        'metrics': report.metrics,
+    })
+
+
 @login_required
 def strategy_log_view(request):
     """